@@ -0,0 +1,345 @@
+import bisect
+import json
+import os
+import re
+import threading
+import time
+from site_registry import STATE_DIR, get_registry
+from load_tester import LatencyHistogram
+
+ACCESS_LOG_DIR = os.environ.get('AUTO_HOSTING_ACCESS_LOG_DIR', '/var/log/nginx')
+SNAPSHOT_PATH = os.path.join(STATE_DIR, 'access_analytics.json')
+POLL_INTERVAL = int(os.environ.get('AUTO_HOSTING_ACCESS_LOG_INTERVAL', 10))
+# Bytes read from one log per poll, so a burst cannot stall the other sites
+MAX_READ_BYTES = 8 * 1024 * 1024
+# Memory bounds per site: releases kept, routes tracked per release, trend windows
+KEEP_RELEASES = 10
+MAX_ROUTES = 100
+WINDOW_SECONDS = 300
+KEEP_WINDOWS = 24
+OTHER_ROUTE = '(other)'
+
+LOG_FORMAT_NAME = 'auto_hosting_timing'
+# $uri goes last: it is the only field that can contain the separator
+LOG_FORMAT = (f"log_format {LOG_FORMAT_NAME} "
+              "'$msec|$status|$request_time|$upstream_response_time|$body_bytes_sent|$request_method|$uri';")
+LOG_FORMAT_CONF = '/etc/nginx/conf.d/auto-hosting-log-format.conf'
+
+STATIC_EXTENSIONS = {'css', 'js', 'map', 'png', 'jpg', 'jpeg', 'gif', 'ico', 'svg', 'webp', 'woff', 'woff2', 'ttf'}
+ID_SEGMENT = re.compile(r'^(\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{16,}|'
+                        r'(?=.*\d)[A-Za-z0-9_-]{20,})$', re.IGNORECASE)
+
+
+def access_log_path(project_name):
+    """Access log of a site (in the nginx log directory, so the stock logrotate config rotates it)"""
+    return os.path.join(ACCESS_LOG_DIR, f'auto-hosting-{project_name}.access.log')
+
+
+def normalize_route(uri):
+    """Group request paths into routes: ids and hashes become {id}, static files group by extension"""
+    segments = [s for s in uri.split('?')[0].split('/') if s]
+    if segments and '.' in segments[-1]:
+        extension = segments[-1].rsplit('.', 1)[1].lower()
+        if extension in STATIC_EXTENSIONS:
+            return f'static *.{extension}'
+    route = ['{id}' if ID_SEGMENT.match(s) else s[:40] for s in segments[:4]]
+    return '/' + '/'.join(route) + ('/...' if len(segments) > 4 else '')
+
+
+def _seconds(value):
+    """Sum of an nginx time field ("0.012", "0.010, 0.004" for retries, "-" when there was none)"""
+    total, seen = 0.0, False
+    for part in re.split(r'[,:]', value):
+        part = part.strip()
+        if part and part != '-':
+            try:
+                total += float(part)
+                seen = True
+            except ValueError:
+                pass
+    return total if seen else None
+
+
+def parse_line(line):
+    """(timestamp, status, request ms, upstream ms or None, method, uri) or None for foreign lines"""
+    fields = line.rstrip('\n').split('|', 6)
+    if len(fields) != 7:
+        return None
+    try:
+        timestamp, status, request_time = float(fields[0]), int(fields[1]), float(fields[2])
+    except ValueError:
+        return None
+    upstream = _seconds(fields[3])
+    return timestamp, status, request_time * 1000, upstream * 1000 if upstream is not None else None, \
+        fields[5], fields[6]
+
+
+class _Stats:
+    """Latency histogram plus status class counts"""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.latency = LatencyHistogram.from_state(state.get('latency') or {})
+        self.statuses = dict(state.get('statuses') or {})
+
+    def record(self, status, ms):
+        self.latency.record(ms)
+        key = f'{status // 100}xx'
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def state(self):
+        return {'latency': self.latency.state(), 'statuses': self.statuses}
+
+    def summary(self):
+        errors = self.statuses.get('5xx', 0)
+        return {**self.latency.summary(), 'statuses': self.statuses,
+                'error_rate': round(errors / self.latency.total, 4) if self.latency.total else None}
+
+
+class AccessLogAnalytics:
+    """Per-site latency and status analytics streamed from the vhosts' access logs
+
+    A background thread tails each site's log from the offset it stopped
+    at (following logrotate renames), and folds every request into
+    fixed-size histograms per release and per route. Memory is bounded by
+    KEEP_RELEASES, MAX_ROUTES and KEEP_WINDOWS, not by traffic. State is
+    persisted to a snapshot file, so a restart resumes where it stopped
+    and the dashboard has data before the first pass.
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH, interval=POLL_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._running = False
+        self._sites = {}
+        self._offsets = {}
+        self._snapshot = None
+        self._snapshot_mtime = None
+
+    # Persistence
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}, {}
+        sites = {}
+        for port, site in data.get('sites', {}).items():
+            sites[port] = {
+                'project_name': site.get('project_name'),
+                'releases': {release_id: {
+                    'total': _Stats(release.get('total')),
+                    'upstream': LatencyHistogram.from_state(release.get('upstream') or {}),
+                    'routes': {route: _Stats(stats) for route, stats in release.get('routes', {}).items()},
+                    'first_seen': release.get('first_seen'),
+                    'last_seen': release.get('last_seen'),
+                } for release_id, release in site.get('releases', {}).items()},
+                'windows': [{'start': w['start'], 'release_id': w.get('release_id'), 'stats': _Stats(w.get('stats'))}
+                            for w in site.get('windows', [])],
+            }
+        return sites, data.get('offsets', {})
+
+    def _state(self):
+        return {
+            'updated_at': time.time(),
+            'offsets': self._offsets,
+            'sites': {port: {
+                'project_name': site['project_name'],
+                'releases': {release_id: {
+                    'total': release['total'].state(),
+                    'upstream': release['upstream'].state(),
+                    'routes': {route: stats.state() for route, stats in release['routes'].items()},
+                    'first_seen': release['first_seen'],
+                    'last_seen': release['last_seen'],
+                } for release_id, release in site['releases'].items()},
+                'windows': [{'start': w['start'], 'release_id': w['release_id'], 'stats': w['stats'].state()}
+                            for w in site['windows']],
+            } for port, site in self._sites.items()},
+        }
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self._state(), f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Could not persist access log analytics: {e}")
+
+    # Tailing
+
+    def _read_new_lines(self, path):
+        """Complete lines appended to `path` since the last poll (rotated-away tails included)"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return []
+        position = self._offsets.get(path)
+        lines = []
+        if position and position['inode'] != stat.st_ino:
+            # logrotate renamed the file we were reading: finish it before starting the new one
+            try:
+                if os.stat(f'{path}.1').st_ino == position['inode']:
+                    lines, _ = self._read_from(f'{path}.1', position['offset'])
+            except OSError:
+                pass
+            position = None
+        offset = position['offset'] if position else 0
+        if offset > stat.st_size:
+            # Truncated in place (copytruncate)
+            offset = 0
+        new_lines, offset = self._read_from(path, offset)
+        self._offsets[path] = {'inode': stat.st_ino, 'offset': offset}
+        return lines + new_lines
+
+    def _read_from(self, path, offset):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(MAX_READ_BYTES)
+        # A partially written last line is read again next time
+        end = data.rfind(b'\n') + 1
+        return data[:end].decode('utf-8', 'replace').splitlines(), offset + end
+
+    def _site_state(self, port, project_name):
+        site = self._sites.get(port)
+        if site is None or site['project_name'] != project_name:
+            site = self._sites[port] = {'project_name': project_name, 'releases': {}, 'windows': []}
+        return site
+
+    def _record(self, site, release_id, entry):
+        timestamp, status, request_ms, upstream_ms, method, uri = entry
+        release = site['releases'].get(release_id)
+        if release is None:
+            release = site['releases'][release_id] = {'total': _Stats(), 'upstream': LatencyHistogram(),
+                                                      'routes': {}, 'first_seen': timestamp, 'last_seen': timestamp}
+            # Drop the oldest releases (ids grow monotonically)
+            for old in sorted(site['releases'], key=int)[:-KEEP_RELEASES]:
+                del site['releases'][old]
+        release['last_seen'] = max(release['last_seen'], timestamp)
+        release['total'].record(status, request_ms)
+        if upstream_ms is not None:
+            release['upstream'].record(upstream_ms)
+
+        route = f'{method} {normalize_route(uri)}'
+        if route not in release['routes'] and len(release['routes']) >= MAX_ROUTES:
+            route = OTHER_ROUTE
+        release['routes'].setdefault(route, _Stats()).record(status, request_ms)
+
+        start = int(timestamp // WINDOW_SECONDS * WINDOW_SECONDS)
+        windows = site['windows']
+        if not windows or windows[-1]['start'] < start:
+            windows.append({'start': start, 'release_id': release_id, 'stats': _Stats()})
+            del windows[:-KEEP_WINDOWS]
+        window = next((w for w in reversed(windows) if w['start'] == start), None)
+        if window:
+            window['release_id'] = release_id
+            window['stats'].record(status, request_ms)
+
+    def poll(self):
+        """Fold everything appended to the sites' access logs since the last poll"""
+        registry = get_registry()
+        sites = registry.list_sites()
+        with self._lock:
+            for site in sites:
+                lines = self._read_new_lines(access_log_path(site['project_name']))
+                if not lines:
+                    continue
+                state = self._site_state(site['port'], site['project_name'])
+                # A request belongs to the last release that had gone live when it was logged:
+                # a running or failed deploy does not own the traffic served by the previous code
+                live = sorted((finished_at, release_id)
+                              for release_id, finished_at in registry.successful_releases(site['port'],
+                                                                                          limit=KEEP_RELEASES * 2))
+                went_live = [finished_at for finished_at, _ in live]
+                for line in lines:
+                    entry = parse_line(line)
+                    if entry:
+                        index = bisect.bisect_right(went_live, entry[0]) - 1
+                        self._record(state, str(live[index][1]) if index >= 0 else '0', entry)
+
+            registered = {site['port'] for site in sites}
+            for port in [port for port in self._sites if port not in registered]:
+                del self._sites[port]
+            paths = {access_log_path(site['project_name']) for site in sites}
+            for path in [path for path in self._offsets if path not in paths]:
+                del self._offsets[path]
+            self._save()
+
+    def start(self):
+        """Tail the access logs periodically in the background"""
+        with self._lock:
+            self._sites, self._offsets = self._load()
+            self._running = True
+
+        def loop():
+            while True:
+                try:
+                    self.poll()
+                except Exception as e:
+                    print(f"⚠️ Access log analytics pass failed: {e}")
+                time.sleep(self.interval)
+
+        threading.Thread(target=loop, daemon=True, name='access-log-analytics').start()
+
+    # Reporting
+
+    def _snapshot_sites(self):
+        """Persisted state, reloaded when the tailing process has written a newer snapshot"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return {}
+        with self._lock:
+            if mtime != self._snapshot_mtime:
+                self._snapshot, _ = self._load()
+                self._snapshot_mtime = mtime
+            return self._snapshot
+
+    def report(self, port, release_id=None, limit=10):
+        """Slowest routes of a release (default: the latest seen) and p99 trends across releases and time"""
+        if self._running:
+            with self._lock:
+                return self._report(self._sites.get(str(port)), port, release_id, limit)
+        # Other processes serve the snapshot, which is replaced rather than modified
+        return self._report(self._snapshot_sites().get(str(port)), port, release_id, limit)
+
+    def _report(self, site, port, release_id, limit):
+        if not site or not site['releases']:
+            return None
+        releases = sorted(site['releases'], key=int)
+        release_id = str(release_id) if release_id is not None else releases[-1]
+        release = site['releases'].get(release_id)
+        if release is None:
+            return None
+
+        routes = [{'route': route, **stats.summary()} for route, stats in release['routes'].items()]
+        routes.sort(key=lambda r: (r['p99'] or 0, r['count']), reverse=True)
+        return {
+            'port': str(port),
+            'release_id': int(release_id),
+            'summary': {**release['total'].summary(), 'upstream': release['upstream'].summary(),
+                        'first_seen': release['first_seen'], 'last_seen': release['last_seen']},
+            'slowest_routes': routes[:limit],
+            'releases': [{'release_id': int(r), 'first_seen': site['releases'][r]['first_seen'],
+                          'last_seen': site['releases'][r]['last_seen'],
+                          **site['releases'][r]['total'].summary()} for r in releases],
+            'windows': [{'start': w['start'], 'release_id': int(w['release_id']), **w['stats'].summary()}
+                        for w in site['windows']],
+        }
+
+
+_analytics = None
+_analytics_lock = threading.Lock()
+
+
+def get_access_analytics():
+    """Return the process-wide access log analytics"""
+    global _analytics
+    if _analytics is None:
+        with _analytics_lock:
+            if _analytics is None:
+                _analytics = AccessLogAnalytics()
+    return _analytics
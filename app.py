@@ -1,50 +1,347 @@
-from flask import Flask, render_template, request, jsonify
-import os
-from deployment_manager import deploy_laravel_project
-
-app = Flask(__name__)
-app.secret_key = 'your-secret-key-here'
-app.config['UPLOAD_FOLDER'] = '/tmp/auto-hosting'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
-
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-@app.route('/deploy', methods=['POST'])
-def deploy_project():
-    try:
-        git_repo = request.form.get('git_repo')
-        domain = request.form.get('domain', '')
-        port = request.form.get('port', '80')
-        
-        db_file = request.files.get('database_file')
-        env_file = request.files.get('env_file')
-        
-        if not git_repo:
-            return jsonify({'success': False, 'message': 'Git repository URL is required'})
-        
-        # Deploy project using deployment manager
-        result = deploy_laravel_project(git_repo, db_file, env_file, domain, port)
-        
-        # Add DNS instructions to response if domain is used
-        if result.get('success') and result.get('dns_info'):
-            dns_info = result['dns_info']
-            result['message'] += f"\n\n🌐 DNS Setup Required:\n"
-            result['message'] += f"1. Go to your domain registrar ({domain})\n"
-            result['message'] += f"2. Set these DNS records:\n"
-            for record in dns_info['dns_records']:
-                result['message'] += f"   - Type: {record['type']}, Name: {record['name']}, Value: {record['value']}\n"
-            result['message'] += f"3. Or use these nameservers: {', '.join(dns_info['nameservers'])}\n"
-            result['message'] += f"4. Wait 5-30 minutes for DNS propagation\n"
-            result['message'] += f"5. Then access: {result['access_url']}"
-        
-        return jsonify(result)
-        
-    except Exception as e:
-        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
-
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
+import os
+import json
+from site_registry import get_registry
+from control_plane import start_background_services, record_startup, rss_kb
+
+# The deployment pipeline and managers are imported lazily inside the routes
+# so the control plane starts (and restarts) fast
+
+app = Flask(__name__)
+app.secret_key = 'your-secret-key-here'
+app.config['UPLOAD_FOLDER'] = '/tmp/auto-hosting'
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+
+os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+# Periodic jobs (host facts refresh, certificate renewals) run in the background of the worker
+start_background_services()
+
+def _int_arg(name, default=None):
+    """Integer query string argument; raises ValueError when it is not a number"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer, got {value!r}')
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+@app.route('/deploy', methods=['POST'])
+def deploy_project():
+    from deployment_manager import deploy_laravel_project
+    
+    try:
+        git_repo = request.form.get('git_repo')
+        domain = request.form.get('domain', '')
+        port = request.form.get('port', '80')
+        
+        db_file = request.files.get('database_file')
+        env_file = request.files.get('env_file')
+        # A dump sent beforehand through the chunked upload API
+        if not db_file and request.form.get('database_upload'):
+            from upload_store import get_upload_store
+            db_file = get_upload_store().get_file(request.form['database_upload'])
+            if not db_file:
+                return jsonify({'success': False, 'message': 'Database upload not found or not complete'})
+        options = {key: request.form[key] for key in ('redis', 'queue_min_workers', 'queue_max_workers', 'runtime',
+                                                      'replicas', 'backends')
+                   if request.form.get(key)}
+        
+        if not git_repo:
+            return jsonify({'success': False, 'message': 'Git repository URL is required'})
+        
+        # Deploy project using deployment manager
+        result = deploy_laravel_project(git_repo, db_file, env_file, domain, port, options=options)
+        
+        # Add DNS instructions to response if domain is used
+        if result.get('success') and result.get('dns_info'):
+            dns_info = result['dns_info']
+            result['message'] += f"\n\n🌐 DNS Setup Required:\n"
+            result['message'] += f"1. Go to your domain registrar ({domain})\n"
+            result['message'] += f"2. Set these DNS records:\n"
+            for record in dns_info['dns_records']:
+                result['message'] += f"   - Type: {record['type']}, Name: {record['name']}, Value: {record['value']}\n"
+            result['message'] += f"3. Or use these nameservers: {', '.join(dns_info['nameservers'])}\n"
+            result['message'] += f"4. Wait 5-30 minutes for DNS propagation\n"
+            result['message'] += f"5. Then access: {result['access_url']}"
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@app.route('/deploy/bulk', methods=['POST'])
+def deploy_bulk():
+    from bulk_deployer import get_bulk_deployer, store_upload, StoredFile
+    
+    try:
+        # Manifest comes as a JSON body, or as a `manifest` form field when dumps/env files are uploaded
+        if request.is_json:
+            manifest = request.get_json()
+        else:
+            manifest = json.loads(request.form.get('manifest', '{}'))
+        
+        entries = manifest.get('sites', [])
+        deployer = get_bulk_deployer()
+        error = deployer.validate(entries)
+        if error:
+            return jsonify({'success': False, 'message': error}), 400
+        
+        # `dump` / `env` name either an uploaded file field or an absolute path on this server
+        for entry in entries:
+            for key in ('dump', 'env'):
+                ref = entry.get(key)
+                if not ref:
+                    continue
+                if ref in request.files:
+                    entry[key] = store_upload(request.files[ref], app.config['UPLOAD_FOLDER'])
+                elif ref.startswith('upload:'):
+                    from upload_store import get_upload_store
+                    entry[key] = get_upload_store().get_file(ref[len('upload:'):])
+                    if not entry[key]:
+                        return jsonify({'success': False, 'message': f"Port {entry['port']}: {key} upload not complete: {ref}"}), 400
+                elif os.path.isabs(ref) and os.path.isfile(ref):
+                    entry[key] = StoredFile(ref)
+                else:
+                    return jsonify({'success': False, 'message': f"Port {entry['port']}: {key} file not found: {ref}"}), 400
+        
+        batch = deployer.submit(entries, manifest.get('concurrency'))
+        return jsonify({'success': True, 'batch_id': batch.batch_id, 'total': len(entries),
+                        'concurrency': batch.concurrency}), 202
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@app.route('/deploy/bulk/<batch_id>', methods=['GET'])
+def bulk_status(batch_id):
+    from bulk_deployer import get_bulk_deployer
+    
+    batch = get_bulk_deployer().get(batch_id)
+    if not batch:
+        return jsonify({'success': False, 'message': 'Unknown batch'}), 404
+    return jsonify({'success': True, **batch.summary()})
+
+@app.route('/deploy/bulk/<batch_id>/events', methods=['GET'])
+def bulk_events(batch_id):
+    from bulk_deployer import get_bulk_deployer
+    
+    batch = get_bulk_deployer().get(batch_id)
+    if not batch:
+        return jsonify({'success': False, 'message': 'Unknown batch'}), 404
+    
+    try:
+        after = _int_arg('after', 0)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    def stream():
+        seen = after
+        while True:
+            events = batch.wait_for_events(seen)
+            for event in events:
+                yield f"data: {json.dumps(event)}\n\n"
+            seen += len(events)
+            if batch.done and seen >= len(batch.events):
+                break
+            if not events:
+                yield ": keepalive\n\n"
+    
+    return Response(stream_with_context(stream()), mimetype='text/event-stream')
+
+@app.route('/uploads', methods=['POST'])
+def create_upload():
+    from upload_store import get_upload_store, UploadError
+    
+    # {"filename", "size", "chunk_size", "chunk_hashes": [sha256 hex per chunk]}; opening it again resumes
+    body = request.get_json(silent=True) or {}
+    try:
+        upload = get_upload_store().create(body.get('filename'), body.get('size', 0), body.get('chunk_size', 0),
+                                           body.get('chunk_hashes'))
+    except (UploadError, ValueError, TypeError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, **upload})
+
+@app.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def put_upload_chunk(upload_id, index):
+    from upload_store import get_upload_store, UploadError
+    
+    try:
+        return jsonify({'success': True, **get_upload_store().put_chunk(upload_id, index, request.stream)})
+    except UploadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    from upload_store import get_upload_store, UploadError
+    
+    try:
+        upload = get_upload_store().status(upload_id)
+    except UploadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if upload is None:
+        return jsonify({'success': False, 'message': 'Unknown upload'}), 404
+    return jsonify({'success': True, **upload})
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    from upload_store import get_upload_store, UploadError
+    
+    try:
+        return jsonify({'success': True, **get_upload_store().complete(upload_id)})
+    except UploadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+@app.route('/sites', methods=['GET'])
+def list_sites():
+    from site_health import get_site_health
+    
+    # Health comes from the background poller's cache; listing never probes a site
+    sites = get_registry().list_sites(status=request.args.get('status'))
+    health = get_site_health().statuses()
+    for site in sites:
+        site['health'] = health.get(site['port'])
+    if request.args.get('health'):
+        sites = [site for site in sites if (site['health'] or {}).get('state', 'unknown') == request.args['health']]
+    return jsonify({'success': True, 'sites': sites})
+
+@app.route('/sites/<port>', methods=['GET'])
+def get_site(port):
+    from lock_manager import get_deploy_coordinator
+    from cert_manager import get_cert_provisioner
+    
+    registry = get_registry()
+    site = registry.get_site(port)
+    if not site:
+        return jsonify({'success': False, 'message': f'No site registered on port {port}'}), 404
+    
+    try:
+        site['releases'] = registry.list_releases(port, limit=_int_arg('releases', 10))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    site['deploy_in_flight'] = get_deploy_coordinator().in_flight().get(str(port))
+    site['certificate'] = get_cert_provisioner().status([site['domain']]) if site['domain'] else None
+    return jsonify({'success': True, 'site': site})
+
+@app.route('/sites/<port>/releases/<int:release_id>/logs', methods=['GET'])
+def release_logs(port, release_id):
+    from deploy_log import read_log
+    
+    release = get_registry().get_release(release_id)
+    if not release or release['port'] != str(port):
+        return jsonify({'success': False, 'message': 'Unknown release'}), 404
+    
+    # ?tail=N for the last N lines, or ?start=&limit= to page through (use `next` to follow)
+    try:
+        start, limit, tail = _int_arg('start', 0), _int_arg('limit', 200), _int_arg('tail')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    log = read_log(port, release_id, start=start, limit=limit, tail=tail)
+    if log is None:
+        return jsonify({'success': False, 'message': 'No log stored for this release'}), 404
+    return jsonify({'success': True, 'release_id': release_id, 'status': release['status'], **log})
+
+@app.route('/sites/<port>/health', methods=['GET'])
+def site_health(port):
+    from site_health import get_site_health
+    
+    health = get_site_health().site(port)
+    if health is None:
+        return jsonify({'success': False, 'message': 'This site has not been checked yet'}), 404
+    return jsonify({'success': True, 'health': health})
+
+@app.route('/sites/<port>/analytics', methods=['GET'])
+def site_analytics(port):
+    from access_analytics import get_access_analytics
+    
+    # ?release=<id> for a given release (default: the latest one with traffic), ?limit= slowest routes
+    try:
+        release_id, limit = _int_arg('release'), _int_arg('limit', 10)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    report = get_access_analytics().report(port, release_id=release_id, limit=limit)
+    if report is None:
+        return jsonify({'success': False, 'message': 'No traffic recorded for this site yet'}), 404
+    return jsonify({'success': True, 'analytics': report})
+
+@app.route('/sites/<port>/retry', methods=['POST'])
+def retry_site(port):
+    from deployment_manager import retry_deployment
+    
+    try:
+        return jsonify(retry_deployment(port))
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@app.route('/sites/<port>/cleanup', methods=['POST'])
+def cleanup_site_route(port):
+    from deployment_manager import cleanup_site
+    
+    try:
+        result = cleanup_site(port)
+        return jsonify(result), (200 if result['success'] else 404)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@app.route('/sites/<port>/loadtests', methods=['POST'])
+def start_load_test(port):
+    from load_tester import get_load_tester
+    
+    try:
+        if not get_registry().get_site(port):
+            return jsonify({'success': False, 'message': f'No site registered on port {port}'}), 404
+        
+        params = request.get_json(silent=True) or {}
+        test_id = get_load_tester().start(port, duration=params.get('duration', 30),
+                                          concurrency=params.get('concurrency', 10),
+                                          urls=params.get('urls'), host=params.get('host'),
+                                          label=params.get('label'))
+        return jsonify({'success': True, 'load_test_id': test_id}), 202
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+
+@app.route('/sites/<port>/loadtests', methods=['GET'])
+def list_load_tests(port):
+    try:
+        limit = _int_arg('limit', 20)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    tests = get_registry().list_load_tests(port, limit=limit)
+    return jsonify({'success': True, 'load_tests': tests})
+
+@app.route('/loadtests/<int:test_id>', methods=['GET'])
+def get_load_test(test_id):
+    test = get_registry().get_load_test(test_id)
+    if not test:
+        return jsonify({'success': False, 'message': 'Unknown load test'}), 404
+    return jsonify({'success': True, 'load_test': test})
+
+@app.route('/host', methods=['GET'])
+def host_info():
+    from host_facts import get_host_facts
+    
+    return jsonify({'success': True, 'host': get_host_facts().snapshot()})
+
+@app.route('/status', methods=['GET'])
+def control_plane_status():
+    from standby_pool import get_standby_pool
+    try:
+        limit = _int_arg('limit', 20)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'pid': os.getpid(), 'rss_kb': rss_kb(),
+                    'standby_pool': get_standby_pool().status(),
+                    'startups': get_registry().list_startups(limit=limit)})
+
+if __name__ == '__main__':
+    # Development server; production runs under gunicorn (see gunicorn.conf.py)
+    debug = os.environ.get('AUTO_HOSTING_DEBUG') == '1'
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        record_startup('dev')
+    app.run(host='0.0.0.0', port=5000, debug=debug, threaded=True)
\ No newline at end of file
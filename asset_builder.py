@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from site_registry import CACHE_DIR
+from command_runner import run_command
+
+ASSET_CACHE_DIR = os.path.join(CACHE_DIR, 'assets')
+# Entries under the old 'node_modules' directory were hardlinked into releases (and chowned
+# to www-data with them), so they are never read again
+NODE_MODULES_CACHE = 'node_modules-v2'
+
+LOCKFILES = [
+    ('package-lock.json', ['npm', 'ci', '--no-audit', '--no-fund'], ['npm', 'run']),
+    ('yarn.lock', ['yarn', 'install', '--frozen-lockfile', '--non-interactive'], ['yarn', 'run']),
+    ('pnpm-lock.yaml', ['pnpm', 'install', '--frozen-lockfile'], ['pnpm', 'run']),
+]
+
+BUILD_CONFIGS = ['vite.config.js', 'vite.config.ts', 'vite.config.mjs', 'webpack.mix.js',
+                 'tailwind.config.js', 'postcss.config.js', 'package.json']
+
+
+class AssetBuilder:
+    """Builds front-end assets (Vite/Mix) with node_modules and build output caches
+
+    node_modules is cached per lockfile hash and restored as a copy
+    (copy-on-write where the filesystem supports it); it is removed from the
+    project after the build, so nothing the site's user owns is shared with
+    the cache. The built output is cached per hash of lockfile + build
+    config + resources/, so an unchanged front end is restored without
+    running node at all.
+    """
+
+    def __init__(self, cache_dir=ASSET_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def build(self, project_path):
+        """Build assets for a project, returning a short status string"""
+        try:
+            if not os.path.exists(os.path.join(project_path, 'package.json')):
+                return 'skipped (no package.json)'
+
+            if os.path.exists(os.path.join(project_path, 'public', 'build', 'manifest.json')):
+                print("✓ Front-end assets already committed, skipping build")
+                return 'skipped (prebuilt)'
+
+            lockfile, install_cmd, run_cmd = self._detect_package_manager(project_path)
+            if not shutil.which(install_cmd[0]):
+                print(f"⚠️ {install_cmd[0]} not installed, skipping asset build")
+                return f'skipped ({install_cmd[0]} not installed)'
+
+            started = time.time()
+            lock_hash = self._hash_paths(project_path, [lockfile, 'package.json'])
+            build_hash = self._hash_paths(project_path, [lockfile] + BUILD_CONFIGS + ['resources'])
+
+            # Unchanged front end: restore the previous build output
+            if self._restore_build(project_path, build_hash):
+                print(f"✅ Restored cached asset build in {time.time() - started:.1f}s")
+                return 'cached'
+
+            installed = self._install_node_modules(project_path, lock_hash, install_cmd)
+            try:
+                script = self._build_script(project_path)
+                if not script:
+                    print("⚠️ No build script in package.json, skipping asset build")
+                    return 'skipped (no build script)'
+
+                result = run_command(run_cmd + [script], cwd=project_path,
+                                     echo=False, check=False)
+                if result.returncode != 0:
+                    print(f"⚠️ Asset build failed: {result.stderr[-2000:]}")
+                    return 'failed'
+            finally:
+                # Only the build needs node_modules; the project is handed to www-data afterwards
+                self._remove_node_modules(project_path, lock_hash, installed)
+
+            self._store_build(project_path, build_hash)
+            print(f"✅ Assets built in {time.time() - started:.1f}s")
+            return 'built'
+
+        except Exception as e:
+            print(f"⚠️ Asset build error: {str(e)}")
+            return 'failed'
+
+    def _detect_package_manager(self, project_path):
+        for lockfile, install_cmd, run_cmd in LOCKFILES:
+            if os.path.exists(os.path.join(project_path, lockfile)):
+                return lockfile, install_cmd, run_cmd
+        return None, ['npm', 'install', '--no-audit', '--no-fund'], ['npm', 'run']
+
+    def _build_script(self, project_path):
+        with open(os.path.join(project_path, 'package.json')) as f:
+            scripts = json.load(f).get('scripts', {})
+        for script in ('build', 'production', 'prod'):
+            if script in scripts:
+                return script
+        return None
+
+    def _hash_paths(self, project_path, paths):
+        """Hash the content of files and directory trees relative to the project"""
+        digest = hashlib.sha256()
+        for path in paths:
+            if not path:
+                continue
+            full_path = os.path.join(project_path, path)
+            if os.path.isfile(full_path):
+                self._hash_file_into(digest, project_path, full_path)
+            elif os.path.isdir(full_path):
+                for root, dirs, files in os.walk(full_path):
+                    dirs.sort()
+                    for name in sorted(files):
+                        self._hash_file_into(digest, project_path, os.path.join(root, name))
+        return digest.hexdigest()
+
+    def _hash_file_into(self, digest, project_path, path):
+        digest.update(os.path.relpath(path, project_path).encode('utf-8') + b'\0')
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+    def _copy_tree(self, source, destination):
+        """Copy a directory tree (copy-on-write where the filesystem supports it, never hardlinks)"""
+        result = run_command(['cp', '-a', '--reflink=auto', source, destination], echo=False, check=False)
+        if result.returncode != 0:
+            shutil.rmtree(destination, ignore_errors=True)
+            shutil.copytree(source, destination, symlinks=True)
+
+    def _publish(self, source, cache_path):
+        """Atomically move a tree into the cache"""
+        staging = f'{cache_path}.{uuid.uuid4().hex[:8]}.tmp'
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        try:
+            os.rename(source, staging)
+        except OSError:
+            # Cache and project on different filesystems
+            self._copy_tree(source, staging)
+            shutil.rmtree(source, ignore_errors=True)
+        try:
+            os.rename(staging, cache_path)
+        except OSError:
+            # Another deploy populated the same entry first
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _install_node_modules(self, project_path, lock_hash, install_cmd):
+        node_modules = os.path.join(project_path, 'node_modules')
+        cached = os.path.join(self.cache_dir, NODE_MODULES_CACHE, lock_hash)
+
+        if os.path.isdir(cached):
+            shutil.rmtree(node_modules, ignore_errors=True)
+            self._copy_tree(cached, node_modules)
+            print("✓ Restored node_modules from cache")
+            return False
+
+        print("📦 Installing node dependencies...")
+        run_command(install_cmd, cwd=project_path, echo=False, check=True)
+        return True
+
+    def _remove_node_modules(self, project_path, lock_hash, installed):
+        """Take node_modules out of the project: a fresh install goes into the cache"""
+        node_modules = os.path.join(project_path, 'node_modules')
+        cached = os.path.join(self.cache_dir, NODE_MODULES_CACHE, lock_hash)
+        if installed and not os.path.isdir(cached):
+            self._publish(node_modules, cached)
+        shutil.rmtree(node_modules, ignore_errors=True)
+
+    def _build_outputs(self, project_path):
+        """Relative paths of the build output (Vite: public/build, Mix: mix-manifest entries)"""
+        if os.path.isdir(os.path.join(project_path, 'public', 'build')):
+            return ['public/build']
+
+        manifest = os.path.join(project_path, 'public', 'mix-manifest.json')
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                entries = json.load(f)
+            outputs = {'public/mix-manifest.json'}
+            for asset in entries:
+                outputs.add('public/' + asset.lstrip('/').split('/')[0])
+            return sorted(outputs)
+        return []
+
+    def _store_build(self, project_path, build_hash):
+        outputs = self._build_outputs(project_path)
+        if not outputs:
+            return
+
+        staging = os.path.join(self.cache_dir, 'tmp', uuid.uuid4().hex)
+        for output in outputs:
+            source = os.path.join(project_path, output)
+            target = os.path.join(staging, output)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.isdir(source):
+                shutil.copytree(source, target)
+            else:
+                shutil.copy2(source, target)
+
+        cache_path = os.path.join(self.cache_dir, 'builds', build_hash)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        try:
+            os.rename(staging, cache_path)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _restore_build(self, project_path, build_hash):
+        cached = os.path.join(self.cache_dir, 'builds', build_hash)
+        if not os.path.isdir(cached):
+            return False
+
+        # Copy rather than hardlink: permissions are fixed on the project later
+        result = run_command(['cp', '-a', f'{cached}/.', project_path], echo=False, check=False)
+        return result.returncode == 0
@@ -0,0 +1,186 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.utils import secure_filename
+from stage_limiter import get_stage_limiter
+
+
+class StoredFile:
+    """A file already on disk that looks like an uploaded FileStorage to the managers"""
+
+    def __init__(self, path, filename=None):
+        self.path = path
+        self.filename = filename or os.path.basename(path)
+
+    def save(self, destination):
+        if os.path.abspath(destination) != os.path.abspath(self.path):
+            # Large dumps are linked rather than copied when both sides are on one filesystem
+            if os.path.lexists(destination):
+                os.remove(destination)
+            try:
+                os.link(self.path, destination)
+            except OSError:
+                shutil.copyfile(self.path, destination)
+
+
+class BulkBatch:
+    """State of one bulk deployment: per-site status, timings and a progress event log"""
+
+    def __init__(self, batch_id, entries, concurrency):
+        self.batch_id = batch_id
+        self.concurrency = concurrency
+        self.created_at = time.time()
+        self.finished_at = None
+        self.sites = {
+            str(entry['port']): {
+                'port': str(entry['port']),
+                'git_repo': entry['git_repo'],
+                'domain': entry.get('domain', ''),
+                'status': 'queued',
+                'stage': None,
+                'message': None,
+                'timings': {},
+                'started_at': None,
+                'finished_at': None,
+            } for entry in entries
+        }
+        self.events = []
+        self._condition = threading.Condition()
+
+    def emit(self, port, event, **data):
+        """Append a progress event and wake up streaming readers"""
+        with self._condition:
+            self.events.append({'seq': len(self.events), 'time': time.time(), 'port': port, 'event': event, **data})
+            self._condition.notify_all()
+
+    def wait_for_events(self, after, timeout=15):
+        """Block until there are events newer than `after` or the batch is done"""
+        with self._condition:
+            self._condition.wait_for(lambda: len(self.events) > after or self.done, timeout=timeout)
+            return self.events[after:]
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+    def summary(self):
+        """Aggregate progress and per-site timings"""
+        counts = {}
+        for site in self.sites.values():
+            counts[site['status']] = counts.get(site['status'], 0) + 1
+        end = self.finished_at or time.time()
+        return {
+            'batch_id': self.batch_id,
+            'done': self.done,
+            'concurrency': self.concurrency,
+            'total': len(self.sites),
+            'counts': counts,
+            'elapsed': round(end - self.created_at, 3),
+            'sites': list(self.sites.values()),
+        }
+
+
+class BulkDeployer:
+    """Runs manifests of deployments with a bounded number of concurrent sites"""
+
+    def __init__(self):
+        self.batches = {}
+        self._lock = threading.Lock()
+
+    def validate(self, entries):
+        """Return an error message for an invalid manifest, or None"""
+        if not entries:
+            return 'Manifest has no sites'
+        ports = set()
+        for index, entry in enumerate(entries):
+            if not entry.get('git_repo'):
+                return f'Entry {index}: git_repo is required'
+            port = str(entry.get('port', ''))
+            if not port.isdigit():
+                return f'Entry {index}: invalid port {port!r}'
+            if port in ports:
+                return f'Entry {index}: port {port} appears more than once'
+            ports.add(port)
+        return None
+
+    def submit(self, entries, concurrency=None):
+        """Start a bulk deployment in the background and return its batch"""
+        limit = get_stage_limiter().limits['deploy']
+        concurrency = min(max(1, int(concurrency or limit)), limit)
+
+        batch = BulkBatch(uuid.uuid4().hex[:12], entries, concurrency)
+        with self._lock:
+            self.batches[batch.batch_id] = batch
+
+        thread = threading.Thread(target=self._run_batch, args=(batch, entries), daemon=True)
+        thread.start()
+        return batch
+
+    def get(self, batch_id):
+        with self._lock:
+            return self.batches.get(batch_id)
+
+    def _run_batch(self, batch, entries):
+        with ThreadPoolExecutor(max_workers=batch.concurrency, thread_name_prefix=f'bulk-{batch.batch_id}') as pool:
+            for entry in entries:
+                pool.submit(self._deploy_entry, batch, entry)
+        batch.finished_at = time.time()
+        batch.emit(None, 'batch_finished', summary={k: v for k, v in batch.summary().items() if k != 'sites'})
+        print(f"✅ Bulk deployment {batch.batch_id} finished")
+
+    def _deploy_entry(self, batch, entry):
+        from deployment_manager import deploy_laravel_project
+
+        port = str(entry['port'])
+        site = batch.sites[port]
+
+        def progress(stage, event, seconds=None):
+            site['stage'] = stage
+            if seconds is not None:
+                site['timings'][stage] = seconds
+            batch.emit(port, f'stage_{event}', stage=stage, seconds=seconds)
+
+        site['status'] = 'running'
+        site['started_at'] = time.time()
+        batch.emit(port, 'site_started')
+        try:
+            result = deploy_laravel_project(entry['git_repo'], entry.get('dump'), entry.get('env'),
+                                            entry.get('domain', ''), port, progress=progress,
+                                            options=entry.get('options'))
+        except Exception as e:
+            result = {'success': False, 'message': f'Deployment failed: {str(e)}'}
+
+        site['finished_at'] = time.time()
+        site['status'] = 'success' if result.get('success') else 'failed'
+        site['message'] = result.get('message')
+        site['access_url'] = result.get('access_url')
+        site['release_id'] = result.get('release_id')
+        site['timings']['total'] = round(site['finished_at'] - site['started_at'], 3)
+        batch.emit(port, 'site_finished', status=site['status'], message=site['message'])
+
+
+def store_upload(file_storage, upload_folder):
+    """Persist an uploaded file so it outlives the request that carried it"""
+    if not file_storage or not file_storage.filename:
+        return None
+    filename = secure_filename(file_storage.filename)
+    path = os.path.join(upload_folder, f'{uuid.uuid4().hex[:8]}_{filename}')
+    file_storage.save(path)
+    return StoredFile(path, filename)
+
+
+_deployer = None
+_deployer_lock = threading.Lock()
+
+
+def get_bulk_deployer():
+    """Return the process-wide bulk deployer"""
+    global _deployer
+    if _deployer is None:
+        with _deployer_lock:
+            if _deployer is None:
+                _deployer = BulkDeployer()
+    return _deployer
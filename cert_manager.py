@@ -0,0 +1,188 @@
+import hashlib
+import os
+import queue
+import shutil
+import threading
+import time
+from site_registry import STATE_DIR
+from command_runner import run_command
+
+CERT_DIR = os.path.join(STATE_DIR, 'certs')
+ACME_SERVER = os.environ.get('AUTO_HOSTING_ACME_SERVER', 'https://acme-v02.api.letsencrypt.org/directory')
+ACME_EMAIL = os.environ.get('AUTO_HOSTING_ACME_EMAIL', 'admin@example.com')
+# CA bundle to trust for a local stand-in ACME server (e.g. Pebble)
+ACME_CA_BUNDLE = os.environ.get('AUTO_HOSTING_ACME_CA_BUNDLE')
+
+REUSE_MIN_VALIDITY = 7 * 24 * 3600
+RENEW_INTERVAL = 12 * 3600
+
+
+def cert_name(domains):
+    """Stable certificate name for a set of domains"""
+    domains = sorted(set(domains))
+    digest = hashlib.sha256(','.join(domains).encode('utf-8')).hexdigest()[:10]
+    return f'{domains[0]}-{digest}'
+
+
+class CertificateProvisioner:
+    """Issues certificates in the background and reuses valid ones
+
+    Certificates live in a local certbot store keyed by domain set, so a
+    redeploy of a site whose certificate is still valid never calls certbot.
+    Issuance runs on a single worker thread; renewals for all certificates
+    are done in one `certbot renew` pass followed by one nginx reload.
+    """
+
+    def __init__(self, cert_dir=CERT_DIR, acme_server=ACME_SERVER):
+        self.cert_dir = cert_dir
+        self.acme_server = acme_server
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._status = {}
+        self._lock = threading.Lock()
+        self._worker = None
+        self._last_error = None
+
+    def _certbot_args(self):
+        return ['--config-dir', self.cert_dir,
+                '--work-dir', os.path.join(self.cert_dir, 'work'),
+                '--logs-dir', os.path.join(self.cert_dir, 'logs'),
+                '--server', self.acme_server,
+                '--non-interactive', '--agree-tos', '--email', ACME_EMAIL]
+
+    def _certbot_env(self):
+        env = os.environ.copy()
+        if ACME_CA_BUNDLE:
+            env['REQUESTS_CA_BUNDLE'] = ACME_CA_BUNDLE
+        return env
+
+    def certificate_for(self, domains, min_validity=REUSE_MIN_VALIDITY):
+        """Return (fullchain, privkey) of a stored certificate still valid for min_validity seconds"""
+        live_dir = os.path.join(self.cert_dir, 'live', cert_name(domains))
+        fullchain = os.path.join(live_dir, 'fullchain.pem')
+        privkey = os.path.join(live_dir, 'privkey.pem')
+        if not (os.path.exists(fullchain) and os.path.exists(privkey)):
+            return None
+
+        result = run_command(['openssl', 'x509', '-checkend', str(int(min_validity)), '-noout', '-in', fullchain],
+                             echo=False, check=False)
+        return (fullchain, privkey) if result.returncode == 0 else None
+
+    def request(self, domains, webroot, on_issued=None):
+        """Reuse a valid certificate or queue issuance; never blocks on certbot"""
+        name = cert_name(domains)
+        if self.certificate_for(domains):
+            self._status[name] = {'state': 'valid', 'domains': sorted(domains), 'updated_at': time.time()}
+            return 'reused'
+
+        with self._lock:
+            if name not in self._pending:
+                self._pending.add(name)
+                self._status[name] = {'state': 'pending', 'domains': sorted(domains), 'updated_at': time.time()}
+                self._queue.put((domains, webroot, on_issued))
+        self._ensure_worker()
+        return 'pending'
+
+    def status(self, domains=None):
+        """Issuance state for one domain set, or for all of them"""
+        if domains:
+            return self._status.get(cert_name(domains))
+        return dict(self._status)
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._work, daemon=True, name='cert-provisioner')
+                self._worker.start()
+
+    def _ensure_certbot(self):
+        if shutil.which('certbot'):
+            return True
+        print("📦 Installing certbot...")
+        run_command(['apt', 'install', '-y', 'certbot'], echo=False, check=False)
+        return bool(shutil.which('certbot'))
+
+    def _work(self):
+        while True:
+            domains, webroot, on_issued = self._queue.get()
+            name = cert_name(domains)
+            try:
+                issued = self._issue(domains, webroot)
+                self._status[name] = {'state': 'valid' if issued else 'failed', 'domains': sorted(domains),
+                                      'updated_at': time.time(), 'error': None if issued else self._last_error}
+                if issued and on_issued:
+                    on_issued()
+            except Exception as e:
+                self._status[name] = {'state': 'failed', 'domains': sorted(domains),
+                                      'updated_at': time.time(), 'error': str(e)}
+                print(f"⚠️ Certificate issuance failed for {', '.join(domains)}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(name)
+                self._queue.task_done()
+
+    def _issue(self, domains, webroot):
+        self._last_error = None
+        if not self._ensure_certbot():
+            self._last_error = 'certbot is not installed'
+            return False
+
+        cmd = ['certbot', 'certonly', '--webroot', '-w', webroot, '--cert-name', cert_name(domains),
+               *self._certbot_args()]
+        for domain in domains:
+            cmd += ['-d', domain]
+
+        print(f"🔒 Requesting certificate for {', '.join(domains)}...")
+        result = run_command(cmd, echo=False, check=False, env=self._certbot_env())
+        if result.returncode != 0:
+            self._last_error = result.stderr.strip()[-1000:]
+            print(f"⚠️ Certificate request failed: {self._last_error}")
+            return False
+
+        print(f"✅ Certificate issued for {', '.join(domains)}")
+        return True
+
+    def renew_due(self):
+        """Renew every certificate that is due in one certbot pass, then reload nginx once"""
+        if not os.path.isdir(os.path.join(self.cert_dir, 'live')) or not shutil.which('certbot'):
+            return False
+
+        marker = os.path.join(self.cert_dir, 'renewed')
+        hook = f'touch {marker}'
+        result = run_command(['certbot', 'renew', '--deploy-hook', hook, *self._certbot_args()],
+                             echo=False, check=False, env=self._certbot_env())
+        if result.returncode != 0:
+            print(f"⚠️ Certificate renewal failed: {result.stderr.strip()[-1000:]}")
+
+        if os.path.exists(marker):
+            os.remove(marker)
+            run_command(['systemctl', 'reload', 'nginx'], check=False)
+            print("✅ Renewed certificates and reloaded nginx")
+            return True
+        return False
+
+    def start(self, interval=RENEW_INTERVAL):
+        """Run batched renewals periodically in the background"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.renew_due()
+                except Exception as e:
+                    print(f"⚠️ Renewal pass failed: {e}")
+
+        threading.Thread(target=loop, daemon=True, name='cert-renewal').start()
+
+
+_provisioner = None
+_provisioner_lock = threading.Lock()
+
+
+def get_cert_provisioner():
+    """Return the process-wide certificate provisioner"""
+    global _provisioner
+    if _provisioner is None:
+        with _provisioner_lock:
+            if _provisioner is None:
+                _provisioner = CertificateProvisioner()
+    return _provisioner
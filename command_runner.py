@@ -0,0 +1,235 @@
+import asyncio
+import collections
+import os
+import signal
+import subprocess
+import threading
+import time
+
+# Lines of stdout/stderr kept per command; older output is only seen by the sink
+RING_LINES = 500
+STREAM_LIMIT = 1024 * 1024
+KILL_GRACE_SECONDS = 5
+
+# Per command class: (max concurrent commands, default timeout in seconds)
+COMMAND_CLASSES = {
+    'composer': (max(1, (os.cpu_count() or 2) // 2), 1800),
+    'node': (2, 1800),
+    'mysql': (4, 3600),
+    'git': (4, 600),
+    'artisan': (8, 600),
+    'service': (4, 180),
+    'package': (1, 1800),
+    'default': (16, 600),
+}
+
+PROGRAM_CLASSES = {
+    'composer': 'composer',
+    'npm': 'node', 'yarn': 'node', 'pnpm': 'node',
+    'mysql': 'mysql', 'mysqldump': 'mysql',
+    'git': 'git',
+    'php': 'artisan',
+    'systemctl': 'service', 'nginx': 'service', 'pkill': 'service',
+    'apt': 'package', 'apt-get': 'package',
+}
+
+
+class CommandResult:
+    """Outcome of a command; stdout/stderr hold the tail of the output"""
+
+    def __init__(self, args, returncode, stdout, stderr, duration, timed_out=False):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.duration = duration
+        self.timed_out = timed_out
+
+    def check_returncode(self):
+        if self.returncode != 0:
+            raise subprocess.CalledProcessError(self.returncode, self.args, self.stdout, self.stderr)
+
+
+def classify(args):
+    """Command class of an argument list, from the program name"""
+    return PROGRAM_CLASSES.get(os.path.basename(str(args[0])), 'default')
+
+
+_thread = threading.local()
+
+
+def _echo(line, stream):
+    print(line)
+
+
+def bind_thread_sink(sink):
+    """Also send output of commands started from this thread to `sink`; returns the previous sink"""
+    previous = getattr(_thread, 'sink', None)
+    _thread.sink = sink
+    return previous
+
+
+class CommandRunner:
+    """Runs external commands on a private asyncio loop
+
+    Every command gets a timeout (killing its whole process group), a slot
+    from its command class's concurrency cap, and has stdout/stderr read
+    line by line: lines go to an optional sink as they arrive and only the
+    last RING_LINES are kept in memory.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._semaphores = {}
+        self._lock = threading.Lock()
+        self.default_sink = None
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None or not self._loop.is_running():
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def serve():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                threading.Thread(target=serve, daemon=True, name='command-runner').start()
+                ready.wait()
+                self._loop = loop
+                self._semaphores = {}
+            return self._loop
+
+    def _semaphore(self, command_class):
+        # Only touched from the loop thread
+        if command_class not in self._semaphores:
+            limit = COMMAND_CLASSES.get(command_class, COMMAND_CLASSES['default'])[0]
+            self._semaphores[command_class] = asyncio.Semaphore(limit)
+        return self._semaphores[command_class]
+
+    def submit(self, args, cwd=None, env=None, timeout=None, command_class=None, stdin_path=None,
+               input_text=None, echo=True, sink=None):
+        """Start a command and return a concurrent Future; cancelling it kills the command"""
+        args = [str(arg) for arg in args]
+        command_class = command_class or classify(args)
+        if timeout is None:
+            timeout = COMMAND_CLASSES.get(command_class, COMMAND_CLASSES['default'])[1]
+        # Sinks are resolved here, in the caller's thread; the loop thread only calls them
+        sinks = [s for s in (sink, self.default_sink, getattr(_thread, 'sink', None), _echo if echo else None) if s]
+
+        coroutine = self._run(args, cwd, env, timeout, command_class, stdin_path, input_text, sinks)
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop())
+
+    def run(self, args, check=False, **kwargs):
+        """Run a command to completion (blocking the calling thread only)"""
+        result = self.submit(args, **kwargs).result()
+        if result.timed_out and check:
+            raise subprocess.TimeoutExpired(result.args, result.duration, result.stdout, result.stderr)
+        if check:
+            result.check_returncode()
+        return result
+
+    async def _run(self, args, cwd, env, timeout, command_class, stdin_path, input_text, sinks):
+        async with self._semaphore(command_class):
+            started = time.monotonic()
+            stdin_file = open(stdin_path, 'rb') if stdin_path else None
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *args, cwd=cwd, env=env,
+                    stdin=stdin_file or (asyncio.subprocess.PIPE if input_text is not None else asyncio.subprocess.DEVNULL),
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                    start_new_session=True, limit=STREAM_LIMIT)
+            finally:
+                if stdin_file:
+                    stdin_file.close()
+
+            stdout = collections.deque(maxlen=RING_LINES)
+            stderr = collections.deque(maxlen=RING_LINES)
+            readers = [asyncio.ensure_future(self._pump(process.stdout, stdout, 'stdout', sinks)),
+                       asyncio.ensure_future(self._pump(process.stderr, stderr, 'stderr', sinks))]
+            if input_text is not None:
+                process.stdin.write(input_text.encode('utf-8'))
+                await process.stdin.drain()
+                process.stdin.close()
+
+            timed_out = False
+            try:
+                await asyncio.wait_for(self._exited(process), timeout=timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                print(f"⚠️ Command timed out after {timeout}s: {' '.join(args[:3])}")
+                await self._kill(process)
+            except asyncio.CancelledError:
+                await self._kill(process)
+                raise
+            finally:
+                # A grandchild that inherited the pipes (a daemon, a composer/npm helper) can keep
+                # them open after the command exits: read what is left briefly, then stop reading
+                try:
+                    await asyncio.wait_for(asyncio.gather(*readers, return_exceptions=True), KILL_GRACE_SECONDS)
+                except asyncio.TimeoutError:
+                    print(f"⚠️ Output of {' '.join(args[:3])} still open after exit, no longer reading it")
+                    transport = getattr(process, '_transport', None)
+                    if transport is not None:
+                        transport.close()
+
+            return CommandResult(args, process.returncode, '\n'.join(stdout), '\n'.join(stderr),
+                                 round(time.monotonic() - started, 3), timed_out)
+
+    async def _pump(self, stream, ring, name, sinks):
+        while True:
+            try:
+                line = await stream.readline()
+            except ValueError:
+                # Line longer than STREAM_LIMIT: take it in pieces
+                line = await stream.read(STREAM_LIMIT)
+            if not line:
+                break
+            text = line.decode('utf-8', 'replace').rstrip('\r\n')
+            ring.append(text)
+            for sink in sinks:
+                try:
+                    sink(text, name)
+                except Exception:
+                    pass
+
+    async def _exited(self, process):
+        """Wait for the process itself to exit (Process.wait also waits for its pipes to close)"""
+        delay = 0.005
+        while process.returncode is None:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        return process.returncode
+
+    async def _kill(self, process):
+        """Terminate the command's process group, escalating to SIGKILL"""
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(process.pid, sig)
+            except ProcessLookupError:
+                return
+            try:
+                await asyncio.wait_for(self._exited(process), timeout=KILL_GRACE_SECONDS)
+                return
+            except asyncio.TimeoutError:
+                continue
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_command_runner():
+    """Return the process-wide command runner"""
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = CommandRunner()
+    return _runner
+
+
+def run_command(args, **kwargs):
+    """Run a command through the shared runner (see CommandRunner.submit for options)"""
+    return get_command_runner().run(args, **kwargs)
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from site_registry import CACHE_DIR
+from command_runner import run_command
+
+LOCK_CACHE_DIR = os.path.join(CACHE_DIR, 'composer-locks')
+
+# Strategies from cheapest to most invasive; a failed one falls through to the next
+STRATEGIES = ('install', 'update', 'compat', 'manual')
+
+_platform = None
+_platform_lock = threading.Lock()
+
+
+def _version_tuple(text):
+    numbers = re.findall(r'\d+', text.split('-')[0].split('@')[0])
+    return tuple(int(n) for n in numbers[:3]) + (0,) * (3 - len(numbers[:3]))
+
+
+def _atom_allows(version, atom):
+    atom = atom.strip().lstrip('v')
+    if not atom or atom == '*':
+        return True
+    atom = atom.split('@')[0]
+    if not re.search(r'\d', atom):
+        # dev-master and the like: nothing to check against
+        return True
+
+    match = re.match(r'^(>=|<=|!=|>|<|==|=|\^|~)?\s*v?([\d.*x]+)', atom)
+    if not match:
+        return True
+    op, raw = match.group(1) or '', match.group(2)
+    parts = [p for p in raw.split('.') if p]
+
+    if any(p in ('*', 'x') for p in parts):
+        fixed = [int(p) for p in parts[:parts.index('*' if '*' in parts else 'x')]]
+        return list(version[:len(fixed)]) == fixed
+
+    target = _version_tuple(raw)
+    if op == '^':
+        # ^1.2.3 := >=1.2.3 <2.0.0, ^0.3 := >=0.3.0 <0.4.0
+        index = next((i for i, n in enumerate(target) if n), len(parts) - 1)
+        upper = list(target[:index + 1])
+        upper[-1] += 1
+        return target <= version < tuple(upper) + (0,) * (3 - len(upper))
+    if op == '~':
+        # ~1.2 := >=1.2 <2.0, ~1.2.3 := >=1.2.3 <1.3.0
+        keep = max(1, len(parts) - 1)
+        upper = list(target[:keep])
+        upper[-1] += 1
+        return target <= version < tuple(upper) + (0,) * (3 - len(upper))
+    if op == '>=':
+        return version >= target
+    if op == '>':
+        return version > target
+    if op == '<=':
+        return version <= target
+    if op == '<':
+        return version < target
+    if op == '!=':
+        return version != target
+    # Bare or = version: match the components given (8.1 matches 8.1.x)
+    return version[:len(parts)] == target[:len(parts)]
+
+
+def satisfies(version, constraint):
+    """Whether a version string satisfies a composer constraint (^, ~, ranges, wildcards, ||)"""
+    version = _version_tuple(version)
+    for alternative in re.split(r'\s*\|\|?\s*', constraint.strip()):
+        hyphen = re.match(r'^(\S+)\s+-\s+(\S+)$', alternative)
+        if hyphen:
+            upper = hyphen.group(2).split('.')
+            if len(upper) < 3:
+                # A partial upper bound covers its whole range: 1.0 - 2.1 := <2.2
+                upper[-1] = str(int(upper[-1]) + 1)
+                atoms = [f'>={hyphen.group(1)}', f"<{'.'.join(upper)}"]
+            else:
+                atoms = [f'>={hyphen.group(1)}', f'<={hyphen.group(2)}']
+        else:
+            alternative = re.sub(r'(>=|<=|!=|>|<|=|\^|~)\s+', r'\1', alternative)
+            atoms = [a for a in re.split(r'[\s,]+', alternative) if a]
+        if all(_atom_allows(version, atom) for atom in atoms):
+            return True
+    return False
+
+
+def _ext_name(name):
+    return name.lower().replace(' ', '_').replace('-', '_')
+
+
+def detect_platform():
+    """PHP version and loaded extensions of the PHP that runs composer (cached per process)"""
+    global _platform
+    with _platform_lock:
+        if _platform is None:
+            version = run_command(['php', '-r', 'echo PHP_VERSION;'], echo=False, check=True).stdout.strip()
+            modules = run_command(['php', '-m'], echo=False, check=True).stdout.splitlines()
+            extensions = {_ext_name(line.strip()) for line in modules if line.strip() and not line.startswith('[')}
+            _platform = {'php': version, 'extensions': extensions}
+        return _platform
+
+
+def _platform_requirements(requires):
+    """(php constraints, required extensions) from a require map"""
+    php, extensions = [], set()
+    for name, constraint in (requires or {}).items():
+        if name == 'php':
+            php.append(constraint)
+        elif name.startswith('ext-'):
+            extensions.add(_ext_name(name[4:]))
+    return php, extensions
+
+
+class ComposerPreflight:
+    """Picks a composer strategy up front from the platform requirements and the host's PHP
+
+    Locks that had to be re-resolved are cached per (composer.json hash,
+    PHP minor version), so the next deploy of the same project installs
+    the known-good lock without resolving again.
+    """
+
+    def __init__(self, cache_dir=LOCK_CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def _read_json(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def cache_key(self, project_path, php_version):
+        with open(os.path.join(project_path, 'composer.json'), 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        return f"{digest}-php{'.'.join(php_version.split('.')[:2])}"
+
+    def plan(self, project_path):
+        """Return {'strategy', 'reason', 'missing_extensions', 'cache_key', 'cached'}"""
+        platform = detect_platform()
+        php_version = platform['php']
+        composer_json = self._read_json(os.path.join(project_path, 'composer.json')) or {}
+        lock = self._read_json(os.path.join(project_path, 'composer.lock'))
+
+        root_php, root_ext = _platform_requirements(composer_json.get('require'))
+        plan = {'php': php_version, 'cache_key': None, 'cached': False}
+        if os.path.exists(os.path.join(project_path, 'composer.json')):
+            plan['cache_key'] = self.cache_key(project_path, php_version)
+            plan['cached'] = os.path.exists(os.path.join(self.cache_dir, plan['cache_key'], 'composer.lock'))
+
+        lock_php, lock_ext = list(root_php), set(root_ext)
+        if lock:
+            for package in lock.get('packages', []):
+                php, ext = _platform_requirements(package.get('require'))
+                lock_php += php
+                lock_ext |= ext
+        plan['missing_extensions'] = sorted(lock_ext - platform['extensions'])
+
+        if not all(satisfies(php_version, c) for c in root_php):
+            plan.update(strategy='compat', reason=f"composer.json requires PHP {', '.join(root_php)}, host has {php_version}")
+        elif not lock:
+            plan.update(strategy='update', reason='no composer.lock')
+        elif not all(satisfies(php_version, c) for c in lock_php):
+            bad = sorted({p['name'] for p in lock.get('packages', [])
+                          if not all(satisfies(php_version, c) for c in _platform_requirements(p.get('require'))[0])})
+            plan.update(strategy='update', reason=f"locked packages need another PHP: {', '.join(bad[:5])}")
+        else:
+            plan.update(strategy='install', reason=f'lock is compatible with PHP {php_version}')
+        return plan
+
+    def restore(self, project_path, cache_key):
+        """Put a cached lock (and rewritten composer.json, if any) into the project"""
+        entry = os.path.join(self.cache_dir, cache_key)
+        for name in ('composer.lock', 'composer.json'):
+            if os.path.exists(os.path.join(entry, name)):
+                shutil.copyfile(os.path.join(entry, name), os.path.join(project_path, name))
+
+    def store(self, project_path, cache_key, composer_json_changed):
+        """Cache the project's resolved lock under the key of its original composer.json"""
+        if not cache_key or not os.path.exists(os.path.join(project_path, 'composer.lock')):
+            return
+        entry = os.path.join(self.cache_dir, cache_key)
+        staging = f'{entry}.{uuid.uuid4().hex[:8]}.tmp'
+        os.makedirs(staging)
+        shutil.copyfile(os.path.join(project_path, 'composer.lock'), os.path.join(staging, 'composer.lock'))
+        if composer_json_changed:
+            shutil.copyfile(os.path.join(project_path, 'composer.json'), os.path.join(staging, 'composer.json'))
+        shutil.rmtree(entry, ignore_errors=True)
+        os.rename(staging, entry)
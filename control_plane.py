@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+from site_registry import get_registry
+
+
+def process_start_time():
+    """Wall-clock time this process was started (from /proc), or now if unknown"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Field 22 (starttime) counts clock ticks since boot; skip past the comm field
+            fields = f.read().rsplit(')', 1)[1].split()
+        start_ticks = int(fields[19])
+        with open('/proc/stat') as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith('btime'))
+        return boot_time + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, StopIteration):
+        return time.time()
+
+
+PROCESS_STARTED = process_start_time()
+
+
+def rss_kb():
+    """Resident set size of this process in kB"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def record_startup(mode):
+    """Measure how long this process took to become ready and store it in the registry"""
+    ready_seconds = round(time.time() - PROCESS_STARTED, 3)
+    memory = rss_kb()
+    get_registry().record_startup(os.getpid(), mode, ready_seconds, memory)
+    print(f"✅ Control plane ready in {ready_seconds:.3f}s ({mode}, pid {os.getpid()}, RSS {memory} kB)")
+    return {'ready_seconds': ready_seconds, 'rss_kb': memory}
+
+
+def _background_services():
+    """Periodic background jobs of the control plane (gunicorn runs a single worker)"""
+    from host_facts import get_host_facts
+    from cert_manager import get_cert_provisioner
+    from queue_manager import get_queue_autoscaler
+    from access_analytics import get_access_analytics
+    from standby_pool import get_standby_pool
+    from site_health import get_site_health
+    return [
+        ('host-facts', get_host_facts().start),
+        ('cert-renewal', get_cert_provisioner().start),
+        ('queue-autoscaler', get_queue_autoscaler().start),
+        ('access-log-analytics', get_access_analytics().start),
+        ('standby-pool', get_standby_pool().start),
+        ('site-health', get_site_health().start),
+    ]
+
+
+def start_background_services():
+    """Start the periodic jobs off the import path, so the app becomes ready first"""
+    def start_all():
+        for name, start in _background_services():
+            try:
+                start()
+            except Exception as e:
+                print(f"⚠️ Could not start background service {name}: {e}")
+        print(f"✓ Background services running in pid {os.getpid()}")
+
+    threading.Thread(target=start_all, daemon=True, name='background-services').start()
@@ -1,85 +1,284 @@
-import subprocess
-import os
-from werkzeug.utils import secure_filename
-
-class DatabaseManager:
-    def __init__(self):
-        self.db_user, self.db_password = self.test_mysql_connection()
-    
-    def test_mysql_connection(self):
-        """Test MySQL connection and return working credentials"""
-        # Try root with no password
-        try:
-            subprocess.run(['mysql', '-u', 'root', '-e', 'SELECT 1;'], 
-                          capture_output=True, text=True, check=True)
-            return ('root', '')
-        except:
-            pass
-        
-        # Try laravel user
-        try:
-            subprocess.run(['mysql', '-u', 'laravel', '-plaravel123', '-e', 'SELECT 1;'], 
-                          capture_output=True, text=True, check=True)
-            return ('laravel', 'laravel123')
-        except:
-            pass
-        
-        raise Exception("No working MySQL credentials found")
-    
-    def setup_database(self, project_name, db_file):
-        """Setup database for project"""
-        db_name = f"laravel_{project_name}"
-        
-        # Drop existing database first (for port replacement)
-        print(f"🗄️ Setting up database: {db_name}")
-        drop_db_cmd = f"DROP DATABASE IF EXISTS {db_name};"
-        self._execute_mysql_command(drop_db_cmd)
-        print(f"✓ Cleaned existing database: {db_name}")
-        
-        # Create database with proper charset
-        create_db_cmd = f"CREATE DATABASE {db_name} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;"
-        self._execute_mysql_command(create_db_cmd)
-        
-        # Import database file if provided
-        if db_file:
-            self._import_database_file(db_name, db_file)
-        
-        print(f"✅ Database {db_name} ready")
-    
-    def cleanup_database(self, project_name):
-        """Clean up database for project"""
-        db_name = f"laravel_{project_name}"
-        drop_db_cmd = f"DROP DATABASE IF EXISTS {db_name};"
-        self._execute_mysql_command(drop_db_cmd, check=False)
-    
-    def _execute_mysql_command(self, command, check=True):
-        """Execute MySQL command with proper credentials"""
-        if self.db_password:
-            cmd = ['mysql', '-u', self.db_user, f'-p{self.db_password}', '-e', command]
-        else:
-            cmd = ['mysql', '-u', self.db_user, '-e', command]
-        
-        subprocess.run(cmd, check=check)
-    
-    def _import_database_file(self, db_name, db_file):
-        """Import database file"""
-        db_file_path = f'/tmp/{secure_filename(db_file.filename)}'
-        db_file.save(db_file_path)
-        
-        try:
-            if self.db_password:
-                cmd = ['mysql', '-u', self.db_user, f'-p{self.db_password}', db_name]
-            else:
-                cmd = ['mysql', '-u', self.db_user, db_name]
-            
-            with open(db_file_path, 'r') as f:
-                subprocess.run(cmd, stdin=f, check=True)
-            
-            print("✅ Database imported successfully")
-        except Exception as e:
-            print(f"⚠️ Database import failed: {str(e)}")
-            # Continue anyway, will use migrations instead
-    
-    def get_credentials(self):
-        """Get database credentials"""
-        return self.db_user, self.db_password
+import json
+import os
+import secrets
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from werkzeug.utils import secure_filename
+from site_registry import STATE_DIR
+from stage_limiter import get_stage_limiter
+from lock_manager import get_lock_manager
+from command_runner import run_command
+
+# Server settings relaxed while dumps import; restored when the last concurrent import finishes
+BULK_LOAD = os.environ.get('AUTO_HOSTING_IMPORT_BULK_LOAD', '1') == '1'
+BULK_LOAD_SETTINGS = {'innodb_flush_log_at_trx_commit': '2', 'sync_binlog': '0'}
+BULK_LOAD_STATE_PATH = os.path.join(STATE_DIR, 'mysql_bulk_load.json')
+# Keep imports out of the binary log (only where the user may; never on a replication source you need)
+SKIP_BINLOG = os.environ.get('AUTO_HOSTING_IMPORT_SKIP_BINLOG', '1') == '1'
+IMPORT_COUNTERS = ('Innodb_rows_inserted', 'Innodb_os_log_fsyncs', 'Innodb_data_fsyncs')
+
+CHARSET = 'CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci'
+
+# Working admin credentials are probed once per process
+_credentials = None
+_credentials_lock = threading.Lock()
+
+class DatabaseManager:
+    def __init__(self):
+        global _credentials
+        if _credentials is None:
+            with _credentials_lock:
+                if _credentials is None:
+                    _credentials = self.test_mysql_connection()
+        self.db_user, self.db_password = _credentials
+    
+    def test_mysql_connection(self):
+        """Test MySQL connection and return working credentials"""
+        # Try root with no password
+        try:
+            run_command(['mysql', '-u', 'root', '-e', 'SELECT 1;'], 
+                          echo=False, check=True)
+            return ('root', '')
+        except:
+            pass
+        
+        # Try laravel user
+        try:
+            run_command(['mysql', '-u', 'laravel', '-plaravel123', '-e', 'SELECT 1;'], 
+                          echo=False, check=True)
+            return ('laravel', 'laravel123')
+        except:
+            pass
+        
+        raise Exception("No working MySQL credentials found")
+    
+    def setup_database(self, project_name, db_file, db_name=None, fresh=False):
+        """Setup database for project; returns the import report, if a dump was imported
+
+        fresh: the database was just taken from the standby pool and is known to be empty.
+        """
+        db_name = db_name or f"laravel_{project_name}"
+        
+        with get_lock_manager().lock(f'db:{db_name}'):
+            if fresh:
+                print(f"🗄️ Using standby database: {db_name}")
+            else:
+                # Drop existing database first (for port replacement)
+                print(f"🗄️ Setting up database: {db_name}")
+                drop_db_cmd = f"DROP DATABASE IF EXISTS {db_name};"
+                self._execute_mysql_command(drop_db_cmd)
+                print(f"✓ Cleaned existing database: {db_name}")
+                
+                # Create database with proper charset (grants of a dedicated user survive the drop)
+                create_db_cmd = f"CREATE DATABASE {db_name} {CHARSET};"
+                self._execute_mysql_command(create_db_cmd)
+            
+            # Import database file if provided
+            import_report = None
+            if db_file:
+                with get_stage_limiter().slot('io'):
+                    import_report = self._import_database_file(db_name, db_file)
+        
+        print(f"✅ Database {db_name} ready")
+        return import_report
+    
+    def cleanup_database(self, project_name, db_name=None, db_user=None):
+        """Clean up database for project (and its dedicated user, if given)"""
+        db_name = db_name or f"laravel_{project_name}"
+        drop_db_cmd = f"DROP DATABASE IF EXISTS {db_name};"
+        with get_lock_manager().lock(f'db:{db_name}'):
+            self._execute_mysql_command(drop_db_cmd, check=False)
+            if db_user:
+                self._execute_mysql_command(f"DROP USER IF EXISTS '{db_user}'@'localhost';", check=False)
+    
+    def create_dedicated_database(self, db_name, db_user):
+        """Create an empty database and a user that may only use it
+
+        The user's initial password is random and never kept: whoever takes
+        the database sets its own with set_user_password.
+        """
+        with get_lock_manager().lock(f'db:{db_name}'):
+            self._execute_secret(
+                f"CREATE DATABASE {db_name} {CHARSET}; "
+                f"CREATE USER '{db_user}'@'localhost' IDENTIFIED BY '{secrets.token_hex(16)}'; "
+                f"GRANT ALL PRIVILEGES ON `{db_name}`.* TO '{db_user}'@'localhost';")
+    
+    def set_user_password(self, db_user, db_password):
+        self._execute_secret(f"ALTER USER '{db_user}'@'localhost' IDENTIFIED BY '{db_password}';")
+    
+    def _execute_secret(self, sql):
+        """Execute statements that hold passwords: sent on stdin, never in argv or the deploy log"""
+        run_command(self._mysql_cmd(), input_text=sql, echo=False, check=True)
+    
+    def _mysql_cmd(self):
+        if self.db_password:
+            return ['mysql', '-u', self.db_user, f'-p{self.db_password}']
+        return ['mysql', '-u', self.db_user]
+    
+    def _execute_mysql_command(self, command, check=True):
+        """Execute MySQL command with proper credentials"""
+        run_command(self._mysql_cmd() + ['-e', command], check=check)
+    
+    def _query(self, sql, check=True):
+        """Run a query and return its rows as lists of columns"""
+        result = run_command(self._mysql_cmd() + ['-N', '-B', '-e', sql], echo=False, check=check)
+        if result.returncode != 0:
+            return None
+        return [line.split('\t') for line in result.stdout.splitlines()]
+    
+    def _server_values(self, kind, names):
+        """Current GLOBAL VARIABLES or STATUS values for the given names"""
+        quoted = ', '.join(f"'{name}'" for name in names)
+        rows = self._query(f"SHOW GLOBAL {kind} WHERE Variable_name IN ({quoted})", check=False) or []
+        return {row[0]: row[1] for row in rows if len(row) == 2}
+    
+    def _import_database_file(self, db_name, db_file):
+        """Import database file"""
+        # Files already on disk (saved inputs, assembled uploads) are streamed in place
+        db_file_path = getattr(db_file, 'path', None)
+        if not db_file_path:
+            db_file_path = f'/tmp/{secure_filename(db_file.filename)}'
+            db_file.save(db_file_path)
+        
+        try:
+            with self.bulk_load_mode() as bulk_load:
+                session = ['SET SESSION unique_checks = 0', 'SET SESSION foreign_key_checks = 0']
+                binlog_skipped = SKIP_BINLOG and self._query('SET SESSION sql_log_bin = 0', check=False) is not None
+                if binlog_skipped:
+                    session.append('SET SESSION sql_log_bin = 0')
+                cmd = self._mysql_cmd() + [f"--init-command={'; '.join(session)}", db_name]
+                
+                before = self._server_values('STATUS', IMPORT_COUNTERS)
+                started = time.time()
+                run_command(cmd, stdin_path=db_file_path, check=True)
+                seconds = max(time.time() - started, 0.001)
+                after = self._server_values('STATUS', IMPORT_COUNTERS)
+            
+            report = self._import_report(os.path.getsize(db_file_path), seconds, before, after, bulk_load,
+                                         binlog_skipped)
+            print("✅ Database imported successfully")
+            print(f"📈 Imported {report['mb']} MB in {report['seconds']}s: {report['mb_per_second']} MB/s, "
+                  f"{report['rows_per_second']} rows/s, {report['log_fsyncs']} log fsyncs "
+                  f"(bulk-load mode {'on' if bulk_load else 'off'}, binlog {'skipped' if binlog_skipped else 'kept'})")
+            return report
+        except Exception as e:
+            print(f"⚠️ Database import failed: {str(e)}")
+            # Continue anyway, will use migrations instead
+            return None
+    
+    def _import_report(self, size, seconds, before, after, bulk_load, binlog_skipped):
+        """Throughput of an import from its size and the server's InnoDB counters around it
+        
+        The counters are server-wide, so concurrent activity is included.
+        """
+        def delta(name):
+            if name in before and name in after and before[name].isdigit() and after[name].isdigit():
+                return int(after[name]) - int(before[name])
+            return None
+        
+        rows = delta('Innodb_rows_inserted')
+        return {
+            'mb': round(size / 1024 / 1024, 1),
+            'seconds': round(seconds, 2),
+            'mb_per_second': round(size / 1024 / 1024 / seconds, 2),
+            'rows': rows,
+            'rows_per_second': round(rows / seconds) if rows is not None else None,
+            'log_fsyncs': delta('Innodb_os_log_fsyncs'),
+            'data_fsyncs': delta('Innodb_data_fsyncs'),
+            'bulk_load': bulk_load,
+            'binlog_skipped': binlog_skipped,
+        }
+    
+    # Bulk-load mode: relaxed durability shared by all imports running at the same time
+    
+    def _read_bulk_state(self):
+        try:
+            with open(BULK_LOAD_STATE_PATH) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault('holders', {})
+        # Holders whose process is gone (crashed mid-import) no longer count
+        for holder in list(state['holders']):
+            try:
+                os.kill(int(holder.split(':')[0]), 0)
+            except ProcessLookupError:
+                del state['holders'][holder]
+            except (OSError, ValueError):
+                pass
+        return state
+    
+    def _write_bulk_state(self, state):
+        os.makedirs(os.path.dirname(BULK_LOAD_STATE_PATH), exist_ok=True)
+        tmp_path = f'{BULK_LOAD_STATE_PATH}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, BULK_LOAD_STATE_PATH)
+    
+    def _apply_settings(self, settings):
+        for name, value in settings.items():
+            self._query(f'SET GLOBAL {name} = {value}', check=True)
+    
+    @contextmanager
+    def bulk_load_mode(self):
+        """Relax InnoDB log flushing and binlog syncing while the block runs
+        
+        The first import in saves the server's values and applies
+        BULK_LOAD_SETTINGS; the last one out restores them, also when the
+        import failed. Yields whether the settings are in effect (the MySQL
+        user may lack the privilege to change them).
+        """
+        holder = f'{os.getpid()}:{threading.get_ident()}:{uuid.uuid4().hex[:8]}'
+        applied = BULK_LOAD and self._enter_bulk_load(holder)
+        try:
+            yield applied
+        finally:
+            if applied:
+                self._leave_bulk_load(holder)
+    
+    def _enter_bulk_load(self, holder):
+        with get_lock_manager().lock('mysql-bulk-load'):
+            state = self._read_bulk_state()
+            if not state['holders']:
+                # Values saved by an import that never finished are the real originals
+                original = state.get('original') or self._server_values('VARIABLES', BULK_LOAD_SETTINGS)
+                settings = {name: value for name, value in BULK_LOAD_SETTINGS.items() if name in original}
+                try:
+                    state['original'] = original
+                    self._write_bulk_state(state)
+                    self._apply_settings(settings)
+                except Exception as e:
+                    print(f"⚠️ Bulk-load mode not available, importing with the current settings: {e}")
+                    self._restore_settings(state)
+                    return False
+                print(f"⚡ Bulk-load mode on: {', '.join(f'{k}={v}' for k, v in settings.items())}")
+            state['holders'][holder] = time.time()
+            self._write_bulk_state(state)
+            return True
+    
+    def _leave_bulk_load(self, holder):
+        with get_lock_manager().lock('mysql-bulk-load'):
+            state = self._read_bulk_state()
+            state['holders'].pop(holder, None)
+            if state['holders']:
+                self._write_bulk_state(state)
+                return
+            self._restore_settings(state)
+    
+    def _restore_settings(self, state):
+        original = state.pop('original', None)
+        if original:
+            try:
+                self._apply_settings(original)
+                print(f"✓ Restored MySQL settings: {', '.join(f'{k}={v}' for k, v in original.items())}")
+            except Exception as e:
+                # Keep the originals so the next import (or a later exit) restores them
+                state['original'] = original
+                print(f"⚠️ Could not restore MySQL settings: {e}")
+        self._write_bulk_state(state)
+    
+    def get_credentials(self):
+        """Get database credentials"""
+        return self.db_user, self.db_password
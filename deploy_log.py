@@ -0,0 +1,241 @@
+import collections
+import gzip
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from site_registry import STATE_DIR
+from command_runner import bind_thread_sink
+
+LOG_DIR = os.path.join(STATE_DIR, 'logs')
+# A job's log is split into segments; full segments are gzipped and only the newest are kept
+SEGMENT_BYTES = int(os.environ.get('AUTO_HOSTING_LOG_SEGMENT_BYTES', 1024 * 1024))
+MAX_SEGMENTS = int(os.environ.get('AUTO_HOSTING_LOG_MAX_SEGMENTS', 32))
+# Release logs kept per port
+KEEP_RELEASES = int(os.environ.get('AUTO_HOSTING_LOG_KEEP_RELEASES', 20))
+TAIL_LINES = 1000
+MAX_LINE_CHARS = 8192
+MAX_READ_LINES = 5000
+
+SEGMENT_PATTERN = re.compile(r'^(\d+)\.log(\.gz)?$')
+
+_active = {}
+_active_lock = threading.Lock()
+_thread = threading.local()
+
+
+class DeployLog:
+    """Log of one deployment job: rotating gzipped segments on disk plus a fixed-size in-memory tail
+
+    Lines are numbered from 0; segment files are named after their first line
+    number so a range can be read without scanning the whole log.
+    """
+
+    def __init__(self, port, release_id):
+        self.port = str(port)
+        self.release_id = release_id
+        self.directory = os.path.join(LOG_DIR, self.port, str(release_id))
+        self.tail = collections.deque(maxlen=TAIL_LINES)
+        self.lines = 0
+        self.closed = False
+        self._file = None
+        self._segment_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def write(self, text, stream='stdout'):
+        """Append one or more lines"""
+        prefix = time.strftime('%H:%M:%S') + (' [err] ' if stream == 'stderr' else ' ')
+        with self._lock:
+            if self.closed:
+                return
+            for line in str(text).splitlines() or ['']:
+                entry = prefix + line[:MAX_LINE_CHARS]
+                if self._file is None:
+                    self._segment_bytes = 0
+                    # Line buffered so other worker processes can tail the live segment
+                    self._file = open(os.path.join(self.directory, f'{self.lines:010d}.log'), 'a',
+                                      encoding='utf-8', buffering=1)
+                self._file.write(entry + '\n')
+                self._segment_bytes += len(entry) + 1
+                self.tail.append((self.lines, entry))
+                self.lines += 1
+                if self._segment_bytes >= SEGMENT_BYTES:
+                    self._rotate()
+
+    def _rotate(self):
+        """Compress the current segment and drop segments beyond MAX_SEGMENTS"""
+        path = self._file.name
+        self._file.close()
+        self._file = None
+        with open(path, 'rb') as src, gzip.open(path + '.gz.tmp', 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(path + '.gz.tmp', path + '.gz')
+        os.remove(path)
+
+        segments = _segments(self.directory)
+        for _, old_path in segments[:-MAX_SEGMENTS]:
+            os.remove(old_path)
+
+    def activate(self):
+        """Send this thread's print() output and command output to the log"""
+        _install_stdout()
+        _thread.log = self
+        bind_thread_sink(self.write)
+
+    def close(self):
+        """Flush and compress the last segment; the in-memory tail is released"""
+        if getattr(_thread, 'log', None) is self:
+            _thread.log = None
+            bind_thread_sink(None)
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            if self._file is not None:
+                self._rotate()
+        with _active_lock:
+            _active.pop(self.release_id, None)
+
+
+class _ThreadRoutedStdout:
+    """sys.stdout wrapper that copies writes from threads with an active DeployLog into it"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._partial = threading.local()
+
+    def write(self, text):
+        log = getattr(_thread, 'log', None)
+        if log is not None:
+            buffered = getattr(self._partial, 'text', '') + text
+            lines = buffered.split('\n')
+            self._partial.text = lines.pop()[-MAX_LINE_CHARS:]
+            for line in lines:
+                log.write(line)
+        return self._stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def _install_stdout():
+    with _active_lock:
+        if not isinstance(sys.stdout, _ThreadRoutedStdout):
+            sys.stdout = _ThreadRoutedStdout(sys.stdout)
+
+
+def _segments(directory):
+    """[(first line number, path)] of a log directory, oldest first"""
+    segments = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+    for name in names:
+        match = SEGMENT_PATTERN.match(name)
+        if match:
+            segments.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(segments)
+
+
+def _read_segment(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    try:
+        with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+            return f.read().splitlines()
+    except OSError:
+        return []
+
+
+def _prune(port, keep_release_id):
+    port_dir = os.path.join(LOG_DIR, str(port))
+    try:
+        release_ids = sorted(int(name) for name in os.listdir(port_dir) if name.isdigit())
+    except OSError:
+        return
+    for release_id in release_ids[:-KEEP_RELEASES]:
+        if release_id != keep_release_id:
+            shutil.rmtree(os.path.join(port_dir, str(release_id)), ignore_errors=True)
+
+
+def open_log(port, release_id):
+    """Create the log for a release and make it visible to readers in this process"""
+    log = DeployLog(port, release_id)
+    with _active_lock:
+        _active[release_id] = log
+    _prune(port, release_id)
+    return log
+
+
+def current_log():
+    """The log active in this thread, if any"""
+    return getattr(_thread, 'log', None)
+
+
+def bind(fn):
+    """Wrap fn so it logs to the calling thread's active log when run in another thread"""
+    log = current_log()
+    if log is None:
+        return fn
+
+    def run(*args, **kwargs):
+        _thread.log = log
+        previous = bind_thread_sink(log.write)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _thread.log = None
+            bind_thread_sink(previous)
+    return run
+
+
+def read_log(port, release_id, start=None, limit=200, tail=None):
+    """Read lines [start, start + limit) of a release log, or its last `tail` lines
+
+    Returns the lines as {'n', 'text'}, the oldest line still stored
+    (`first`) and the number to pass as `start` to continue (`next`).
+    """
+    limit = max(1, min(int(limit), MAX_READ_LINES))
+    segments = _segments(os.path.join(LOG_DIR, str(port), str(release_id)))
+    if not segments:
+        return None
+    first = segments[0][0]
+
+    # Tails of jobs running in this process come straight from memory
+    with _active_lock:
+        log = _active.get(release_id)
+    if log is not None and log.port == str(port) and tail is not None and int(tail) <= TAIL_LINES:
+        with log._lock:
+            entries = list(log.tail)[-max(1, int(tail)):]
+            total = log.lines
+        return _result(entries, first, total)
+
+    last_lines = _read_segment(segments[-1][1])
+    total = segments[-1][0] + len(last_lines)
+
+    if tail is not None:
+        start = max(first, total - max(1, min(int(tail), MAX_READ_LINES)))
+        limit = total - start
+    start = max(first, int(start or 0))
+    end = min(total, start + limit)
+
+    entries = []
+    for index, (segment_first, path) in enumerate(segments):
+        segment_end = segments[index + 1][0] if index + 1 < len(segments) else total
+        if segment_end <= start or segment_first >= end:
+            continue
+        lines = last_lines if index == len(segments) - 1 else _read_segment(path)
+        for offset in range(max(start, segment_first), min(end, segment_first + len(lines))):
+            entries.append((offset, lines[offset - segment_first]))
+    return _result(entries, first, entries[-1][0] + 1 if entries else start)
+
+
+def _result(entries, first, next_line):
+    return {
+        'lines': [{'n': n, 'text': text} for n, text in entries],
+        'first': first,
+        'next': next_line,
+    }
@@ -1,189 +1,565 @@
-import subprocess
-import shutil
-import uuid
-import os
-import requests
-from database_manager import DatabaseManager
-from laravel_manager import LaravelManager
-from nginx_manager import NginxManager
-from service_manager import ServiceManager
-
-def get_server_ip():
-    """Get server public IP address"""
-    try:
-        response = requests.get('https://ifconfig.me', timeout=5)
-        if response.status_code == 200:
-            return response.text.strip()
-    except:
-        pass
-    
-    try:
-        response = requests.get('https://api.ipify.org', timeout=5)
-        if response.status_code == 200:
-            return response.text.strip()
-    except:
-        pass
-    
-    return 'localhost'
-
-def deploy_laravel_project(git_repo, db_file, env_file, domain, port):
-    """Main deployment function"""
-    # Use port as project identifier
-    project_name = f"port_{port}"
-    project_path = f"/var/www/{project_name}"
-    
-    try:
-        print(f"🚀 Starting deployment for project on port: {port}")
-        
-        # Check if project already exists on this port - clean up first
-        if os.path.exists(project_path):
-            print(f"⚠️ Project already exists on port {port}, replacing...")
-            cleanup_existing_project(project_name)
-        
-        # Stop Apache to free port 80
-        subprocess.run(['systemctl', 'stop', 'apache2'], check=False)
-        print("✓ Apache stopped")
-        
-        # 1. Clone repository
-        print("📥 Cloning repository...")
-        subprocess.run(['git', 'clone', git_repo, project_path], check=True)
-        
-        # 2. Setup database
-        print("🗄️ Setting up database...")
-        db_manager = DatabaseManager()
-        db_manager.setup_database(project_name, db_file)
-        
-        # 3. Setup Laravel
-        print("⚙️ Setting up Laravel...")
-        laravel_manager = LaravelManager()
-        laravel_manager.setup_laravel(project_path, project_name, db_file, env_file)
-        
-        # 4. Configure Nginx
-        print("🌐 Configuring Nginx...")
-        nginx_manager = NginxManager()
-        nginx_manager.configure_nginx(project_path, project_name, domain, port)
-        
-        # 5. Setup SSL if domain provided
-        ssl_result = ""
-        if domain:
-            print("🔒 Setting up SSL...")
-            ssl_result = nginx_manager.setup_ssl(domain)
-        
-        # 6. Restart services
-        print("🔄 Restarting services...")
-        service_manager = ServiceManager()
-        service_manager.restart_services()
-        
-        # Get actual server IP
-        server_ip = get_server_ip()
-        
-        # Generate URLs and DNS info
-        if domain:
-            access_url = f"http://{domain}" + (f":{port}" if port != '80' else "")
-            dns_info = {
-                'domain': domain,
-                'server_ip': server_ip,
-                'dns_records': [
-                    {'type': 'A', 'name': '@', 'value': server_ip, 'ttl': '300'},
-                    {'type': 'A', 'name': 'www', 'value': server_ip, 'ttl': '300'}
-                ],
-                'nameservers': get_recommended_nameservers(),
-                'instructions': f"Set your domain '{domain}' to point to IP: {server_ip}"
-            }
-        else:
-            access_url = f"http://{server_ip}" + (f":{port}" if port != '80' else "")
-            dns_info = None
-        
-        print(f"✅ Deployment successful! Access URL: {access_url}")
-        
-        return {
-            'success': True,
-            'message': 'Project deployed successfully!',
-            'project_name': project_name,
-            'port': port,
-            'access_url': access_url,
-            'ssl_status': ssl_result,
-            'dns_info': dns_info
-        }
-        
-    except Exception as e:
-        print(f"❌ Deployment failed: {str(e)}")
-        cleanup_failed_deployment(project_path, project_name)
-        return {'success': False, 'message': f'Deployment failed: {str(e)}'}
-
-def cleanup_existing_project(project_name):
-    """Clean up existing project on same port"""
-    try:
-        print(f"🧹 Cleaning up existing project: {project_name}")
-        
-        project_path = f"/var/www/{project_name}"
-        
-        # Remove project folder
-        if os.path.exists(project_path):
-            shutil.rmtree(project_path)
-            print(f"✓ Removed project folder: {project_path}")
-        
-        # Clean up nginx config
-        nginx_manager = NginxManager()
-        nginx_manager.cleanup_config(project_name)
-        print(f"✓ Cleaned nginx config for: {project_name}")
-        
-        # Clean up database
-        db_manager = DatabaseManager()
-        db_manager.cleanup_database(project_name)
-        print(f"✓ Cleaned database for: {project_name}")
-        
-        # Test nginx config after cleanup
-        try:
-            subprocess.run(['nginx', '-t'], check=True, capture_output=True)
-            print("✓ Nginx config valid after cleanup")
-        except subprocess.CalledProcessError as e:
-            print(f"⚠️ Nginx config issues after cleanup: {e.stderr}")
-        
-        # Reload nginx after cleanup
-        subprocess.run(['systemctl', 'reload', 'nginx'], check=False)
-        
-        print(f"✅ Cleanup completed for: {project_name}")
-        
-    except Exception as e:
-        print(f"⚠️ Cleanup error: {e}")
-
-def cleanup_failed_deployment(project_path, project_name):
-    """Clean up failed deployment"""
-    try:
-        print(f"🧹 Cleaning up failed deployment: {project_name}")
-        
-        # Remove project folder
-        if os.path.exists(project_path):
-            shutil.rmtree(project_path)
-        
-        # Clean up nginx config
-        nginx_manager = NginxManager()
-        nginx_manager.cleanup_config(project_name)
-        
-        # Clean up database
-        db_manager = DatabaseManager()
-        db_manager.cleanup_database(project_name)
-        
-        print(f"✅ Cleanup completed for: {project_name}")
-        
-    except Exception as e:
-        print(f"⚠️ Cleanup error: {e}")
-
-def get_recommended_nameservers():
-    """Get recommended nameservers based on server provider"""
-    try:
-        # Try to detect server provider
-        result = subprocess.run(['curl', '-s', 'http://169.254.169.254/metadata/v1/vendor-data'], 
-                              capture_output=True, text=True, check=False)
-        
-        if 'digitalocean' in result.stdout.lower():
-            return ['ns1.digitalocean.com', 'ns2.digitalocean.com', 'ns3.digitalocean.com']
-        elif 'amazonaws' in result.stdout.lower():
-            return ['Route 53 DNS (AWS)', 'Use AWS Route 53 for DNS management']
-        else:
-            return ['Cloudflare: nash.ns.cloudflare.com, rima.ns.cloudflare.com', 
-                   'Or use your domain registrar nameservers']
-    except:
-        return ['Cloudflare: nash.ns.cloudflare.com, rima.ns.cloudflare.com', 
-               'Or use your domain registrar nameservers']
+import subprocess
+import shutil
+import uuid
+import os
+import time
+import hashlib
+import json
+import re
+import secrets
+from contextlib import contextmanager
+from database_manager import DatabaseManager
+from laravel_manager import LaravelManager
+from nginx_manager import NginxManager
+from service_manager import ServiceManager, MAX_REPLICAS
+from redis_manager import RedisManager
+from queue_manager import QueueManager, read_env
+from octane_manager import OctaneManager, SERVERS as OCTANE_SERVERS
+from site_registry import get_registry, hash_file, hash_text, STATE_DIR
+from stage_limiter import get_stage_limiter
+from lock_manager import get_lock_manager, get_deploy_coordinator
+from bulk_deployer import StoredFile
+from host_facts import get_host_facts
+from standby_pool import get_standby_pool
+from warmup import WarmupRunner, REGRESSION_MODE
+from deploy_log import open_log
+from command_runner import run_command
+
+INPUTS_DIR = os.path.join(STATE_DIR, 'inputs')
+
+# Per-deploy options and their defaults
+DEFAULT_OPTIONS = {
+    # Cache, sessions and queues in per-site Redis databases instead of files/sync
+    'redis': False,
+    # Bounds for the site's queue workers (used when QUEUE_CONNECTION is not sync)
+    'queue_min_workers': 1,
+    'queue_max_workers': 4,
+    # Application server: PHP-FPM, or a long-lived Laravel Octane server
+    'runtime': 'fpm',
+    # Local FPM replicas behind an nginx upstream (fpm runtime only)
+    'replicas': 1,
+    # Extra FastCGI backends (host:port, comma separated) serving the same release from other hosts
+    'backends': '',
+}
+OPTION_CHOICES = {
+    'runtime': ('fpm',) + OCTANE_SERVERS,
+}
+
+def get_server_ip():
+    """Get server public IP address (cached, never blocks on the network)"""
+    return get_host_facts().server_ip()
+
+@contextmanager
+def _timed_stage(registry, release_id, stage, timings, progress=None):
+    """Time a pipeline stage, record it on the release and report progress"""
+    if progress:
+        progress(stage, 'started')
+    started = time.time()
+    try:
+        yield
+    finally:
+        timings[stage] = round(time.time() - started, 3)
+        registry.record_stage(release_id, stage, timings[stage])
+        if progress:
+            progress(stage, 'finished', timings[stage])
+
+def _git_commit(project_path):
+    """Get the checked out commit of a cloned project"""
+    result = run_command(['git', 'rev-parse', 'HEAD'], cwd=project_path,
+                         echo=False, check=False)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+def deploy_options(options=None):
+    """Fill in defaults for per-deploy options (unknown keys are ignored)"""
+    merged = dict(DEFAULT_OPTIONS)
+    for key, value in (options or {}).items():
+        if key in DEFAULT_OPTIONS:
+            if isinstance(DEFAULT_OPTIONS[key], bool) and isinstance(value, str):
+                value = value.lower() in ('1', 'true', 'on', 'yes')
+            if isinstance(value, (list, tuple)):
+                value = ','.join(value)
+            merged[key] = type(DEFAULT_OPTIONS[key])(value)
+    for key, choices in OPTION_CHOICES.items():
+        if merged[key] not in choices:
+            raise Exception(f"Invalid {key} {merged[key]!r}; expected one of: {', '.join(choices)}")
+    if not 1 <= merged['replicas'] <= MAX_REPLICAS:
+        raise Exception(f"Invalid replicas {merged['replicas']}; expected 1 to {MAX_REPLICAS}")
+    for backend in _backend_list(merged['backends']):
+        if not re.match(r'^[A-Za-z0-9.\-]+:\d+$', backend):
+            raise Exception(f"Invalid backend {backend!r}; expected host:port")
+    return merged
+
+def _backend_list(backends):
+    return [backend.strip() for backend in backends.split(',') if backend.strip()]
+
+def deploy_laravel_project(git_repo, db_file, env_file, domain, port, progress=None, options=None):
+    """Main deployment function
+
+    progress, if given, is called as progress(stage, event[, seconds]) while the
+    pipeline runs. options override DEFAULT_OPTIONS.
+    """
+    options = deploy_options(options)
+    
+    def run():
+        with get_stage_limiter().slot('deploy'), get_lock_manager().lock(f'port:{port}'):
+            return _run_deployment(git_repo, db_file, env_file, domain, port, progress, options)
+    
+    # Identical requests for the same port share one run; newer ones replace queued ones
+    request_key = _request_key(git_repo, db_file, env_file, domain, options)
+    return get_deploy_coordinator().run(port, request_key, run)
+
+def _file_fingerprint(uploaded):
+    """Hash the content of an uploaded (or stored) file without consuming it"""
+    if not uploaded:
+        return None
+    if getattr(uploaded, 'path', None):
+        return hash_file(uploaded.path)
+    
+    stream = getattr(uploaded, 'stream', uploaded)
+    digest = hashlib.sha256()
+    position = stream.tell()
+    for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+        digest.update(chunk)
+    stream.seek(position)
+    return digest.hexdigest()
+
+def _request_key(git_repo, db_file, env_file, domain, options):
+    """Identify a deploy request by its inputs"""
+    parts = [git_repo, domain or '', _file_fingerprint(db_file) or '', _file_fingerprint(env_file) or '',
+             json.dumps(options, sort_keys=True)]
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+class _DeployPipeline:
+    """Runs deploy stages in order, checkpointing each one
+
+    When resuming a failed deployment, leading stages whose checkpoint was
+    recorded for identical inputs are skipped; everything from the first
+    incomplete (or changed) stage onwards runs again.
+    """
+    
+    def __init__(self, registry, port, release_id, progress, checkpoints):
+        self.registry = registry
+        self.port = port
+        self.release_id = release_id
+        self.progress = progress
+        self.checkpoints = checkpoints
+        self.resuming = bool(checkpoints)
+        self.timings = {}
+        self.completed = []
+        self.skipped = []
+    
+    def run(self, stage, inputs, fn, valid=None):
+        """Run one stage (or reuse its checkpoint) and return its outputs"""
+        inputs_hash = hash_text(json.dumps(inputs, sort_keys=True))
+        checkpoint = self.checkpoints.get(stage)
+        
+        if (self.resuming and checkpoint and checkpoint['inputs_hash'] == inputs_hash
+                and (valid is None or valid())):
+            print(f"⏭️ Reusing completed stage: {stage}")
+            self.skipped.append(stage)
+            self.completed.append(stage)
+            if self.progress:
+                self.progress(stage, 'skipped')
+            return checkpoint['outputs']
+        
+        self.resuming = False
+        with _timed_stage(self.registry, self.release_id, stage, self.timings, self.progress):
+            outputs = fn() or {}
+        self.registry.save_checkpoint(self.port, stage, inputs_hash, outputs, self.release_id)
+        self.completed.append(stage)
+        return outputs
+
+def _persist_inputs(project_name, db_file, env_file):
+    """Keep uploaded files on disk so a failed deployment can be retried later"""
+    inputs_dir = os.path.join(INPUTS_DIR, project_name)
+    os.makedirs(inputs_dir, exist_ok=True)
+    
+    stored = []
+    for uploaded, name in ((db_file, 'database.sql'), (env_file, 'env')):
+        if not uploaded:
+            stored.append(None)
+            continue
+        path = os.path.join(inputs_dir, name)
+        uploaded.save(path)
+        stored.append(StoredFile(path, uploaded.filename))
+    return stored
+
+def _run_deployment(git_repo, db_file, env_file, domain, port, progress, options):
+    """Run the deployment pipeline for one site"""
+    # Use port as project identifier
+    project_name = f"port_{port}"
+    project_path = f"/var/www/{project_name}"
+    db_name = f"laravel_{project_name}"
+    
+    registry = get_registry()
+    # Only a failed previous release leaves checkpoints worth resuming from
+    existing_site = registry.get_site(port)
+    if existing_site:
+        db_name = existing_site.get('db_name') or db_name
+    # (db_user, db_password) once the site has a dedicated database user
+    db_credentials = None
+    fresh_database = False
+    previous = registry.latest_release(port)
+    checkpoints = registry.get_checkpoints(port) if previous and previous['status'] == 'failed' else {}
+    release_id = registry.start_release(port, git_repo, db_name)
+    pipeline = _DeployPipeline(registry, port, release_id, progress, checkpoints)
+    # Output of this deploy (prints and command output) also goes to its own log
+    deploy_log = open_log(port, release_id)
+    deploy_log.activate()
+    
+    try:
+        print(f"🚀 Starting deployment for project on port: {port}")
+        
+        db_file, env_file = _persist_inputs(project_name, db_file, env_file)
+        db_hash = hash_file(db_file.path) if db_file else None
+        env_hash = hash_file(env_file.path) if env_file else None
+        
+        # A redeploy keeps its database user's password (from the .env, before clone replaces the
+        # project); a new site takes a ready database from the standby pool, if one is left
+        standby = None
+        if existing_site and existing_site.get('db_user'):
+            db_credentials = _dedicated_db_credentials(existing_site)
+        elif not existing_site:
+            standby = get_standby_pool().claim_database()
+            if standby:
+                db_name, fresh_database = standby['db_name'], True
+                db_credentials = (standby['db_user'], standby['db_password'])
+        
+        try:
+            # From here on the site owns its database and user: cleanup_site drops them
+            registry.upsert_site(port, project_name, project_path, git_repo=git_repo, domain=domain,
+                                 db_name=db_name, db_user=db_credentials[0] if db_credentials else None,
+                                 status='deploying', current_release_id=release_id,
+                                 inputs={'db_file': db_file.path if db_file else None,
+                                         'env_file': env_file.path if env_file else None,
+                                         'options': options})
+        except Exception:
+            if standby:
+                get_standby_pool().release_database(standby)
+            raise
+        if standby:
+            registry.update_release(release_id, db_name=db_name)
+        
+        # Stop Apache to free port 80
+        run_command(['systemctl', 'stop', 'apache2'], check=False)
+        print("✓ Apache stopped")
+        
+        # 1. Clone repository
+        def clone():
+            # Check if project already exists on this port - clean up first
+            # (filesystem check covers sites deployed before the registry existed)
+            if existing_site or os.path.exists(project_path):
+                print(f"⚠️ Project already exists on port {port}, replacing...")
+                cleanup_existing_project(project_name)
+            
+            print("📥 Cloning repository...")
+            run_command(['git', 'clone', git_repo, project_path], check=True)
+            return {'git_commit': _git_commit(project_path),
+                    'composer_lock_hash': hash_file(os.path.join(project_path, 'composer.lock'))}
+        
+        cloned = pipeline.run('clone', {'git_repo': git_repo}, clone,
+                              valid=lambda: os.path.isdir(os.path.join(project_path, '.git')))
+        registry.update_release(release_id, **cloned)
+        
+        # 2. Setup database
+        def setup_database():
+            print("🗄️ Setting up database...")
+            db_manager = DatabaseManager()
+            return {'db_name': db_name,
+                    'import': db_manager.setup_database(project_name, db_file, db_name, fresh=fresh_database)}
+        
+        pipeline.run('database', {'db_name': db_name, 'db_file': db_hash}, setup_database)
+        
+        env_settings = {}
+        if db_credentials:
+            env_settings.update({'DB_DATABASE': db_name, 'DB_USERNAME': db_credentials[0],
+                                 'DB_PASSWORD': db_credentials[1]})
+        
+        # 2b. Redis for cache, sessions and queues
+        redis_manager = RedisManager()
+        if options['redis']:
+            def setup_redis():
+                print("🧰 Setting up Redis...")
+                redis_db, redis_cache_db = redis_manager.setup_redis(port)
+                return {'redis_db': redis_db, 'redis_cache_db': redis_cache_db}
+            
+            redis = pipeline.run('redis', {'port': port}, setup_redis,
+                                 valid=lambda: registry.get_site(port).get('redis_db') is not None)
+            env_settings.update(redis_manager.env_settings(project_name, redis['redis_db'], redis['redis_cache_db']))
+        elif existing_site and existing_site.get('redis_db') is not None:
+            redis_manager.cleanup_redis(port)
+        
+        # 3. Setup Laravel
+        def setup_laravel():
+            print("⚙️ Setting up Laravel...")
+            laravel_manager = LaravelManager()
+            laravel_manager.setup_laravel(project_path, project_name, db_file, env_file, env_settings)
+        
+        pipeline.run('laravel', {'git_commit': cloned['git_commit'], 'env_file': env_hash, 'db_file': db_hash,
+                                 'env_settings': env_settings},
+                     setup_laravel)
+        
+        # 3b. Application server: a long-lived Octane server instead of PHP-FPM
+        octane_manager = OctaneManager()
+        if options['runtime'] != 'fpm':
+            def setup_octane():
+                print(f"🐙 Starting Octane ({options['runtime']})...")
+                return {'octane_port': octane_manager.setup_octane(project_path, project_name, port, options['runtime'])}
+            
+            pipeline.run('octane', {'git_commit': cloned['git_commit'], 'runtime': options['runtime'],
+                                    'env_file': env_hash, 'env_settings': env_settings},
+                         setup_octane, valid=lambda: octane_manager.is_active(project_name))
+        elif existing_site and existing_site.get('runtime', 'fpm') != 'fpm':
+            octane_manager.remove_octane(project_name, port)
+        
+        # 4. Configure Nginx
+        nginx_manager = NginxManager()
+        # Octane manages its own workers, so replicas apply to the fpm runtime
+        replicas = options['replicas'] if options['runtime'] == 'fpm' else 1
+        backends = _backend_list(options['backends']) if options['runtime'] == 'fpm' else []
+        registry.update_site(port, replicas=replicas, backends=backends)
+        
+        def configure_nginx():
+            print("🌐 Configuring Nginx...")
+            with get_stage_limiter().slot('exclusive'):
+                return {'vhost_hash': nginx_manager.configure_nginx(project_path, project_name, domain, port)}
+        
+        vhost_hash = pipeline.run('nginx', {'project_path': project_path, 'domain': domain, 'port': port,
+                                            'runtime': options['runtime'], 'replicas': replicas,
+                                            'backends': backends},
+                                  configure_nginx)['vhost_hash']
+        registry.update_release(release_id, vhost_hash=vhost_hash)
+        
+        # 5. Setup SSL if domain provided
+        ssl_result = ""
+        if domain:
+            def setup_ssl():
+                print("🔒 Setting up SSL...")
+                return {'ssl_status': nginx_manager.setup_ssl(domain, project_path, project_name, port)}
+            
+            ssl_result = pipeline.run('ssl', {'domain': domain}, setup_ssl)['ssl_status']
+        
+        # 6. Restart services
+        def restart_services():
+            print("🔄 Restarting services...")
+            with get_stage_limiter().slot('exclusive'):
+                service_manager = ServiceManager()
+                # The site's own FPM replicas (in its slice) are up before nginx starts routing to them
+                if options['runtime'] == 'fpm':
+                    service_manager.setup_site_fpm(project_path, project_name, port)
+                else:
+                    service_manager.remove_site_fpm(project_name, keep_slice=True)
+                    service_manager.retune_sites()
+                service_manager.restart_services()
+        
+        pipeline.run('services', {'vhost_hash': vhost_hash}, restart_services)
+        
+        # 6b. Queue workers (restarted gracefully so they run the new release)
+        queue_manager = QueueManager()
+        queue_connection = read_env(project_path).get('QUEUE_CONNECTION', 'sync')
+        if queue_connection != 'sync':
+            def start_queue_workers():
+                print(f"📬 Starting queue workers ({queue_connection})...")
+                minimum = max(0, options['queue_min_workers'])
+                maximum = max(minimum, options['queue_max_workers'], 1)
+                return {'workers': queue_manager.setup_workers(project_path, project_name, port, minimum, maximum)}
+            
+            # Always runs: a release switch must restart the workers
+            pipeline.run('queue', {'release_id': release_id}, start_queue_workers)
+        else:
+            queue_manager.remove_workers(project_name, port)
+            registry.update_site(port, queue_min=None, queue_max=None, queue_workers=None, queue_depth=None)
+        
+        # 7. Warm caches and compare latency with the previous release
+        def warm_up():
+            last_success = registry.latest_release(port, status='success')
+            report = WarmupRunner().run(project_path, port, domain, last_success['warmup'] if last_success else None)
+            registry.update_release(release_id, warmup=report)
+            if report['regressed'] and REGRESSION_MODE == 'fail':
+                routes = ', '.join(regression['route'] for regression in report['regressions'])
+                raise Exception(f"Latency regression beyond threshold on: {routes}")
+            return report
+        
+        warmup_report = pipeline.run('warmup', {'git_commit': cloned['git_commit'], 'vhost_hash': vhost_hash}, warm_up)
+        
+        # 8. Size FPM and OPcache from the workers' memory measured after warm-up
+        if options['runtime'] == 'fpm':
+            def tune():
+                service_manager = ServiceManager()
+                worker_kb = service_manager.measure_site(project_name, port)
+                service_manager.retune_sites()
+                return {'worker_kb': worker_kb}
+            
+            pipeline.run('tuning', {'release_id': release_id}, tune)
+        
+        registry.finish_release(release_id, 'success')
+        registry.update_site(port, status='active', vhost_hash=vhost_hash)
+        
+        # Get actual server IP
+        server_ip = get_server_ip()
+        
+        # Generate URLs and DNS info
+        if domain:
+            access_url = f"http://{domain}" + (f":{port}" if port != '80' else "")
+            dns_info = {
+                'domain': domain,
+                'server_ip': server_ip,
+                'dns_records': [
+                    {'type': 'A', 'name': '@', 'value': server_ip, 'ttl': '300'},
+                    {'type': 'A', 'name': 'www', 'value': server_ip, 'ttl': '300'}
+                ],
+                'nameservers': get_recommended_nameservers(),
+                'instructions': f"Set your domain '{domain}' to point to IP: {server_ip}"
+            }
+        else:
+            access_url = f"http://{server_ip}" + (f":{port}" if port != '80' else "")
+            dns_info = None
+        
+        print(f"✅ Deployment successful! Access URL: {access_url}")
+        
+        return {
+            'success': True,
+            'message': 'Project deployed successfully!',
+            'project_name': project_name,
+            'port': port,
+            'access_url': access_url,
+            'ssl_status': ssl_result,
+            'dns_info': dns_info,
+            'release_id': release_id,
+            'timings': pipeline.timings,
+            'resumed_stages': pipeline.skipped,
+            'warmup': warmup_report
+        }
+        
+    except Exception as e:
+        print(f"❌ Deployment failed: {str(e)}")
+        registry.finish_release(release_id, 'failed', error=str(e))
+        registry.update_site(port, status='failed')
+        # Completed stages are kept so a retry resumes instead of starting over;
+        # removing the leftovers is an explicit action (cleanup_site)
+        return {'success': False, 'message': f'Deployment failed: {str(e)}', 'release_id': release_id,
+                'completed_stages': pipeline.completed, 'resumable': True}
+    finally:
+        deploy_log.close()
+
+def _dedicated_db_credentials(site):
+    """(db_user, db_password) of a site's own database user; a password lost with the .env is reset"""
+    db_password = read_env(site['project_path']).get('DB_PASSWORD')
+    if not db_password:
+        db_password = secrets.token_hex(16)
+        DatabaseManager().set_user_password(site['db_user'], db_password)
+        print(f"🔑 Reset the password of database user {site['db_user']}")
+    return site['db_user'], db_password
+
+def cleanup_existing_project(project_name):
+    """Clean up existing project on same port"""
+    try:
+        print(f"🧹 Cleaning up existing project: {project_name}")
+        
+        project_path = f"/var/www/{project_name}"
+        
+        # Let queue workers finish their current job before their code disappears
+        site = get_registry().get_site_by_name(project_name)
+        QueueManager().stop_workers(project_name, site['port'] if site else None)
+        OctaneManager().stop_octane(project_name)
+        
+        # Remove project folder
+        if os.path.exists(project_path):
+            shutil.rmtree(project_path)
+            print(f"✓ Removed project folder: {project_path}")
+        
+        # Clean up nginx config
+        nginx_manager = NginxManager()
+        nginx_manager.cleanup_config(project_name)
+        print(f"✓ Cleaned nginx config for: {project_name}")
+        
+        # Clean up database (the site keeps its database user)
+        db_manager = DatabaseManager()
+        db_manager.cleanup_database(project_name, site['db_name'] if site else None)
+        print(f"✓ Cleaned database for: {project_name}")
+        
+        # Checkpoints refer to the removed files and database
+        site = get_registry().get_site_by_name(project_name)
+        if site:
+            get_registry().clear_checkpoints(site['port'])
+        
+        # Test nginx config after cleanup
+        try:
+            run_command(['nginx', '-t'], check=True, echo=False)
+            print("✓ Nginx config valid after cleanup")
+        except subprocess.CalledProcessError as e:
+            print(f"⚠️ Nginx config issues after cleanup: {e.stderr}")
+        
+        # Reload nginx after cleanup
+        run_command(['systemctl', 'reload', 'nginx'], check=False)
+        
+        print(f"✅ Cleanup completed for: {project_name}")
+        
+    except Exception as e:
+        print(f"⚠️ Cleanup error: {e}")
+
+def cleanup_failed_deployment(project_path, project_name):
+    """Clean up failed deployment"""
+    try:
+        print(f"🧹 Cleaning up failed deployment: {project_name}")
+        
+        # Stop queue workers, the Octane server and the site's FPM instance, and remove their units
+        QueueManager().remove_workers(project_name)
+        OctaneManager().remove_octane(project_name)
+        service_manager = ServiceManager()
+        service_manager.remove_site_fpm(project_name)
+        
+        # Remove project folder
+        if os.path.exists(project_path):
+            shutil.rmtree(project_path)
+        
+        # Clean up nginx config
+        nginx_manager = NginxManager()
+        nginx_manager.cleanup_config(project_name)
+        
+        # Clean up database and the site's own database user
+        site = get_registry().get_site_by_name(project_name)
+        db_manager = DatabaseManager()
+        db_manager.cleanup_database(project_name, site['db_name'] if site else None, site.get('db_user') if site else None)
+        
+        # Forget the site in the registry, with its checkpoints and saved inputs
+        if site:
+            if site.get('redis_db') is not None:
+                RedisManager().cleanup_redis(site['port'])
+            get_registry().clear_checkpoints(site['port'])
+            get_registry().remove_site(site['port'])
+        shutil.rmtree(os.path.join(INPUTS_DIR, project_name), ignore_errors=True)
+        
+        # The remaining sites can use the freed resources
+        service_manager.retune_sites()
+        
+        print(f"✅ Cleanup completed for: {project_name}")
+        
+    except Exception as e:
+        print(f"⚠️ Cleanup error: {e}")
+
+def retry_deployment(port, progress=None):
+    """Retry the last deployment of a port, resuming from its first incomplete stage"""
+    site = get_registry().get_site(port)
+    if not site:
+        return {'success': False, 'message': f'No site registered on port {port}'}
+    
+    inputs = site['inputs']
+    db_file = StoredFile(inputs['db_file']) if inputs.get('db_file') and os.path.exists(inputs['db_file']) else None
+    env_file = StoredFile(inputs['env_file']) if inputs.get('env_file') and os.path.exists(inputs['env_file']) else None
+    return deploy_laravel_project(site['git_repo'], db_file, env_file, site['domain'] or '', port, progress,
+                                  inputs.get('options'))
+
+def cleanup_site(port):
+    """Explicitly remove a site: files, nginx config, database and registry entry"""
+    site = get_registry().get_site(port)
+    if not site:
+        return {'success': False, 'message': f'No site registered on port {port}'}
+    
+    with get_lock_manager().lock(f'port:{port}'):
+        cleanup_failed_deployment(site['project_path'], site['project_name'])
+    return {'success': True, 'message': f"Removed {site['project_name']}"}
+
+def get_recommended_nameservers():
+    """Get recommended nameservers based on server provider"""
+    return get_host_facts().nameservers()
@@ -0,0 +1,38 @@
+import os
+
+# Production serving of the control plane:  gunicorn -c gunicorn.conf.py app:app
+# Graceful restart (finish in-flight requests, start fresh workers):  kill -HUP <master pid>
+# or `systemctl reload auto-hosting` with the bundled unit.
+
+bind = os.environ.get('AUTO_HOSTING_BIND', '0.0.0.0:5000')
+# One worker process: bulk batches, deploy coalescing per port, the stage limiter slots and the
+# running load tests live in process memory, so a second worker would serve 404s for batches
+# it did not create and run its own, uncoordinated deploys and caps. Concurrency comes from
+# threads; a graceful restart still overlaps the old and the new worker.
+workers = 1
+# Deploy requests are long-running, so the worker serves them from a thread pool
+worker_class = 'gthread'
+threads = int(os.environ.get('AUTO_HOSTING_THREADS', 16))
+# gthread workers heartbeat from their main loop, so long deploys do not trip this
+timeout = 120
+# Give in-flight deploys time to finish on restart before workers are killed
+graceful_timeout = int(os.environ.get('AUTO_HOSTING_GRACEFUL_TIMEOUT', 900))
+keepalive = 5
+# Import the app in each worker (not in the master) so a restart only pays for the lean app module
+preload_app = False
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    from control_plane import record_startup
+    record_startup('gunicorn-master')
+
+
+def post_worker_init(worker):
+    from control_plane import record_startup
+    record_startup('gunicorn-worker')
+
+
+def on_reload(server):
+    server.log.info("Graceful restart: finishing in-flight requests in old workers")
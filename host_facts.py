@@ -0,0 +1,208 @@
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+import urllib.request
+from command_runner import run_command
+from site_registry import STATE_DIR
+
+FACTS_PATH = os.path.join(STATE_DIR, 'host_facts.json')
+PUBLIC_IP_URLS = ['https://ifconfig.me/ip', 'https://api.ipify.org']
+METADATA_VENDOR_URL = 'http://169.254.169.254/metadata/v1/vendor-data'
+
+NAMESERVERS = {
+    'digitalocean': ['ns1.digitalocean.com', 'ns2.digitalocean.com', 'ns3.digitalocean.com'],
+    'aws': ['Route 53 DNS (AWS)', 'Use AWS Route 53 for DNS management'],
+}
+DEFAULT_NAMESERVERS = ['Cloudflare: nash.ns.cloudflare.com, rima.ns.cloudflare.com',
+                       'Or use your domain registrar nameservers']
+
+
+class HostFacts:
+    """Cached network facts about this host
+
+    Local interfaces are read directly from the kernel. The public IP and the
+    cloud provider need the network, so they are looked up by a background
+    thread, cached with a TTL and persisted to disk. Readers never wait on
+    those lookups: they get the last known value or a local fallback.
+    """
+
+    def __init__(self, path=FACTS_PATH, ttl=None):
+        self.path = path
+        self.ttl = ttl or int(os.environ.get('AUTO_HOSTING_FACTS_TTL', 3600))
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._facts = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self._facts, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Could not persist host facts: {e}")
+
+    # Local facts (no network)
+
+    def local_addresses(self):
+        """List IPv4 addresses of local interfaces, primary outbound address first"""
+        addresses = []
+        primary = self._primary_address()
+        if primary:
+            addresses.append(primary)
+
+        try:
+            result = run_command(['ip', '-j', '-4', 'addr', 'show'], echo=False, timeout=2)
+            for interface in [] if result.timed_out else json.loads(result.stdout or '[]'):
+                for addr in interface.get('addr_info', []):
+                    if addr.get('local') and addr['local'] not in addresses:
+                        addresses.append(addr['local'])
+        except (OSError, ValueError):
+            pass
+
+        return [address for address in addresses if not ipaddress.ip_address(address).is_loopback]
+
+    def _primary_address(self):
+        """Address the default route would use (connect() on UDP sends no packets)"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.connect(('192.0.2.1', 80))
+            return sock.getsockname()[0]
+        except OSError:
+            return None
+        finally:
+            sock.close()
+
+    def _detect_provider_locally(self):
+        """Identify the cloud provider from DMI data"""
+        for path in ('/sys/class/dmi/id/sys_vendor', '/sys/class/dmi/id/bios_vendor'):
+            try:
+                with open(path) as f:
+                    vendor = f.read().lower()
+            except OSError:
+                continue
+            if 'digitalocean' in vendor:
+                return 'digitalocean'
+            if 'amazon' in vendor:
+                return 'aws'
+        return None
+
+    # Cached facts
+
+    def server_ip(self):
+        """Best known public address of this host, without blocking"""
+        self._refresh_if_stale()
+        if self._facts.get('public_ip'):
+            return self._facts['public_ip']
+
+        local = self.local_addresses()
+        public = [address for address in local if ipaddress.ip_address(address).is_global]
+        if public:
+            return public[0]
+        return local[0] if local else 'localhost'
+
+    def addresses(self):
+        """All addresses this host is reachable at (public IP plus interfaces)"""
+        addresses = self.local_addresses()
+        if self._facts.get('public_ip') and self._facts['public_ip'] not in addresses:
+            addresses.insert(0, self._facts['public_ip'])
+        return addresses
+
+    def provider(self):
+        """Detected cloud provider, or None"""
+        self._refresh_if_stale()
+        return self._facts.get('provider') or self._detect_provider_locally()
+
+    def nameservers(self):
+        """Recommended nameservers for the detected provider"""
+        return NAMESERVERS.get(self.provider(), DEFAULT_NAMESERVERS)
+
+    def snapshot(self):
+        return {**self._facts, 'local_addresses': self.local_addresses()}
+
+    # Background refresh
+
+    def _refresh_if_stale(self):
+        if time.time() - self._facts.get('refreshed_at', 0) < self.ttl:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def refresh(self):
+        """Look up the public IP and provider (runs in the background)"""
+        try:
+            facts = dict(self._facts)
+            public_ip = self._lookup_public_ip()
+            if public_ip:
+                facts['public_ip'] = public_ip
+            facts['provider'] = self._detect_provider_locally() or self._lookup_provider() or facts.get('provider')
+            facts['refreshed_at'] = time.time()
+            self._facts = facts
+            self._save()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _fetch(self, url, timeout):
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.read().decode('utf-8', 'replace').strip()
+
+    def _lookup_public_ip(self):
+        for url in PUBLIC_IP_URLS:
+            try:
+                address = self._fetch(url, timeout=5)
+                ipaddress.ip_address(address)
+                return address
+            except (OSError, ValueError):
+                continue
+        return None
+
+    def _lookup_provider(self):
+        try:
+            vendor_data = self._fetch(METADATA_VENDOR_URL, timeout=2).lower()
+        except (OSError, ValueError):
+            return None
+        if 'digitalocean' in vendor_data:
+            return 'digitalocean'
+        if 'amazonaws' in vendor_data:
+            return 'aws'
+        return None
+
+    def start(self, interval=None):
+        """Keep facts fresh with a periodic background refresh"""
+        interval = interval or self.ttl
+
+        def loop():
+            while True:
+                self._refresh_if_stale()
+                time.sleep(interval)
+
+        threading.Thread(target=loop, daemon=True, name='host-facts').start()
+
+
+_facts = None
+_facts_lock = threading.Lock()
+
+
+def get_host_facts():
+    """Return the process-wide host facts cache"""
+    global _facts
+    if _facts is None:
+        with _facts_lock:
+            if _facts is None:
+                _facts = HostFacts()
+    return _facts
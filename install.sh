@@ -18,6 +18,13 @@ apt update
 # Install packages - Force PHP 8.2 to be the default
 apt install -y nginx php8.2 php8.2-fpm php8.2-mysql php8.2-pdo php8.2-xml php8.2-gd php8.2-curl php8.2-zip php8.2-mbstring php8.2-bcmath php8.2-intl
 apt install -y mysql-server git python3 python3-pip
+apt install -y nodejs npm
+apt install -y redis-server php8.2-redis
+
+# Enough Redis databases for two per site (sessions/queue and cache)
+sed -i 's/^databases .*/databases 256/' /etc/redis/redis.conf
+systemctl enable redis-server
+systemctl restart redis-server
 
 # Enable PHP MySQL extensions
 phpenmod mysql
@@ -35,8 +42,8 @@ curl -sS https://getcomposer.org/installer | php
 mv composer.phar /usr/local/bin/composer
 chmod +x /usr/local/bin/composer
 
-# Install Flask
-pip3 install flask werkzeug
+# Install Flask and the production WSGI server
+pip3 install -r "$(dirname "$0")/requirements.txt"
 
 # Configure MySQL properly
 systemctl start mysql
@@ -93,8 +100,14 @@ ufw allow 443
 ufw allow 5000
 ufw --force enable
 
+# Install the control plane as a service (gunicorn, graceful reload via systemctl reload)
+APP_DIR="$(cd "$(dirname "$0")" && pwd)"
+sed "s#__APP_DIR__#$APP_DIR#" "$APP_DIR/auto-hosting.service" > /etc/systemd/system/auto-hosting.service
+systemctl daemon-reload
+systemctl enable auto-hosting
+
 echo "Installation complete!"
-echo "Run: python3 app.py"
+echo "Run: systemctl start auto-hosting   (or python3 app.py for development)"
 # Set up firewall
 ufw allow 22
 ufw allow 80
@@ -0,0 +1,276 @@
+import asyncio
+import math
+import random
+import re
+import threading
+import time
+from site_registry import get_registry
+
+MAX_DURATION = 600
+MAX_CONCURRENCY = 1000
+# Paths go straight into the request line
+PATH_PATTERN = re.compile(r'^/[^\s\x00-\x1f\x7f]*$')
+# ... and the host into the Host header: a name or an IP, with an optional port
+HOST_PATTERN = re.compile(r'^(\[[0-9A-Fa-f:.]+\]|[A-Za-z0-9_.-]+)(:\d{1,5})?$')
+# Responses that never have a body
+NO_BODY_STATUSES = (204, 304)
+
+# Geometric latency buckets: 0.1ms .. ~60s, 15% apart
+BUCKET_FACTOR = 1.15
+BUCKET_MIN_MS = 0.1
+BUCKET_COUNT = int(math.log(60000 / BUCKET_MIN_MS, BUCKET_FACTOR)) + 2
+
+
+class LatencyHistogram:
+    """Fixed-size latency histogram (memory does not grow with request count)"""
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def _bucket(self, ms):
+        if ms <= BUCKET_MIN_MS:
+            return 0
+        return min(BUCKET_COUNT - 1, int(math.log(ms / BUCKET_MIN_MS, BUCKET_FACTOR)) + 1)
+
+    def _upper_bound(self, index):
+        return BUCKET_MIN_MS * (BUCKET_FACTOR ** index)
+
+    def record(self, ms):
+        self.counts[self._bucket(ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the given percentile"""
+        if not self.total:
+            return None
+        target = math.ceil(pct / 100.0 * self.total)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return round(min(self._upper_bound(index), self.max_ms), 2)
+        return round(self.max_ms, 2)
+
+    def summary(self):
+        return {
+            'count': self.total,
+            'mean': round(self.sum_ms / self.total, 2) if self.total else None,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': round(self.max_ms, 2),
+        }
+
+    def buckets(self):
+        """Non-empty buckets as [{'le': upper bound ms, 'count': n}]"""
+        return [{'le': round(self._upper_bound(index), 3), 'count': count}
+                for index, count in enumerate(self.counts) if count]
+
+    def state(self):
+        """Compact JSON-serializable form (only non-empty buckets)"""
+        return {'counts': {str(index): count for index, count in enumerate(self.counts) if count},
+                'total': self.total, 'sum_ms': self.sum_ms, 'max_ms': self.max_ms}
+
+    @classmethod
+    def from_state(cls, state):
+        histogram = cls()
+        for index, count in (state.get('counts') or {}).items():
+            histogram.counts[int(index)] = count
+        histogram.total = state.get('total', 0)
+        histogram.sum_ms = state.get('sum_ms', 0.0)
+        histogram.max_ms = state.get('max_ms', 0.0)
+        return histogram
+
+
+class LoadTester:
+    """asyncio HTTP/1.1 load generator for a deployed site's local port
+
+    Each of `concurrency` workers keeps one keep-alive connection and sends
+    GET requests for `duration` seconds, picking paths from a weighted URL
+    mix. Results (RPS, latency histogram, status and error counts) are
+    stored in the site's load test history in the registry.
+    """
+
+    def __init__(self):
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def start(self, port, duration=30, concurrency=10, urls=None, host=None, label=None):
+        """Start a load test in the background and return its id"""
+        duration = max(1, min(int(duration), MAX_DURATION))
+        concurrency = max(1, min(int(concurrency), MAX_CONCURRENCY))
+        mix = self._normalize_mix(urls or ['/'])
+        registry = get_registry()
+        site = registry.get_site(port) or {}
+        host = host or site.get('domain') or 'localhost'
+        if not isinstance(host, str) or not HOST_PATTERN.fullmatch(host):
+            raise ValueError(f'Invalid host {host!r}: expected a host name or IP address, optionally with :port')
+
+        with self._lock:
+            if str(port) in self._running:
+                raise Exception(f'A load test is already running on port {port}')
+            self._running.add(str(port))
+
+        params = {'duration': duration, 'concurrency': concurrency, 'urls': mix, 'label': label, 'host': host,
+                  'vhost_hash': site.get('vhost_hash'), 'release_id': site.get('current_release_id')}
+        test_id = registry.start_load_test(port, params)
+
+        def run():
+            try:
+                result = asyncio.run(self._run(int(port), params))
+                registry.finish_load_test(test_id, 'completed', result)
+                print(f"✅ Load test {test_id} on port {port}: {result['rps']} req/s, "
+                      f"p99 {result['latency']['p99']}ms, {result['error_rate']:.2%} errors")
+            except Exception as e:
+                registry.finish_load_test(test_id, 'failed', {'error': str(e)})
+                print(f"❌ Load test {test_id} failed: {e}")
+            finally:
+                with self._lock:
+                    self._running.discard(str(port))
+
+        threading.Thread(target=run, daemon=True, name=f'loadtest-{port}').start()
+        return test_id
+
+    def _normalize_mix(self, urls):
+        if not isinstance(urls, list):
+            raise ValueError('urls must be a list of paths or {"path", "weight"} objects')
+        mix = []
+        for url in urls:
+            if isinstance(url, str):
+                mix.append({'path': url, 'weight': 1})
+            elif isinstance(url, dict):
+                try:
+                    weight = max(0.0, float(url.get('weight', 1)))
+                except (TypeError, ValueError):
+                    raise ValueError(f"Invalid weight {url.get('weight')!r} for {url.get('path', '/')!r}")
+                mix.append({'path': url.get('path', '/'), 'weight': weight})
+            else:
+                raise ValueError(f'Invalid URL entry {url!r}: expected a path or a {{"path", "weight"}} object')
+        for entry in mix:
+            if not isinstance(entry['path'], str) or not PATH_PATTERN.fullmatch(entry['path']):
+                raise ValueError(f"Invalid path {entry['path']!r}: it must start with / and contain no whitespace")
+        if not any(entry['weight'] > 0 for entry in mix):
+            raise ValueError('At least one URL needs a weight above 0')
+        return mix
+
+    async def _run(self, port, params):
+        paths = [entry['path'] for entry in params['urls']]
+        weights = [entry['weight'] for entry in params['urls']]
+        stats = {
+            'histogram': LatencyHistogram(),
+            'per_path': {path: LatencyHistogram() for path in paths},
+            'statuses': {},
+            'errors': {},
+        }
+
+        started = time.perf_counter()
+        deadline = started + params['duration']
+        await asyncio.gather(*(self._worker(port, params['host'], paths, weights, deadline, stats)
+                               for _ in range(params['concurrency'])))
+        elapsed = time.perf_counter() - started
+
+        histogram = stats['histogram']
+        errors = sum(stats['errors'].values()) + sum(
+            count for status, count in stats['statuses'].items() if int(status) >= 500)
+        attempts = histogram.total + sum(stats['errors'].values())
+        return {
+            'requests': histogram.total,
+            'elapsed': round(elapsed, 3),
+            'rps': round(histogram.total / elapsed, 2) if elapsed else 0,
+            'latency': histogram.summary(),
+            'histogram': histogram.buckets(),
+            'statuses': stats['statuses'],
+            'errors': stats['errors'],
+            'error_rate': round(errors / attempts, 4) if attempts else 0,
+            'per_path': {path: hist.summary() for path, hist in stats['per_path'].items()},
+        }
+
+    async def _worker(self, port, host, paths, weights, deadline, stats):
+        reader = writer = None
+        while time.perf_counter() < deadline:
+            path = random.choices(paths, weights)[0]
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout=10)
+                request_started = time.perf_counter()
+                writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: auto-hosting-loadtest\r\n'
+                             f'Connection: keep-alive\r\n\r\n'.encode('latin-1'))
+                remaining = max(0.1, deadline - time.perf_counter() + 30)
+                status, keep_alive = await asyncio.wait_for(self._read_response(reader), timeout=remaining)
+                latency_ms = (time.perf_counter() - request_started) * 1000
+
+                stats['histogram'].record(latency_ms)
+                stats['per_path'][path].record(latency_ms)
+                stats['statuses'][str(status)] = stats['statuses'].get(str(status), 0) + 1
+                if not keep_alive:
+                    writer.close()
+                    reader = writer = None
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                name = type(e).__name__
+                stats['errors'][name] = stats['errors'].get(name, 0) + 1
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+                await asyncio.sleep(0.01)
+        if writer is not None:
+            writer.close()
+
+    async def _read_response(self, reader):
+        """Read one response; returns (status, connection reusable)"""
+        while True:
+            status_line = await reader.readline()
+            if not status_line:
+                raise asyncio.IncompleteReadError(b'', None)
+            status = int(status_line.split()[1])
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            # Interim responses (100 Continue, 103 Early Hints) precede the real one
+            if not 100 <= status < 200 or status == 101:
+                break
+
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        if status == 101:
+            return status, False
+        if status in NO_BODY_STATUSES:
+            return status, keep_alive
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # The last chunk may be followed by trailer fields before the closing blank line
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                await reader.readexactly(size + 2)
+        elif 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        else:
+            await reader.read()
+            return status, False
+
+        return status, keep_alive
+
+
+_tester = None
+_tester_lock = threading.Lock()
+
+
+def get_load_tester():
+    """Return the process-wide load tester"""
+    global _tester
+    if _tester is None:
+        with _tester_lock:
+            if _tester is None:
+                _tester = LoadTester()
+    return _tester
@@ -0,0 +1,176 @@
+import fcntl
+import os
+import threading
+import time
+from contextlib import contextmanager
+from site_registry import STATE_DIR
+
+LOCK_DIR = os.path.join(STATE_DIR, 'locks')
+
+
+class LockManager:
+    """Named resource locks (port:80, db:laravel_port_80, nginx:port_80)
+
+    Locks are flock()ed files so they also hold across control-plane worker
+    processes. They are re-entrant per thread, and several keys are always
+    taken in sorted order to avoid deadlocks.
+    """
+
+    def __init__(self, lock_dir=LOCK_DIR):
+        self.lock_dir = lock_dir
+        self._held = threading.local()
+        os.makedirs(self.lock_dir, exist_ok=True)
+
+    def _held_keys(self):
+        if not hasattr(self._held, 'keys'):
+            self._held.keys = {}
+        return self._held.keys
+
+    def _path(self, key):
+        safe = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in key)
+        return os.path.join(self.lock_dir, f'{safe}.lock')
+
+    @contextmanager
+    def lock(self, *keys):
+        """Hold all given resource locks for the duration of the block"""
+        held = self._held_keys()
+        acquired = []
+        try:
+            for key in sorted(set(keys)):
+                if key in held:
+                    held[key][1] += 1
+                    acquired.append(key)
+                    continue
+                fd = os.open(self._path(key), os.O_CREAT | os.O_RDWR, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                except Exception:
+                    os.close(fd)
+                    raise
+                held[key] = [fd, 1]
+                acquired.append(key)
+            yield
+        finally:
+            for key in reversed(acquired):
+                held[key][1] -= 1
+                if held[key][1] == 0:
+                    fd = held.pop(key)[0]
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                    os.close(fd)
+
+
+class _DeployJob:
+    def __init__(self, key):
+        self.key = key
+        self.result = None
+        self.event = threading.Event()
+        self.created_at = time.time()
+
+    def finish(self, result):
+        self.result = result
+        self.event.set()
+
+    @property
+    def done(self):
+        return self.event.is_set()
+
+
+class DeployCoordinator:
+    """Serializes deployments per port and skips redundant ones
+
+    A request identical to the deploy already running on its port is
+    coalesced onto it and receives the same result. Anything else waits as
+    the single pending deploy for that port; a newer request replaces the
+    pending one ("latest wins"), so intermediate builds are never executed.
+    """
+
+    def __init__(self):
+        self._slots = {}
+        self._condition = threading.Condition()
+
+    def run(self, port, key, fn):
+        """Run fn() as the deploy for `port`, or attach to an equivalent one"""
+        port = str(port)
+        with self._condition:
+            slot = self._slots.setdefault(port, {'running': None, 'pending': None})
+            running, pending = slot['running'], slot['pending']
+
+            if running and running.key == key:
+                if pending:
+                    self._supersede(slot)
+                return self._join(running)
+            if pending and pending.key == key:
+                return self._join(pending)
+
+            job = _DeployJob(key)
+            if pending:
+                self._supersede(slot)
+            if running is None:
+                slot['running'] = job
+            else:
+                slot['pending'] = job
+                print(f"⏳ Deploy for port {port} queued behind the one in progress")
+                self._condition.wait_for(lambda: slot['running'] is None or job.done)
+                if job.done:
+                    return job.result
+                slot['pending'] = None
+                slot['running'] = job
+
+        try:
+            result = fn()
+        except Exception as e:
+            result = {'success': False, 'message': f'Deployment failed: {str(e)}'}
+
+        with self._condition:
+            job.finish(result)
+            slot['running'] = None
+            if slot['pending'] is None:
+                self._slots.pop(port, None)
+            self._condition.notify_all()
+        return result
+
+    def _supersede(self, slot):
+        pending = slot['pending']
+        slot['pending'] = None
+        pending.finish({'success': False, 'superseded': True,
+                        'message': 'Deployment skipped: superseded by a newer request for the same port'})
+        self._condition.notify_all()
+
+    def _join(self, job):
+        self._condition.release()
+        try:
+            job.event.wait()
+        finally:
+            self._condition.acquire()
+        return {**job.result, 'coalesced': True}
+
+    def in_flight(self):
+        """Return ports with a running or pending deploy"""
+        with self._condition:
+            return {port: {'running': bool(slot['running']), 'pending': bool(slot['pending'])}
+                    for port, slot in self._slots.items()}
+
+
+_lock_manager = None
+_coordinator = None
+_init_lock = threading.Lock()
+
+
+def get_lock_manager():
+    """Return the process-wide lock manager"""
+    global _lock_manager
+    if _lock_manager is None:
+        with _init_lock:
+            if _lock_manager is None:
+                _lock_manager = LockManager()
+    return _lock_manager
+
+
+def get_deploy_coordinator():
+    """Return the process-wide deploy coordinator"""
+    global _coordinator
+    if _coordinator is None:
+        with _init_lock:
+            if _coordinator is None:
+                _coordinator = DeployCoordinator()
+    return _coordinator
@@ -1,185 +1,338 @@
-import subprocess
-import os
-
-class NginxManager:
-    def configure_nginx(self, project_path, project_name, domain, port):
-        """Configure Nginx for project"""
-        # Get PHP socket from service manager
-        from service_manager import ServiceManager
-        service_manager = ServiceManager()
-        php_socket = service_manager.get_php_socket()
-        
-        # Clean ALL existing configs first
-        self._cleanup_all_configs()
-        
-        # Remove existing config for this port (if any)
-        self.cleanup_config(project_name)
-        
-        # Create nginx config
-        nginx_config = self._generate_nginx_config(project_path, project_name, domain, port, php_socket)
-        
-        # Write config file
-        config_path = f'/etc/nginx/sites-available/{project_name}'
-        with open(config_path, 'w') as f:
-            f.write(nginx_config)
-        
-        # Enable the config
-        subprocess.run(['ln', '-sf', config_path, f'/etc/nginx/sites-enabled/{project_name}'], check=True)
-        
-        # Test nginx configuration
-        self._test_nginx_config(project_name, config_path)
-        
-        print(f"✅ Nginx configured successfully for port {port}")
-
-    def _cleanup_all_configs(self):
-        """Clean up ALL existing nginx configs to prevent conflicts"""
-        try:
-            print("🧹 Cleaning up all existing nginx configs...")
-            
-            # Get all enabled sites
-            enabled_sites_dir = '/etc/nginx/sites-enabled'
-            if os.path.exists(enabled_sites_dir):
-                enabled_sites = os.listdir(enabled_sites_dir)
-                
-                # Remove all enabled sites except default nginx config
-                for site in enabled_sites:
-                    site_path = os.path.join(enabled_sites_dir, site)
-                    if site != 'default' and os.path.islink(site_path):
-                        os.remove(site_path)
-                        print(f"✓ Removed enabled site: {site}")
-            
-            # Clean up old project configs from sites-available
-            available_sites_dir = '/etc/nginx/sites-available'
-            if os.path.exists(available_sites_dir):
-                available_sites = os.listdir(available_sites_dir)
-                
-                # Remove old project configs (anything that looks like project ID)
-                for site in available_sites:
-                    site_path = os.path.join(available_sites_dir, site)
-                    # Skip default nginx configs
-                    if site in ['default', '000-default']:
-                        continue
-                    
-                    # Remove if it's a project config (8 chars or port_xx format)
-                    if (len(site) == 8 and site.isalnum()) or site.startswith('port_'):
-                        if os.path.exists(site_path):
-                            os.remove(site_path)
-                            print(f"✓ Removed available site: {site}")
-            
-            print("✅ All old configs cleaned up")
-            
-        except Exception as e:
-            print(f"⚠️ Error cleaning configs: {e}")
-
-    def _generate_nginx_config(self, project_path, project_name, domain, port, php_socket):
-        """Generate nginx configuration"""
-        server_name = domain if domain else f'localhost'
-        
-        return f"""server {{
-    listen {port};
-    server_name {server_name};
-    root {project_path}/public;
-    index index.php index.html index.htm;
-
-    location / {{
-        try_files $uri $uri/ /index.php?$query_string;
-    }}
-
-    location ~ \\.php$ {{
-        fastcgi_pass unix:{php_socket};
-        fastcgi_index index.php;
-        fastcgi_param SCRIPT_FILENAME $realpath_root$fastcgi_script_name;
-        include fastcgi_params;
-    }}
-
-    location ~ /\\.ht {{
-        deny all;
-    }}
-
-    location ~* \\.(css|js|png|jpg|jpeg|gif|ico|svg)$ {{
-        expires 1y;
-        add_header Cache-Control "public, immutable";
-        try_files $uri =404;
-    }}
-}}"""
-
-    def _test_nginx_config(self, project_name, config_path):
-        """Test nginx configuration"""
-        try:
-            result = subprocess.run(['nginx', '-t'], capture_output=True, text=True, check=True)
-            print("✅ Nginx config test passed")
-            
-            # Also check for conflicting server names
-            if "conflicting server name" in result.stderr:
-                print("⚠️ Detected conflicting server names, but config is valid")
-            
-        except subprocess.CalledProcessError as e:
-            print(f"❌ Nginx config test failed: {e.stderr}")
-            # Remove invalid config
-            self.cleanup_config(project_name)
-            raise Exception(f"Nginx configuration test failed: {e.stderr}")
-    
-    def _fix_nginx_conflicts(self):
-        """Fix nginx conflicting configurations"""
-        conflicting_sites = [
-            '/etc/nginx/sites-enabled/default',
-            '/etc/nginx/sites-enabled/000-default'
-        ]
-        
-        for site in conflicting_sites:
-            if os.path.exists(site):
-                os.remove(site)
-                print(f"✅ Removed conflicting site: {site}")
-    
-    def cleanup_config(self, project_name):
-        """Clean up nginx configuration"""
-        nginx_config = f'/etc/nginx/sites-available/{project_name}'
-        nginx_enabled = f'/etc/nginx/sites-enabled/{project_name}'
-        
-        if os.path.exists(nginx_enabled):
-            os.remove(nginx_enabled)
-            print(f"✓ Removed nginx enabled config: {nginx_enabled}")
-        if os.path.exists(nginx_config):
-            os.remove(nginx_config)
-            print(f"✓ Removed nginx available config: {nginx_config}")
-    
-    def setup_ssl(self, domain):
-        """Setup SSL certificate"""
-        try:
-            # First check if domain points to this server
-            server_ip = self._get_server_ip()
-            domain_ip = self._resolve_domain(domain)
-            
-            if domain_ip != server_ip:
-                return f"SSL failed: Domain {domain} points to {domain_ip}, but server IP is {server_ip}. Please update DNS first."
-            
-            # Install certbot if not exists
-            subprocess.run(['apt', 'install', '-y', 'certbot', 'python3-certbot-nginx'], check=False)
-            
-            # Try to get SSL certificate
-            result = subprocess.run(['certbot', '--nginx', '-d', domain, '--non-interactive', '--agree-tos', 
-                           '--email', 'admin@example.com'], capture_output=True, text=True, check=False)
-            
-            if result.returncode == 0:
-                return "SSL certificate installed successfully"
-            else:
-                return f"SSL installation failed: {result.stderr}"
-        except Exception as e:
-            return f"SSL installation failed: {str(e)}"
-    
-    def _get_server_ip(self):
-        """Get server public IP"""
-        try:
-            import requests
-            response = requests.get('https://ifconfig.me', timeout=5)
-            return response.text.strip()
-        except:
-            return 'unknown'
-    
-    def _resolve_domain(self, domain):
-        """Resolve domain to IP"""
-        try:
-            import socket
-            return socket.gethostbyname(domain)
-        except:
-            return 'unresolved'
+import subprocess
+import os
+from site_registry import get_registry, hash_text
+from lock_manager import get_lock_manager
+from host_facts import get_host_facts
+from cert_manager import get_cert_provisioner
+from command_runner import run_command
+from access_analytics import LOG_FORMAT, LOG_FORMAT_CONF, LOG_FORMAT_NAME, access_log_path
+
+class NginxManager:
+    def configure_nginx(self, project_path, project_name, domain, port):
+        """Configure Nginx for project"""
+        # Each site has its own FPM instance (see ServiceManager.setup_site_fpm)
+        from service_manager import ServiceManager
+        service_manager = ServiceManager()
+        php_socket = service_manager.site_socket(project_name)
+        
+        with get_lock_manager().lock(f'nginx:{project_name}'):
+            # Clean stale configs of unregistered projects first
+            self._cleanup_all_configs(keep=project_name)
+            self._ensure_log_format()
+        
+            # Remove existing config for this port (if any)
+            self.cleanup_config(project_name)
+        
+            # Create nginx config (with HTTPS if a valid certificate is already stored)
+            certificate = get_cert_provisioner().certificate_for([domain], min_validity=0) if domain else None
+            # Sites running under Octane are proxied to their long-lived server instead of FPM
+            site = get_registry().get_site(port) or {}
+            # Replicas and remote FPM backends are balanced through an upstream
+            php_backends = [f'unix:{socket}' for socket in
+                            service_manager.site_sockets(project_name, site.get('replicas') or 1)]
+            php_backends += site.get('backends') or []
+            nginx_config = self._generate_nginx_config(project_path, project_name, domain, port, php_socket, certificate,
+                                                       site.get('octane_port'), php_backends)
+        
+            # Write config file
+            config_path = f'/etc/nginx/sites-available/{project_name}'
+            with open(config_path, 'w') as f:
+                f.write(nginx_config)
+        
+            # Enable the config
+            run_command(['ln', '-sf', config_path, f'/etc/nginx/sites-enabled/{project_name}'], check=True)
+        
+            # Test nginx configuration
+            self._test_nginx_config(project_name, config_path)
+        
+        print(f"✅ Nginx configured successfully for port {port}")
+        return hash_text(nginx_config)
+
+    def _ensure_log_format(self):
+        """Define the timing log format the vhosts log with (http context, shared by all sites)"""
+        with get_lock_manager().lock('nginx:log-format'):
+            if os.path.exists(LOG_FORMAT_CONF):
+                with open(LOG_FORMAT_CONF) as f:
+                    if f.read().strip() == LOG_FORMAT:
+                        return
+            with open(LOG_FORMAT_CONF, 'w') as f:
+                f.write(LOG_FORMAT + '\n')
+
+    def _cleanup_all_configs(self, keep=None):
+        """Clean up configs of projects that are no longer registered"""
+        try:
+            print("🧹 Cleaning up stale nginx configs...")
+            
+            # The registry is the source of truth for which projects exist
+            registered = get_registry().project_names()
+            if keep:
+                registered.add(keep)
+            
+            for sites_dir in ['/etc/nginx/sites-enabled', '/etc/nginx/sites-available']:
+                if not os.path.exists(sites_dir):
+                    continue
+                
+                for site in os.listdir(sites_dir):
+                    # Only touch configs this tool generated
+                    if not site.startswith('port_') or site in registered:
+                        continue
+                    
+                    site_path = os.path.join(sites_dir, site)
+                    if os.path.lexists(site_path):
+                        os.remove(site_path)
+                        print(f"✓ Removed stale site: {site_path}")
+            
+            print("✅ Stale configs cleaned up")
+            
+        except Exception as e:
+            print(f"⚠️ Error cleaning configs: {e}")
+
+    def _generate_nginx_config(self, project_path, project_name, domain, port, php_socket, certificate=None,
+                               octane_port=None, php_backends=None):
+        """Generate nginx configuration"""
+        server_name = domain if domain else f'localhost'
+        fpm_upstream = project_name if not octane_port and len(php_backends or []) > 1 else None
+        locations = self._generate_locations(project_path, php_socket, project_name if octane_port else None,
+                                             fpm_upstream)
+        
+        config = ""
+        if fpm_upstream:
+            servers = ''.join(f"    server {backend} max_fails=3 fail_timeout=10s;\n" for backend in php_backends)
+            config += f"""upstream fpm_{project_name} {{
+    least_conn;
+{servers}    keepalive 16;
+}}
+
+"""
+        if octane_port:
+            config += f"""upstream octane_{project_name} {{
+    server 127.0.0.1:{octane_port};
+    keepalive 32;
+}}
+
+"""
+        
+        access_log = f"    access_log {access_log_path(project_name)} {LOG_FORMAT_NAME} buffer=32k flush=5s;"
+        config += f"""server {{
+    listen {port};
+    server_name {server_name};
+{access_log}
+{locations}
+}}"""
+        
+        if domain and str(port) != '80':
+            # ACME HTTP-01 challenges always arrive on port 80
+            config += f"""
+
+server {{
+    listen 80;
+    server_name {domain};
+
+    location /.well-known/acme-challenge/ {{
+        root {project_path}/public;
+    }}
+}}"""
+        
+        if certificate:
+            fullchain, privkey = certificate
+            config += f"""
+
+server {{
+    listen 443 ssl;
+    server_name {domain};
+    ssl_certificate {fullchain};
+    ssl_certificate_key {privkey};
+    ssl_protocols TLSv1.2 TLSv1.3;
+    ssl_session_cache shared:SSL:10m;
+{access_log}
+{locations}
+}}"""
+        
+        return config
+
+    def _generate_locations(self, project_path, php_socket, octane_upstream=None, fpm_upstream=None):
+        """Generate the root and location blocks shared by the HTTP and HTTPS servers"""
+        if octane_upstream:
+            return self._generate_octane_locations(project_path, octane_upstream)
+        
+        if fpm_upstream:
+            # Keep-alive FastCGI connections to the replicas
+            fastcgi_pass = f"""fastcgi_pass fpm_{fpm_upstream};
+        fastcgi_keep_conn on;"""
+        else:
+            fastcgi_pass = f"fastcgi_pass unix:{php_socket};"
+        
+        return f"""    root {project_path}/public;
+    index index.php index.html index.htm;
+
+    location / {{
+        try_files $uri $uri/ /index.php?$query_string;
+    }}
+
+    location ~ \\.php$ {{
+        {fastcgi_pass}
+        fastcgi_index index.php;
+        fastcgi_param SCRIPT_FILENAME $realpath_root$fastcgi_script_name;
+        include fastcgi_params;
+    }}
+
+    location ~ /\\.ht {{
+        deny all;
+    }}
+
+    location ~* \\.(css|js|png|jpg|jpeg|gif|ico|svg)$ {{
+        expires 1y;
+        add_header Cache-Control "public, immutable";
+        try_files $uri =404;
+    }}"""
+
+    def _generate_octane_locations(self, project_path, octane_upstream):
+        """Location blocks for an Octane site: static files from disk, everything else proxied"""
+        return f"""    root {project_path}/public;
+    # Directory requests go through index.php to the @octane location
+    index index.php;
+
+    location / {{
+        try_files $uri $uri/ @octane;
+    }}
+
+    # Never serve PHP sources; the front controller lives in the Octane server
+    location ~ \\.php$ {{
+        try_files /nonexistent @octane;
+    }}
+
+    location @octane {{
+        proxy_http_version 1.1;
+        proxy_set_header Connection "";
+        proxy_set_header Host $http_host;
+        proxy_set_header Scheme $scheme;
+        proxy_set_header SERVER_PORT $server_port;
+        proxy_set_header REMOTE_ADDR $remote_addr;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto $scheme;
+        proxy_pass http://octane_{octane_upstream};
+    }}
+
+    location ~ /\\.ht {{
+        deny all;
+    }}
+
+    location ~* \\.(css|js|png|jpg|jpeg|gif|ico|svg)$ {{
+        expires 1y;
+        add_header Cache-Control "public, immutable";
+        try_files $uri =404;
+    }}"""
+
+    def _test_nginx_config(self, project_name, config_path):
+        """Test nginx configuration"""
+        try:
+            result = run_command(['nginx', '-t'], echo=False, check=True)
+            print("✅ Nginx config test passed")
+            
+            # Also check for conflicting server names
+            if "conflicting server name" in result.stderr:
+                print("⚠️ Detected conflicting server names, but config is valid")
+            
+        except subprocess.CalledProcessError as e:
+            print(f"❌ Nginx config test failed: {e.stderr}")
+            # Remove invalid config
+            self.cleanup_config(project_name)
+            raise Exception(f"Nginx configuration test failed: {e.stderr}")
+    
+    def reload(self):
+        """Test the configuration and reload nginx gracefully (in-flight requests finish)"""
+        run_command(['nginx', '-t'], echo=False, check=True)
+        run_command(['systemctl', 'reload', 'nginx'], check=True)
+    
+    def drain_backend(self, project_name, backend, drained):
+        """Mark one server of a site's FPM upstream down (or up again) and reload nginx
+
+        Returns False if the site's vhost does not balance over that backend.
+        """
+        config_path = f'/etc/nginx/sites-available/{project_name}'
+        up = f"    server {backend} max_fails=3 fail_timeout=10s;"
+        down = f"    server {backend} max_fails=3 fail_timeout=10s down;"
+        with get_lock_manager().lock(f'nginx:{project_name}'):
+            if not os.path.exists(config_path):
+                return False
+            with open(config_path) as f:
+                config = f.read()
+            old, new = (up, down) if drained else (down, up)
+            if new in config:
+                return True
+            if old not in config:
+                return False
+            with open(config_path, 'w') as f:
+                f.write(config.replace(old, new))
+            self.reload()
+        return True
+    
+    def _fix_nginx_conflicts(self):
+        """Fix nginx conflicting configurations"""
+        conflicting_sites = [
+            '/etc/nginx/sites-enabled/default',
+            '/etc/nginx/sites-enabled/000-default'
+        ]
+        
+        for site in conflicting_sites:
+            if os.path.exists(site):
+                os.remove(site)
+                print(f"✅ Removed conflicting site: {site}")
+    
+    def cleanup_config(self, project_name):
+        """Clean up nginx configuration"""
+        nginx_config = f'/etc/nginx/sites-available/{project_name}'
+        nginx_enabled = f'/etc/nginx/sites-enabled/{project_name}'
+        
+        with get_lock_manager().lock(f'nginx:{project_name}'):
+            if os.path.exists(nginx_enabled):
+                os.remove(nginx_enabled)
+                print(f"✓ Removed nginx enabled config: {nginx_enabled}")
+            if os.path.exists(nginx_config):
+                os.remove(nginx_config)
+                print(f"✓ Removed nginx available config: {nginx_config}")
+    
+    def setup_ssl(self, domain, project_path, project_name, port):
+        """Setup SSL certificate (issued in the background, reused when still valid)"""
+        try:
+            # First check if domain points to this server
+            server_addresses = get_host_facts().addresses()
+            domain_ip = self._resolve_domain(domain)
+            
+            if domain_ip not in server_addresses:
+                server_ip = get_host_facts().server_ip()
+                return f"SSL failed: Domain {domain} points to {domain_ip}, but server IP is {server_ip}. Please update DNS first."
+            
+            def on_issued():
+                # Regenerate the vhost with the new certificate and reload nginx. The site may have
+                # been redeployed or removed while the certificate was issued, so it is read again
+                # under its port lock instead of trusting the values captured above
+                from stage_limiter import get_stage_limiter
+                with get_lock_manager().lock(f'port:{port}'):
+                    site = get_registry().get_site(port)
+                    if not site or site['domain'] != domain:
+                        print(f"ℹ️ Certificate for {domain} issued, but port {port} no longer serves it")
+                        return
+                    with get_stage_limiter().slot('exclusive'):
+                        self.configure_nginx(site['project_path'], site['project_name'], domain, port)
+                        run_command(['systemctl', 'reload', 'nginx'], check=False)
+                print(f"✅ HTTPS enabled for {domain}")
+            
+            state = get_cert_provisioner().request([domain], f'{project_path}/public', on_issued)
+            if state == 'reused':
+                return "SSL certificate reused (still valid)"
+            return "SSL certificate is being issued in the background"
+        except Exception as e:
+            return f"SSL installation failed: {str(e)}"
+    
+    def _get_server_ip(self):
+        """Get server public IP"""
+        return get_host_facts().server_ip()
+    
+    def _resolve_domain(self, domain):
+        """Resolve domain to IP"""
+        try:
+            import socket
+            return socket.gethostbyname(domain)
+        except:
+            return 'unresolved'
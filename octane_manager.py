@@ -0,0 +1,126 @@
+import os
+from site_registry import get_registry
+from lock_manager import get_lock_manager
+from stage_limiter import get_stage_limiter
+from command_runner import run_command
+
+UNIT_DIR = '/etc/systemd/system'
+# Octane listens on 127.0.0.1:<base + site port>, e.g. 28080 for the site on 8080
+PORT_BASE = int(os.environ.get('AUTO_HOSTING_OCTANE_PORT_BASE', 20000))
+MAX_REQUESTS = int(os.environ.get('AUTO_HOSTING_OCTANE_MAX_REQUESTS', 500))
+SERVERS = ('swoole', 'roadrunner', 'frankenphp')
+
+UNIT_TEMPLATE = """[Unit]
+Description=Laravel Octane ({server}) for {project_name}
+After=network.target mysql.service redis-server.service
+
+[Service]
+Slice=auto-hosting-{project_name}.slice
+User=www-data
+Group=www-data
+WorkingDirectory={project_path}
+ExecStart=/usr/bin/php artisan octane:start --server={server} --host=127.0.0.1 --port={octane_port} --max-requests={max_requests}
+Restart=always
+RestartSec=3
+KillSignal=SIGTERM
+TimeoutStopSec=60
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+
+class OctaneManager:
+    """Runs a site under Laravel Octane as a long-lived systemd service instead of PHP-FPM"""
+
+    def octane_port(self, port):
+        return PORT_BASE + int(port)
+
+    def service_name(self, project_name):
+        return f'laravel-octane-{project_name}.service'
+
+    def _unit_path(self, project_name):
+        return os.path.join(UNIT_DIR, self.service_name(project_name))
+
+    def is_active(self, project_name):
+        result = run_command(['systemctl', 'is-active', self.service_name(project_name)], echo=False, check=False)
+        return result.stdout.strip() == 'active'
+
+    def _install(self, project_path, server):
+        """Add laravel/octane to the app (unless it ships it) and install the server binary or extension"""
+        env = os.environ.copy()
+        env['COMPOSER_ALLOW_SUPERUSER'] = '1'
+
+        if not os.path.isdir(os.path.join(project_path, 'vendor', 'laravel', 'octane')):
+            print("📦 Adding laravel/octane...")
+            with get_stage_limiter().slot('cpu'):
+                run_command(['composer', 'require', 'laravel/octane', '--no-interaction', '--update-no-dev'],
+                            cwd=project_path, env=env, check=True)
+
+        if server == 'swoole':
+            modules = run_command(['php', '-m'], echo=False, check=False).stdout.split()
+            if 'swoole' not in modules and 'openswoole' not in modules:
+                version = run_command(['php', '-r', 'echo PHP_MAJOR_VERSION.".".PHP_MINOR_VERSION;'],
+                                      echo=False, check=True).stdout.strip()
+                print(f"📦 Installing php{version}-swoole...")
+                run_command(['apt', 'install', '-y', f'php{version}-swoole'], check=True)
+
+        # Publishes config/octane.php and downloads the RoadRunner/FrankenPHP binary when needed
+        run_command(['php', 'artisan', 'octane:install', f'--server={server}', '--no-interaction'],
+                    cwd=project_path, env=env, check=True)
+        run_command(['chown', '-R', 'www-data:www-data', project_path], check=True)
+
+    def setup_octane(self, project_path, project_name, port, server):
+        """Install Octane and start (or gracefully reload) the site's server; returns its local port"""
+        if server not in SERVERS:
+            raise Exception(f"Unknown Octane server: {server}")
+        octane_port = self.octane_port(port)
+        self._install(project_path, server)
+
+        unit = UNIT_TEMPLATE.format(project_name=project_name, project_path=project_path, server=server,
+                                    octane_port=octane_port, max_requests=MAX_REQUESTS)
+        with get_lock_manager().lock(f'octane:{project_name}'):
+            changed = True
+            if os.path.exists(self._unit_path(project_name)):
+                with open(self._unit_path(project_name)) as f:
+                    changed = f.read() != unit
+            if changed:
+                with open(self._unit_path(project_name), 'w') as f:
+                    f.write(unit)
+                run_command(['systemctl', 'daemon-reload'], check=True)
+
+            if self.is_active(project_name) and not changed:
+                # Workers finish their current request and boot the new release
+                print("🔄 Reloading Octane workers gracefully")
+                run_command(['runuser', '-u', 'www-data', '--', 'php', 'artisan', 'octane:reload',
+                             f'--server={server}'], cwd=project_path, check=True)
+            else:
+                run_command(['systemctl', 'enable', self.service_name(project_name)], check=True)
+                run_command(['systemctl', 'restart', self.service_name(project_name)], check=True)
+
+        get_registry().update_site(port, runtime=server, octane_port=octane_port)
+        print(f"✅ Octane ({server}) serving {project_name} on 127.0.0.1:{octane_port}")
+        return octane_port
+
+    def stop_octane(self, project_name):
+        """Stop the site's Octane server (the unit stays installed)"""
+        with get_lock_manager().lock(f'octane:{project_name}'):
+            if self.is_active(project_name):
+                print("⏹️ Stopping Octane server")
+                run_command(['systemctl', 'stop', self.service_name(project_name)], check=False)
+
+    def remove_octane(self, project_name, port=None):
+        """Stop and remove the site's Octane server; the site goes back to PHP-FPM"""
+        with get_lock_manager().lock(f'octane:{project_name}'):
+            if os.path.exists(self._unit_path(project_name)):
+                run_command(['systemctl', 'disable', '--now', self.service_name(project_name)], check=False)
+                os.remove(self._unit_path(project_name))
+                run_command(['systemctl', 'daemon-reload'], check=False)
+        if port is not None:
+            get_registry().update_site(port, runtime='fpm', octane_port=None)
+
+    def status(self, project_name):
+        """State of the site's Octane service as reported by systemd"""
+        result = run_command(['systemctl', 'show', self.service_name(project_name),
+                              '--property=ActiveState,SubState,MainPID,NRestarts'], echo=False, check=False)
+        return dict(line.split('=', 1) for line in result.stdout.splitlines() if '=' in line)
@@ -0,0 +1,253 @@
+import math
+import os
+import re
+import threading
+import time
+from site_registry import get_registry
+from lock_manager import get_lock_manager
+from command_runner import run_command
+
+UNIT_DIR = '/etc/systemd/system'
+SCALE_INTERVAL = int(os.environ.get('AUTO_HOSTING_QUEUE_SCALE_INTERVAL', 15))
+# Waiting jobs one worker is expected to keep up with
+JOBS_PER_WORKER = int(os.environ.get('AUTO_HOSTING_QUEUE_JOBS_PER_WORKER', 20))
+# Consecutive quiet polls before a worker is removed
+SCALE_DOWN_AFTER = 4
+
+# .env values are written by whoever uploaded the file: only these shapes reach a command line
+QUEUE_NAME = re.compile(r'^[\w:.-]+$')
+HOST_NAME = re.compile(r'^[\w.:\[\]-]+$')
+IDENTIFIER = re.compile(r'^[\w$-]+$')
+
+UNIT_TEMPLATE = """[Unit]
+Description=Laravel queue worker %i for {project_name}
+After=network.target mysql.service redis-server.service
+
+[Service]
+Slice=auto-hosting-{project_name}.slice
+User=www-data
+Group=www-data
+WorkingDirectory={project_path}
+ExecStart=/usr/bin/php artisan queue:work --sleep=3 --tries=3 --max-jobs=1000 --max-time=3600
+Restart=always
+RestartSec=3
+# queue:work finishes the job in progress on SIGTERM
+KillSignal=SIGTERM
+TimeoutStopSec={stop_timeout}
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+
+def read_env(project_path):
+    """Parse a project's .env into a dict (quotes stripped, no interpolation)"""
+    values = {}
+    try:
+        with open(os.path.join(project_path, '.env')) as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#') or '=' not in line:
+                    continue
+                key, value = line.split('=', 1)
+                values[key.strip()] = value.strip().strip('"\'')
+    except OSError:
+        pass
+    return values
+
+
+class QueueManager:
+    """Manages `php artisan queue:work` workers of a site as systemd template instances
+
+    Worker n of port_8080 runs as laravel-queue-port_8080@n.service, so
+    scaling is starting or stopping numbered instances.
+    """
+
+    def __init__(self, stop_timeout=600):
+        self.stop_timeout = stop_timeout
+
+    def unit_name(self, project_name):
+        return f'laravel-queue-{project_name}@'
+
+    def _unit_path(self, project_name):
+        return os.path.join(UNIT_DIR, f'{self.unit_name(project_name)}.service')
+
+    def running_workers(self, project_name):
+        """Instance numbers of the site's active workers"""
+        result = run_command(['systemctl', 'list-units', '--type=service', '--state=active', '--plain',
+                              '--no-legend', f'{self.unit_name(project_name)}*.service'], echo=False, check=False)
+        instances = []
+        for line in result.stdout.splitlines():
+            match = re.match(rf'{re.escape(self.unit_name(project_name))}(\d+)\.service', line.strip())
+            if match:
+                instances.append(int(match.group(1)))
+        return sorted(instances)
+
+    def setup_workers(self, project_path, project_name, port, min_workers, max_workers):
+        """Install the worker unit and run at least min_workers; running workers load the new release"""
+        unit = UNIT_TEMPLATE.format(project_name=project_name, project_path=project_path,
+                                    stop_timeout=self.stop_timeout)
+        with get_lock_manager().lock(f'queue:{project_name}'):
+            changed = True
+            if os.path.exists(self._unit_path(project_name)):
+                with open(self._unit_path(project_name)) as f:
+                    changed = f.read() != unit
+            with open(self._unit_path(project_name), 'w') as f:
+                f.write(unit)
+            if changed:
+                run_command(['systemctl', 'daemon-reload'], check=True)
+
+            running = self.running_workers(project_name)
+            if running:
+                # Workers exit after their current job and systemd starts them on the new code
+                print(f"🔄 Restarting {len(running)} queue worker(s) gracefully")
+                run_command(['runuser', '-u', 'www-data', '--', 'php', 'artisan', 'queue:restart'],
+                            cwd=project_path, check=False)
+
+            get_registry().update_site(port, queue_min=min_workers, queue_max=max_workers)
+            count = min(max(len(running), min_workers), max_workers)
+            self._scale(project_name, port, count, running)
+        print(f"✅ Queue workers running: {count} (min {min_workers}, max {max_workers})")
+        return count
+
+    def scale(self, project_name, port, count):
+        """Run exactly `count` workers"""
+        with get_lock_manager().lock(f'queue:{project_name}'):
+            self._scale(project_name, port, count, self.running_workers(project_name))
+
+    def _scale(self, project_name, port, count, running):
+        unit = self.unit_name(project_name)
+        start = [f'{unit}{n}.service' for n in range(1, count + 1) if n not in running]
+        stop = [f'{unit}{n}.service' for n in running if n > count]
+        if start:
+            run_command(['systemctl', 'enable', '--now'] + start, check=True)
+        if stop:
+            # SIGTERM: each worker finishes its current job first
+            run_command(['systemctl', 'disable', '--now'] + stop, check=False)
+        if port is not None:
+            get_registry().update_site(port, queue_workers=count)
+
+    def stop_workers(self, project_name, port=None):
+        """Stop all workers (each finishes its current job); the unit stays installed"""
+        with get_lock_manager().lock(f'queue:{project_name}'):
+            running = self.running_workers(project_name)
+            if running:
+                print(f"⏹️ Stopping {len(running)} queue worker(s)")
+                self._scale(project_name, port, 0, running)
+
+    def remove_workers(self, project_name, port=None):
+        """Stop all workers and remove the unit"""
+        self.stop_workers(project_name, port)
+        if os.path.exists(self._unit_path(project_name)):
+            os.remove(self._unit_path(project_name))
+            run_command(['systemctl', 'daemon-reload'], check=False)
+
+    def queue_depth(self, project_path, redis_db=None):
+        """Jobs waiting on the site's default queue, or None if it cannot be measured"""
+        env = read_env(project_path)
+        connection = env.get('QUEUE_CONNECTION', 'sync')
+        queue = env.get('REDIS_QUEUE' if connection == 'redis' else 'DB_QUEUE', 'default')
+        if not QUEUE_NAME.match(queue):
+            return None
+
+        # Passwords go through the environment, never argv (visible to every local user)
+        if connection == 'redis':
+            prefix = env.get('REDIS_PREFIX')
+            if prefix is None:
+                # Laravel's default: slug of APP_NAME + '_database_'
+                prefix = re.sub(r'[^a-z0-9]+', '_', env.get('APP_NAME', 'laravel').lower()).strip('_') + '_database_'
+            host, port = env.get('REDIS_HOST', '127.0.0.1'), env.get('REDIS_PORT', '6379')
+            db = str(env.get('REDIS_DB', redis_db if redis_db is not None else 0))
+            if not (HOST_NAME.match(host) and not host.startswith('-') and port.isdigit() and db.isdigit()):
+                return None
+            command_env = dict(os.environ)
+            command_env.pop('REDISCLI_AUTH', None)
+            if env.get('REDIS_PASSWORD') not in (None, '', 'null'):
+                command_env['REDISCLI_AUTH'] = env['REDIS_PASSWORD']
+            result = run_command(['redis-cli', '-h', host, '-p', port, '-n', db, 'LLEN', f'{prefix}queues:{queue}'],
+                                 env=command_env, echo=False, check=False)
+        elif connection == 'database':
+            host, user = env.get('DB_HOST', '127.0.0.1'), env.get('DB_USERNAME', 'root')
+            database = env.get('DB_DATABASE', '')
+            if not (HOST_NAME.match(host) and not host.startswith('-')
+                    and IDENTIFIER.match(user) and not user.startswith('-')
+                    and IDENTIFIER.match(database) and not database.startswith('-')):
+                return None
+            command_env = dict(os.environ)
+            command_env.pop('MYSQL_PWD', None)
+            if env.get('DB_PASSWORD'):
+                command_env['MYSQL_PWD'] = env['DB_PASSWORD']
+            result = run_command(['mysql', '-N', '-h', host, '-u', user, database, '-e',
+                                  f"SELECT COUNT(*) FROM jobs WHERE queue = '{queue}' AND reserved_at IS NULL"],
+                                 env=command_env, echo=False, check=False)
+        else:
+            return None
+
+        value = result.stdout.strip().split()[-1] if result.returncode == 0 and result.stdout.strip() else ''
+        return int(value) if value.isdigit() else None
+
+
+class QueueAutoscaler:
+    """Scales each site's queue workers between its min and max from the observed queue depth
+
+    Scaling up is immediate; scaling down removes one worker at a time
+    after SCALE_DOWN_AFTER polls in which fewer workers would have done.
+    """
+
+    def __init__(self, manager=None, interval=SCALE_INTERVAL):
+        self.manager = manager or QueueManager()
+        self.interval = interval
+        self._quiet_polls = {}
+
+    def desired_workers(self, depth, current, minimum, maximum, port):
+        wanted = min(max(math.ceil(depth / JOBS_PER_WORKER), minimum), maximum)
+        if wanted >= current:
+            self._quiet_polls[port] = 0
+            return wanted
+        self._quiet_polls[port] = self._quiet_polls.get(port, 0) + 1
+        if self._quiet_polls[port] >= SCALE_DOWN_AFTER:
+            self._quiet_polls[port] = 0
+            return current - 1
+        return current
+
+    def poll(self):
+        """One scaling pass over all active sites with workers"""
+        registry = get_registry()
+        for site in registry.list_sites(status='active'):
+            if not site.get('queue_max'):
+                continue
+            depth = self.manager.queue_depth(site['project_path'], site.get('redis_db'))
+            registry.update_site(site['port'], queue_depth=depth)
+            if depth is None:
+                continue
+            current = site.get('queue_workers') or 0
+            wanted = self.desired_workers(depth, current, site['queue_min'] or 0, site['queue_max'], site['port'])
+            if wanted != current:
+                print(f"⚖️ Queue workers for {site['project_name']}: {current} -> {wanted} (depth {depth})")
+                self.manager.scale(site['project_name'], site['port'], wanted)
+
+    def start(self):
+        """Poll and scale periodically in the background"""
+        def loop():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.poll()
+                except Exception as e:
+                    print(f"⚠️ Queue autoscaling pass failed: {e}")
+
+        threading.Thread(target=loop, daemon=True, name='queue-autoscaler').start()
+
+
+_autoscaler = None
+_autoscaler_lock = threading.Lock()
+
+
+def get_queue_autoscaler():
+    """Return the process-wide queue autoscaler"""
+    global _autoscaler
+    if _autoscaler is None:
+        with _autoscaler_lock:
+            if _autoscaler is None:
+                _autoscaler = QueueAutoscaler()
+    return _autoscaler
@@ -0,0 +1,100 @@
+import os
+from site_registry import get_registry
+from lock_manager import get_lock_manager
+from command_runner import run_command
+
+REDIS_HOST = os.environ.get('AUTO_HOSTING_REDIS_HOST', '127.0.0.1')
+REDIS_PORT = os.environ.get('AUTO_HOSTING_REDIS_PORT', '6379')
+REDIS_PASSWORD = os.environ.get('AUTO_HOSTING_REDIS_PASSWORD', '')
+
+
+class RedisManager:
+    """Provisions per-site Redis databases on the local Redis server
+
+    Each site gets two logical databases: one for sessions and queues and
+    one for the cache, so `php artisan cache:clear` (a FLUSHDB on the cache
+    connection) neither logs users out nor touches other sites. Database 0
+    is left for anything not managed here.
+    """
+
+    def _cli(self, *args, check=True):
+        # The password goes through the environment, never argv (visible to every local user)
+        env = dict(os.environ)
+        env.pop('REDISCLI_AUTH', None)
+        if REDIS_PASSWORD:
+            env['REDISCLI_AUTH'] = REDIS_PASSWORD
+        return run_command(['redis-cli', '-h', REDIS_HOST, '-p', REDIS_PORT] + list(args), env=env, echo=False,
+                           check=check)
+
+    def ensure_redis(self):
+        """Make sure Redis is running and PHP has the redis extension"""
+        if self._cli('PING', check=False).stdout.strip() != 'PONG':
+            print("📦 Installing Redis...")
+            run_command(['apt', 'install', '-y', 'redis-server'], check=True)
+            run_command(['systemctl', 'enable', '--now', 'redis-server'], check=True)
+            if self._cli('PING', check=False).stdout.strip() != 'PONG':
+                raise Exception("Redis is not responding")
+
+        modules = run_command(['php', '-m'], echo=False, check=False).stdout.split()
+        if 'redis' not in modules:
+            print("📦 Installing PHP redis extension...")
+            run_command(['apt', 'install', '-y', 'php-redis'], check=True)
+
+    def _database_count(self):
+        result = self._cli('CONFIG', 'GET', 'databases', check=False)
+        lines = result.stdout.split()
+        return int(lines[1]) if len(lines) > 1 and lines[1].isdigit() else 16
+
+    def setup_redis(self, port):
+        """Allocate (or reuse) the site's databases and return them as (db, cache_db)"""
+        self.ensure_redis()
+        registry = get_registry()
+
+        with get_lock_manager().lock('redis'):
+            site = registry.get_site(port) or {}
+            if site.get('redis_db') is not None and site.get('redis_cache_db') is not None:
+                return site['redis_db'], site['redis_cache_db']
+
+            used = set()
+            for other in registry.list_sites():
+                used.update(db for db in (other.get('redis_db'), other.get('redis_cache_db')) if db is not None)
+            free = [db for db in range(1, self._database_count()) if db not in used]
+            if len(free) < 2:
+                raise Exception("No free Redis databases left; raise `databases` in /etc/redis/redis.conf")
+
+            redis_db, redis_cache_db = free[0], free[1]
+            # Start from empty databases (they may hold data from a removed site)
+            self._cli('-n', str(redis_db), 'FLUSHDB')
+            self._cli('-n', str(redis_cache_db), 'FLUSHDB')
+            registry.update_site(port, redis_db=redis_db, redis_cache_db=redis_cache_db)
+
+        print(f"✅ Redis databases {redis_db} (sessions/queue) and {redis_cache_db} (cache) ready")
+        return redis_db, redis_cache_db
+
+    def env_settings(self, project_name, redis_db, redis_cache_db):
+        """.env settings that move cache, sessions and queues to the site's Redis databases"""
+        return {
+            'CACHE_DRIVER': 'redis',
+            'CACHE_STORE': 'redis',
+            'SESSION_DRIVER': 'redis',
+            'QUEUE_CONNECTION': 'redis',
+            'REDIS_CLIENT': 'phpredis',
+            'REDIS_HOST': REDIS_HOST,
+            'REDIS_PORT': REDIS_PORT,
+            'REDIS_PASSWORD': REDIS_PASSWORD or 'null',
+            'REDIS_DB': str(redis_db),
+            'REDIS_CACHE_DB': str(redis_cache_db),
+            'REDIS_PREFIX': f'{project_name}_',
+            'CACHE_PREFIX': f'{project_name}_cache_',
+        }
+
+    def cleanup_redis(self, port):
+        """Empty and release the site's databases"""
+        registry = get_registry()
+        with get_lock_manager().lock('redis'):
+            site = registry.get_site(port) or {}
+            for db in (site.get('redis_db'), site.get('redis_cache_db')):
+                if db is not None:
+                    self._cli('-n', str(db), 'FLUSHDB', check=False)
+            if site:
+                registry.update_site(port, redis_db=None, redis_cache_db=None)
@@ -0,0 +1,115 @@
+import os
+
+# Memory kept back for MySQL, Redis, nginx and the control plane
+RESERVED_MB = int(os.environ.get('AUTO_HOSTING_RESERVED_MB', 1024))
+# Optional hard CPU cap per site, in percent of one CPU (e.g. 200 = two CPUs)
+SITE_CPU_QUOTA = os.environ.get('AUTO_HOSTING_SITE_CPU_QUOTA')
+# Per-worker memory assumed until a worker has been measured after warm-up
+DEFAULT_WORKER_MB = 48
+
+APP_DIRS = ('app', 'bootstrap', 'config', 'database', 'routes', 'vendor')
+
+
+def host_resources():
+    """(total memory in MB, CPU count) of this host"""
+    total_mb = 2048
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    total_mb = int(line.split()[1]) // 1024
+                    break
+    except (OSError, ValueError):
+        pass
+    return total_mb, os.cpu_count() or 1
+
+
+def app_footprint(project_path):
+    """Number and total size of the PHP files an app can load"""
+    files = size = 0
+    for name in APP_DIRS:
+        for root, _, filenames in os.walk(os.path.join(project_path, name)):
+            for filename in filenames:
+                if filename.endswith('.php'):
+                    files += 1
+                    try:
+                        size += os.path.getsize(os.path.join(root, filename))
+                    except OSError:
+                        pass
+    return {'php_files': files, 'php_bytes': size}
+
+
+def process_pss_kb(pid):
+    """Proportional set size of a process (shared pages split between sharers)"""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def pool_worker_pss_kb(pool_name):
+    """Mean PSS of the worker processes of an FPM pool, or None if none are running"""
+    sizes = []
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                cmdline = f.read().replace(b'\0', b' ').decode('utf-8', 'replace').strip()
+        except OSError:
+            continue
+        if cmdline == f'php-fpm: pool {pool_name}':
+            pss = process_pss_kb(pid)
+            if pss:
+                sizes.append(pss)
+    return sum(sizes) // len(sizes) if sizes else None
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def plan_site(footprint, worker_kb, site_count, total_mb=None, cpus=None, replicas=1):
+    """FPM, OPcache and slice settings for one of `site_count` sites sharing this host
+
+    A site with several FPM replicas shares its budget between them: the pm.*
+    values are per replica, and each replica's master has its own OPcache.
+    """
+    if total_mb is None or cpus is None:
+        total_mb, cpus = host_resources()
+    reserved_mb = max(RESERVED_MB, total_mb // 5)
+    budget_mb = max(128, (total_mb - reserved_mb) // max(1, site_count))
+
+    # OPcache: room for the compiled code (about 2.5x the source) plus headroom
+    php_files = footprint.get('php_files') or 0
+    php_mb = (footprint.get('php_bytes') or 0) / (1024 * 1024)
+    opcache_mb = int(_clamp(php_mb * 2.5 + 32, 64, 512))
+    max_files = int(_clamp(php_files * 1.3, 10000, 1000000))
+    realpath_kb = int(_clamp(php_files * 0.25, 1024, 16384))
+
+    # Workers: what fits in the budget after OPcache, but no more than the CPUs can keep busy
+    replicas = max(1, int(replicas or 1))
+    worker_mb = max(16, (worker_kb or DEFAULT_WORKER_MB * 1024) / 1024)
+    total_children = _clamp((budget_mb - opcache_mb * replicas) * 0.9 / worker_mb, 2, max(4, cpus * 4))
+    max_children = max(2, int(total_children // replicas))
+
+    settings = {
+        'budget_mb': budget_mb,
+        'replicas': replicas,
+        'worker_mb': round(worker_mb, 1),
+        'pm_max_children': max_children,
+        'pm_start_servers': max(1, max_children // 4),
+        'pm_min_spare_servers': max(1, max_children // 4),
+        'pm_max_spare_servers': max(2, max_children // 2),
+        'opcache_memory_mb': opcache_mb,
+        'opcache_max_accelerated_files': max_files,
+        'realpath_cache_kb': realpath_kb,
+        'memory_high_mb': budget_mb,
+        'memory_max_mb': int(budget_mb * 1.25),
+        'cpu_weight': 100,
+    }
+    if SITE_CPU_QUOTA:
+        settings['cpu_quota_percent'] = int(SITE_CPU_QUOTA)
+    return settings
@@ -1,339 +1,624 @@
-import subprocess
-import os
-
-class ServiceManager:
-    def __init__(self):
-        self.php_service = self._detect_available_php()
-        self.php_socket = self._get_php_socket()
-    
-    def _detect_available_php(self):
-        """Detect available PHP-FPM service"""
-        php_versions = ['php8.2-fpm', 'php8.1-fpm', 'php8.0-fpm', 'php7.4-fpm']
-        
-        for php_service in php_versions:
-            try:
-                # Check if service exists
-                result = subprocess.run(['systemctl', 'list-units', '--type=service', '--all'], 
-                                      capture_output=True, text=True, check=False)
-                if php_service in result.stdout:
-                    print(f"✅ Found PHP service: {php_service}")
-                    return php_service
-                
-                # Check if package is available for install
-                result = subprocess.run(['apt', 'list', php_service], 
-                                      capture_output=True, text=True, check=False)
-                if php_service in result.stdout and 'installed' not in result.stdout:
-                    print(f"✅ PHP package available: {php_service}")
-                    return php_service
-                    
-            except:
-                continue
-        
-        # Default fallback
-        return 'php8.1-fpm'
-    
-    def _get_php_socket(self):
-        """Get corresponding PHP socket path"""
-        socket_map = {
-            'php8.2-fpm': '/var/run/php/php8.2-fpm.sock',
-            'php8.1-fpm': '/var/run/php/php8.1-fpm.sock',
-            'php8.0-fpm': '/var/run/php/php8.0-fpm.sock', 
-            'php7.4-fpm': '/var/run/php/php7.4-fpm.sock'
-        }
-        return socket_map.get(self.php_service, '/var/run/php/php8.1-fpm.sock')
-    
-    def restart_services(self):
-        """Restart system services"""
-        self._stop_apache()
-        self._stop_conflicting_php()
-        self._ensure_php_installed()
-        self._manage_php_fpm()
-        self._manage_nginx()
-        print("✅ Services restarted successfully")
-    
-    def _stop_conflicting_php(self):
-        """Stop other PHP versions"""
-        conflicting_services = ['php8.2-fpm', 'php8.1-fpm', 'php7.4-fpm', 'php8.0-fpm']
-        # Remove current service from conflicts
-        if self.php_service in conflicting_services:
-            conflicting_services.remove(self.php_service)
-        
-        for service in conflicting_services:
-            try:
-                subprocess.run(['systemctl', 'stop', service], check=False)
-                subprocess.run(['systemctl', 'disable', service], check=False)
-                print(f"✅ Stopped conflicting service: {service}")
-            except:
-                pass
-    
-    def _ensure_php_installed(self):
-        """Ensure PHP FPM is installed"""
-        try:
-            # Check if service already exists
-            result = subprocess.run(['systemctl', 'status', self.php_service], 
-                                  capture_output=True, check=False)
-            
-            if result.returncode == 0:
-                print(f"✅ {self.php_service} already exists")
-                return True
-            
-            # Try to install the PHP version
-            print(f"📦 Installing {self.php_service}...")
-            
-            # Update package list first
-            subprocess.run(['apt', 'update'], check=False)
-            
-            # Install PHP-FPM
-            install_result = subprocess.run(['apt', 'install', '-y', self.php_service], 
-                                          capture_output=True, text=True, check=False)
-            
-            if install_result.returncode == 0:
-                subprocess.run(['systemctl', 'enable', self.php_service], check=True)
-                print(f"✅ {self.php_service} installed and enabled")
-                return True
-            else:
-                print(f"⚠️ Could not install {self.php_service}: {install_result.stderr}")
-                # Try to find any working PHP version
-                return self._find_working_php()
-                
-        except Exception as e:
-            print(f"⚠️ Could not ensure PHP installation: {e}")
-            return self._find_working_php()
-    
-    def _find_working_php(self):
-        """Find any working PHP-FPM service"""
-        php_versions = ['php8.1-fpm', 'php8.0-fpm', 'php7.4-fpm']
-        
-        for php_service in php_versions:
-            try:
-                result = subprocess.run(['systemctl', 'status', php_service], 
-                                      capture_output=True, check=False)
-                if result.returncode == 0 or 'loaded' in result.stdout.decode():
-                    self.php_service = php_service
-                    self.php_socket = self._get_php_socket()
-                    print(f"✅ Using existing PHP service: {php_service}")
-                    return True
-            except:
-                continue
-        
-        print("❌ No working PHP-FPM service found")
-        return False
-    
-    def _manage_php_fpm(self):
-        """Manage PHP-FPM service"""
-        try:
-            # Fix PHP-FPM issues first
-            self._fix_php_fpm_issues()
-            
-            # Try to start PHP-FPM
-            result = subprocess.run(['systemctl', 'start', self.php_service], 
-                                   capture_output=True, text=True, check=False)
-            
-            if result.returncode == 0:
-                print(f"✅ {self.php_service} started successfully")
-            else:
-                print(f"⚠️ {self.php_service} start failed: {result.stderr}")
-                # Try restart
-                result = subprocess.run(['systemctl', 'restart', self.php_service], 
-                                       capture_output=True, text=True, check=False)
-                
-                if result.returncode == 0:
-                    print(f"✅ {self.php_service} restarted successfully")
-                else:
-                    print(f"❌ {self.php_service} restart failed: {result.stderr}")
-                    # Don't raise exception, continue with deployment
-                    print("⚠️ Continuing deployment without PHP-FPM restart")
-                    return
-            
-            # Wait for socket creation and fix permissions
-            import time
-            time.sleep(3)
-            self._fix_socket_permissions()
-                
-        except Exception as e:
-            print(f"⚠️ PHP-FPM management failed: {e}")
-    
-    def _fix_socket_permissions(self):
-        """Fix socket permissions specifically"""
-        if os.path.exists(self.php_socket):
-            subprocess.run(['chmod', '666', self.php_socket], check=False)
-            subprocess.run(['chown', 'www-data:www-data', self.php_socket], check=False)
-            print(f"✅ Fixed permissions for {self.php_socket}")
-            
-            # Test socket is writable
-            try:
-                result = subprocess.run(['sudo', '-u', 'www-data', 'test', '-w', self.php_socket], 
-                                      check=False)
-                if result.returncode == 0:
-                    print(f"✅ Socket {self.php_socket} is writable by www-data")
-                else:
-                    print(f"⚠️ Socket {self.php_socket} not writable by www-data")
-            except:
-                pass
-        else:
-            print(f"⚠️ Socket {self.php_socket} not found")
-    
-    def _fix_php_fpm_issues(self):
-        """Fix common PHP-FPM issues"""
-        try:
-            # Create missing directories
-            subprocess.run(['mkdir', '-p', '/var/run/php'], check=False)
-            subprocess.run(['chown', 'www-data:www-data', '/var/run/php'], check=False)
-            
-            # Kill any hanging processes
-            subprocess.run(['pkill', '-f', 'php-fpm'], check=False)
-            
-            # Wait a moment
-            import time
-            time.sleep(1)
-            
-        except Exception as e:
-            print(f"⚠️ Could not fix all PHP-FPM issues: {e}")
-    
-    def get_php_socket(self):
-        """Get current PHP socket path for nginx config"""
-        return self.php_socket
-    
-    def _stop_apache(self):
-        """Stop Apache to prevent port conflicts"""
-        try:
-            subprocess.run(['systemctl', 'stop', 'apache2'], check=False)
-            subprocess.run(['systemctl', 'disable', 'apache2'], check=False)
-            print("✅ Apache stopped and disabled")
-        except Exception as e:
-            print(f"⚠️ Could not stop Apache: {e}")
-    
-    def _manage_nginx(self):
-        """Manage Nginx service"""
-        try:
-            # Test nginx config first before any reload/restart
-            self._test_and_fix_nginx_config()
-            
-            # Check if nginx is running
-            status_result = subprocess.run(['systemctl', 'is-active', 'nginx'], 
-                                         capture_output=True, text=True, check=False)
-            
-            if status_result.stdout.strip() == 'active':
-                # Nginx is running, try reload first
-                result = subprocess.run(['systemctl', 'reload', 'nginx'], 
-                                       capture_output=True, text=True, check=False)
-                if result.returncode == 0:
-                    print("✅ Nginx reloaded successfully")
-                    return
-                else:
-                    print(f"⚠️ Nginx reload failed: {result.stderr}")
-            
-            # Start nginx
-            result = subprocess.run(['systemctl', 'start', 'nginx'], 
-                                   capture_output=True, text=True, check=False)
-            
-            if result.returncode == 0:
-                print("✅ Nginx started successfully")
-            else:
-                print(f"⚠️ Nginx start failed: {result.stderr}")
-                # Try restart
-                result = subprocess.run(['systemctl', 'restart', 'nginx'], 
-                                       capture_output=True, text=True, check=False)
-                if result.returncode == 0:
-                    print("✅ Nginx restarted successfully")
-                else:
-                    print(f"❌ Nginx restart failed: {result.stderr}")
-                    # Force clean restart
-                    self._force_nginx_restart()
-                
-        except Exception as e:
-            print(f"⚠️ Nginx management failed: {e}")
-            self._force_nginx_restart()
-    
-    def _test_and_fix_nginx_config(self):
-        """Test nginx config and fix if needed"""
-        try:
-            result = subprocess.run(['nginx', '-t'], capture_output=True, text=True, check=False)
-            
-            if result.returncode != 0:
-                print(f"⚠️ Nginx config has issues: {result.stderr}")
-                
-                # Check for common issues and fix
-                if "conflicting server name" in result.stderr:
-                    self._fix_conflicting_server_names()
-                
-                if "failed" in result.stderr.lower():
-                    self._emergency_nginx_fix()
-                    
-        except Exception as e:
-            print(f"⚠️ Could not test nginx config: {e}")
-    
-    def _fix_conflicting_server_names(self):
-        """Fix conflicting server names"""
-        try:
-            print("🔧 Fixing conflicting server names...")
-            
-            # List all enabled sites
-            enabled_dir = '/etc/nginx/sites-enabled'
-            if os.path.exists(enabled_dir):
-                sites = os.listdir(enabled_dir)
-                print(f"Found enabled sites: {sites}")
-                
-                # Keep only the latest port-based config
-                port_configs = [s for s in sites if s.startswith('port_')]
-                old_configs = [s for s in sites if not s.startswith('port_') and s != 'default']
-                
-                # Remove old configs
-                for config in old_configs:
-                    config_path = os.path.join(enabled_dir, config)
-                    if os.path.exists(config_path):
-                        os.remove(config_path)
-                        print(f"✓ Removed conflicting config: {config}")
-            
-        except Exception as e:
-            print(f"⚠️ Could not fix conflicting server names: {e}")
-    
-    def _emergency_nginx_fix(self):
-        """Emergency nginx fix - disable all sites and enable only working ones"""
-        try:
-            print("🚨 Emergency nginx fix...")
-            
-            # Disable all sites
-            enabled_dir = '/etc/nginx/sites-enabled'
-            if os.path.exists(enabled_dir):
-                for site in os.listdir(enabled_dir):
-                    site_path = os.path.join(enabled_dir, site)
-                    if os.path.exists(site_path):
-                        os.remove(site_path)
-                        print(f"✓ Disabled site: {site}")
-            
-            # Test if nginx config is now valid
-            result = subprocess.run(['nginx', '-t'], capture_output=True, text=True, check=False)
-            if result.returncode == 0:
-                print("✅ Emergency fix successful - nginx config now valid")
-            else:
-                print("❌ Emergency fix failed - nginx still has issues")
-                
-        except Exception as e:
-            print(f"❌ Emergency fix failed: {e}")
-    
-    def _force_nginx_restart(self):
-        """Force nginx restart with clean config"""
-        try:
-            print("🔧 Force restarting nginx...")
-            
-            # Stop nginx
-            subprocess.run(['systemctl', 'stop', 'nginx'], check=False)
-            
-            # Kill any remaining nginx processes
-            subprocess.run(['pkill', '-f', 'nginx'], check=False)
-            
-            # Emergency config cleanup
-            self._emergency_nginx_fix()
-            
-            # Start nginx
-            result = subprocess.run(['systemctl', 'start', 'nginx'], 
-                                   capture_output=True, text=True, check=False)
-            
-            if result.returncode == 0:
-                print("✅ Force restart successful")
-            else:
-                print(f"❌ Force restart failed: {result.stderr}")
-                
-        except Exception as e:
-            print(f"❌ Force restart failed: {e}")
+import os
+import socket
+import time
+from command_runner import run_command
+from site_registry import get_registry
+from lock_manager import get_lock_manager
+from resource_tuner import app_footprint, plan_site, pool_worker_pss_kb, host_resources
+from site_health import FPM_STATUS_PATH
+
+SITE_CONFIG_DIR = '/etc/auto-hosting/fpm'
+UNIT_DIR = '/etc/systemd/system'
+MAX_REPLICAS = int(os.environ.get('AUTO_HOSTING_MAX_REPLICAS', 8))
+# Seconds a drained replica gets for nginx to stop sending it new requests, and for in-flight ones
+DRAIN_SECONDS = float(os.environ.get('AUTO_HOSTING_DRAIN_SECONDS', 2))
+FPM_STOP_TIMEOUT = int(os.environ.get('AUTO_HOSTING_FPM_STOP_TIMEOUT', 60))
+
+SLICE_TEMPLATE = """[Unit]
+Description=Resources of {project_name}
+
+[Slice]
+CPUWeight={cpu_weight}
+{cpu_quota}MemoryHigh={memory_high_mb}M
+MemoryMax={memory_max_mb}M
+"""
+
+# {instance} is the project name for the first replica and <project>-r<n> for the others;
+# every replica's pool is named after the project, so its workers are measured together
+FPM_POOL_TEMPLATE = """[global]
+pid = /run/laravel-fpm-{instance}/fpm.pid
+error_log = syslog
+syslog.ident = php-fpm-{instance}
+daemonize = no
+process_control_timeout = {stop_timeout}s
+
+[{project_name}]
+user = www-data
+group = www-data
+listen = /run/laravel-fpm-{instance}/fpm.sock
+listen.owner = www-data
+listen.group = www-data
+listen.mode = 0660
+pm = dynamic
+pm.max_children = {pm_max_children}
+pm.start_servers = {pm_start_servers}
+pm.min_spare_servers = {pm_min_spare_servers}
+pm.max_spare_servers = {pm_max_spare_servers}
+pm.max_requests = 500
+pm.status_path = {status_path}
+"""
+
+# OPcache and realpath cache sizes are fixed when the master starts, so they go on its command line.
+# SIGQUIT stops the master gracefully: workers finish their requests first
+FPM_UNIT_TEMPLATE = """[Unit]
+Description=PHP-FPM for {project_name} (replica {replica})
+After=network.target
+
+[Service]
+Type=notify
+Slice=auto-hosting-{project_name}.slice
+RuntimeDirectory=laravel-fpm-{instance}
+RuntimeDirectoryMode=0755
+ExecStart={fpm_binary} --nodaemonize --fpm-config {pool_path} -d opcache.enable=1 -d opcache.memory_consumption={opcache_memory_mb} -d opcache.max_accelerated_files={opcache_max_accelerated_files} -d opcache.interned_strings_buffer=16 -d opcache.validate_timestamps=0 -d realpath_cache_size={realpath_cache_kb}K -d realpath_cache_ttl=600
+ExecReload=/bin/kill -USR2 $MAINPID
+KillSignal=SIGQUIT
+TimeoutStopSec={stop_timeout}
+Restart=always
+
+[Install]
+WantedBy=multi-user.target
+"""
+
+class ServiceManager:
+    def __init__(self):
+        self.php_service = self._detect_available_php()
+        self.php_socket = self._get_php_socket()
+    
+    def _detect_available_php(self):
+        """Detect available PHP-FPM service"""
+        php_versions = ['php8.2-fpm', 'php8.1-fpm', 'php8.0-fpm', 'php7.4-fpm']
+        
+        for php_service in php_versions:
+            try:
+                # Check if service exists
+                result = run_command(['systemctl', 'list-units', '--type=service', '--all'], 
+                                      echo=False, check=False)
+                if php_service in result.stdout:
+                    print(f"✅ Found PHP service: {php_service}")
+                    return php_service
+                
+                # Check if package is available for install
+                result = run_command(['apt', 'list', php_service], 
+                                      echo=False, check=False)
+                if php_service in result.stdout and 'installed' not in result.stdout:
+                    print(f"✅ PHP package available: {php_service}")
+                    return php_service
+                    
+            except:
+                continue
+        
+        # Default fallback
+        return 'php8.1-fpm'
+    
+    def _get_php_socket(self):
+        """Get corresponding PHP socket path"""
+        socket_map = {
+            'php8.2-fpm': '/var/run/php/php8.2-fpm.sock',
+            'php8.1-fpm': '/var/run/php/php8.1-fpm.sock',
+            'php8.0-fpm': '/var/run/php/php8.0-fpm.sock', 
+            'php7.4-fpm': '/var/run/php/php7.4-fpm.sock'
+        }
+        return socket_map.get(self.php_service, '/var/run/php/php8.1-fpm.sock')
+    
+    def restart_services(self):
+        """Restart system services"""
+        self._stop_apache()
+        self._stop_conflicting_php()
+        self._ensure_php_installed()
+        self._manage_php_fpm()
+        self._manage_nginx()
+        print("✅ Services restarted successfully")
+    
+    def _stop_conflicting_php(self):
+        """Stop other PHP versions"""
+        conflicting_services = ['php8.2-fpm', 'php8.1-fpm', 'php7.4-fpm', 'php8.0-fpm']
+        # Remove current service from conflicts
+        if self.php_service in conflicting_services:
+            conflicting_services.remove(self.php_service)
+        
+        for service in conflicting_services:
+            try:
+                run_command(['systemctl', 'stop', service], check=False)
+                run_command(['systemctl', 'disable', service], check=False)
+                print(f"✅ Stopped conflicting service: {service}")
+            except:
+                pass
+    
+    def _ensure_php_installed(self):
+        """Ensure PHP FPM is installed"""
+        try:
+            # Check if service already exists
+            result = run_command(['systemctl', 'status', self.php_service], 
+                                  echo=False, check=False)
+            
+            if result.returncode == 0:
+                print(f"✅ {self.php_service} already exists")
+                return True
+            
+            # Try to install the PHP version
+            print(f"📦 Installing {self.php_service}...")
+            
+            # Update package list first
+            run_command(['apt', 'update'], check=False)
+            
+            # Install PHP-FPM
+            install_result = run_command(['apt', 'install', '-y', self.php_service], 
+                                          echo=False, check=False)
+            
+            if install_result.returncode == 0:
+                run_command(['systemctl', 'enable', self.php_service], check=True)
+                print(f"✅ {self.php_service} installed and enabled")
+                return True
+            else:
+                print(f"⚠️ Could not install {self.php_service}: {install_result.stderr}")
+                # Try to find any working PHP version
+                return self._find_working_php()
+                
+        except Exception as e:
+            print(f"⚠️ Could not ensure PHP installation: {e}")
+            return self._find_working_php()
+    
+    def _find_working_php(self):
+        """Find any working PHP-FPM service"""
+        php_versions = ['php8.1-fpm', 'php8.0-fpm', 'php7.4-fpm']
+        
+        for php_service in php_versions:
+            try:
+                result = run_command(['systemctl', 'status', php_service], 
+                                      echo=False, check=False)
+                if result.returncode == 0 or 'loaded' in result.stdout:
+                    self.php_service = php_service
+                    self.php_socket = self._get_php_socket()
+                    print(f"✅ Using existing PHP service: {php_service}")
+                    return True
+            except:
+                continue
+        
+        print("❌ No working PHP-FPM service found")
+        return False
+    
+    def _manage_php_fpm(self):
+        """Manage PHP-FPM service"""
+        try:
+            # Fix PHP-FPM issues first
+            self._fix_php_fpm_issues()
+            
+            # Try to start PHP-FPM
+            result = run_command(['systemctl', 'start', self.php_service], 
+                                   echo=False, check=False)
+            
+            if result.returncode == 0:
+                print(f"✅ {self.php_service} started successfully")
+            else:
+                print(f"⚠️ {self.php_service} start failed: {result.stderr}")
+                # Try restart
+                result = run_command(['systemctl', 'restart', self.php_service], 
+                                       echo=False, check=False)
+                
+                if result.returncode == 0:
+                    print(f"✅ {self.php_service} restarted successfully")
+                else:
+                    print(f"❌ {self.php_service} restart failed: {result.stderr}")
+                    # Don't raise exception, continue with deployment
+                    print("⚠️ Continuing deployment without PHP-FPM restart")
+                    return
+            
+            # Wait for socket creation and fix permissions
+            import time
+            time.sleep(3)
+            self._fix_socket_permissions()
+                
+        except Exception as e:
+            print(f"⚠️ PHP-FPM management failed: {e}")
+    
+    def _fix_socket_permissions(self):
+        """Fix socket permissions specifically"""
+        if os.path.exists(self.php_socket):
+            run_command(['chmod', '666', self.php_socket], check=False)
+            run_command(['chown', 'www-data:www-data', self.php_socket], check=False)
+            print(f"✅ Fixed permissions for {self.php_socket}")
+            
+            # Test socket is writable
+            try:
+                result = run_command(['sudo', '-u', 'www-data', 'test', '-w', self.php_socket], 
+                                      check=False)
+                if result.returncode == 0:
+                    print(f"✅ Socket {self.php_socket} is writable by www-data")
+                else:
+                    print(f"⚠️ Socket {self.php_socket} not writable by www-data")
+            except:
+                pass
+        else:
+            print(f"⚠️ Socket {self.php_socket} not found")
+    
+    def _fix_php_fpm_issues(self):
+        """Fix common PHP-FPM issues"""
+        try:
+            # Create missing directories
+            run_command(['mkdir', '-p', '/var/run/php'], check=False)
+            run_command(['chown', 'www-data:www-data', '/var/run/php'], check=False)
+            
+            # Kill any hanging processes of the shared service (per-site instances are left alone)
+            run_command(['pkill', '-f', 'php-fpm: master process \\(/etc/php/'], check=False)
+            
+            # Wait a moment
+            import time
+            time.sleep(1)
+            
+        except Exception as e:
+            print(f"⚠️ Could not fix all PHP-FPM issues: {e}")
+    
+    def get_php_socket(self):
+        """Get current PHP socket path for nginx config"""
+        return self.php_socket
+    
+    def _stop_apache(self):
+        """Stop Apache to prevent port conflicts"""
+        try:
+            run_command(['systemctl', 'stop', 'apache2'], check=False)
+            run_command(['systemctl', 'disable', 'apache2'], check=False)
+            print("✅ Apache stopped and disabled")
+        except Exception as e:
+            print(f"⚠️ Could not stop Apache: {e}")
+    
+    def _manage_nginx(self):
+        """Manage Nginx service"""
+        try:
+            # Test nginx config first before any reload/restart
+            self._test_and_fix_nginx_config()
+            
+            # Check if nginx is running
+            status_result = run_command(['systemctl', 'is-active', 'nginx'], 
+                                         echo=False, check=False)
+            
+            if status_result.stdout.strip() == 'active':
+                # Nginx is running, try reload first
+                result = run_command(['systemctl', 'reload', 'nginx'], 
+                                       echo=False, check=False)
+                if result.returncode == 0:
+                    print("✅ Nginx reloaded successfully")
+                    return
+                else:
+                    print(f"⚠️ Nginx reload failed: {result.stderr}")
+            
+            # Start nginx
+            result = run_command(['systemctl', 'start', 'nginx'], 
+                                   echo=False, check=False)
+            
+            if result.returncode == 0:
+                print("✅ Nginx started successfully")
+            else:
+                print(f"⚠️ Nginx start failed: {result.stderr}")
+                # Try restart
+                result = run_command(['systemctl', 'restart', 'nginx'], 
+                                       echo=False, check=False)
+                if result.returncode == 0:
+                    print("✅ Nginx restarted successfully")
+                else:
+                    print(f"❌ Nginx restart failed: {result.stderr}")
+                    # Force clean restart
+                    self._force_nginx_restart()
+                
+        except Exception as e:
+            print(f"⚠️ Nginx management failed: {e}")
+            self._force_nginx_restart()
+    
+    def _test_and_fix_nginx_config(self):
+        """Test nginx config and fix if needed"""
+        try:
+            result = run_command(['nginx', '-t'], echo=False, check=False)
+            
+            if result.returncode != 0:
+                print(f"⚠️ Nginx config has issues: {result.stderr}")
+                
+                # Check for common issues and fix
+                if "conflicting server name" in result.stderr:
+                    self._fix_conflicting_server_names()
+                
+                if "failed" in result.stderr.lower():
+                    self._emergency_nginx_fix()
+                    
+        except Exception as e:
+            print(f"⚠️ Could not test nginx config: {e}")
+    
+    def _fix_conflicting_server_names(self):
+        """Fix conflicting server names"""
+        try:
+            print("🔧 Fixing conflicting server names...")
+            
+            # List all enabled sites
+            enabled_dir = '/etc/nginx/sites-enabled'
+            if os.path.exists(enabled_dir):
+                sites = os.listdir(enabled_dir)
+                print(f"Found enabled sites: {sites}")
+                
+                # Keep only the latest port-based config
+                port_configs = [s for s in sites if s.startswith('port_')]
+                old_configs = [s for s in sites if not s.startswith('port_') and s != 'default']
+                
+                # Remove old configs
+                for config in old_configs:
+                    config_path = os.path.join(enabled_dir, config)
+                    if os.path.exists(config_path):
+                        os.remove(config_path)
+                        print(f"✓ Removed conflicting config: {config}")
+            
+        except Exception as e:
+            print(f"⚠️ Could not fix conflicting server names: {e}")
+    
+    def _emergency_nginx_fix(self):
+        """Emergency nginx fix - disable all sites and enable only working ones"""
+        try:
+            print("🚨 Emergency nginx fix...")
+            
+            # Disable all sites
+            enabled_dir = '/etc/nginx/sites-enabled'
+            if os.path.exists(enabled_dir):
+                for site in os.listdir(enabled_dir):
+                    site_path = os.path.join(enabled_dir, site)
+                    if os.path.exists(site_path):
+                        os.remove(site_path)
+                        print(f"✓ Disabled site: {site}")
+            
+            # Test if nginx config is now valid
+            result = run_command(['nginx', '-t'], echo=False, check=False)
+            if result.returncode == 0:
+                print("✅ Emergency fix successful - nginx config now valid")
+            else:
+                print("❌ Emergency fix failed - nginx still has issues")
+                
+        except Exception as e:
+            print(f"❌ Emergency fix failed: {e}")
+    
+    def _force_nginx_restart(self):
+        """Force nginx restart with clean config"""
+        try:
+            print("🔧 Force restarting nginx...")
+            
+            # Stop nginx
+            run_command(['systemctl', 'stop', 'nginx'], check=False)
+            
+            # Kill any remaining nginx processes
+            run_command(['pkill', '-f', 'nginx'], check=False)
+            
+            # Emergency config cleanup
+            self._emergency_nginx_fix()
+            
+            # Start nginx
+            result = run_command(['systemctl', 'start', 'nginx'], 
+                                   echo=False, check=False)
+            
+            if result.returncode == 0:
+                print("✅ Force restart successful")
+            else:
+                print(f"❌ Force restart failed: {result.stderr}")
+                
+        except Exception as e:
+            print(f"❌ Force restart failed: {e}")
+    
+    # Per-site runtimes: FPM masters (one per replica) in the site's own systemd slice
+    
+    def slice_name(self, project_name):
+        return f'auto-hosting-{project_name}.slice'
+    
+    def _instance(self, project_name, replica=1):
+        return project_name if replica == 1 else f'{project_name}-r{replica}'
+    
+    def fpm_service_name(self, project_name, replica=1):
+        return f'laravel-fpm-{self._instance(project_name, replica)}.service'
+    
+    def site_socket(self, project_name, replica=1):
+        """FPM socket of one of a site's own FPM instances"""
+        return f'/run/laravel-fpm-{self._instance(project_name, replica)}/fpm.sock'
+    
+    def site_sockets(self, project_name, replicas):
+        return [self.site_socket(project_name, replica) for replica in range(1, replicas + 1)]
+    
+    def _pool_path(self, project_name, replica=1):
+        return os.path.join(SITE_CONFIG_DIR, f'{self._instance(project_name, replica)}.conf')
+    
+    def _installed_replicas(self, project_name):
+        """Replica numbers that have a unit installed"""
+        replicas = []
+        prefix = f'laravel-fpm-{project_name}'
+        for unit in os.listdir(UNIT_DIR) if os.path.isdir(UNIT_DIR) else []:
+            if unit == f'{prefix}.service':
+                replicas.append(1)
+            elif unit.startswith(f'{prefix}-r') and unit.endswith('.service') and unit[len(prefix) + 2:-8].isdigit():
+                replicas.append(int(unit[len(prefix) + 2:-8]))
+        return sorted(replicas)
+    
+    def _is_active(self, service):
+        result = run_command(['systemctl', 'is-active', service], echo=False, check=False)
+        return result.stdout.strip() == 'active'
+    
+    def _wait_for_socket(self, path, timeout=30):
+        """Wait until an FPM socket accepts connections"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(path)
+                return True
+            except OSError:
+                time.sleep(0.2)
+            finally:
+                sock.close()
+        print(f"⚠️ {path} not accepting connections after {timeout}s")
+        return False
+    
+    def _fpm_binary(self):
+        version = self.php_service.replace('php', '').replace('-fpm', '')
+        return f'/usr/sbin/php-fpm{version}'
+    
+    def _write_if_changed(self, path, content):
+        """Write a file; returns whether its content changed"""
+        if os.path.exists(path):
+            with open(path) as f:
+                if f.read() == content:
+                    return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+        return True
+    
+    def setup_site_fpm(self, project_path, project_name, port):
+        """Start the site's FPM replicas, or roll them one at a time onto the new release"""
+        registry = get_registry()
+        site = registry.get_site(port) or {}
+        tuning = site.get('tuning') or {}
+        tuning.update(app_footprint(project_path))
+        registry.update_site(port, tuning=tuning)
+        
+        # Sizes every site for the new site count; rolls this site's replicas even if unchanged
+        self.retune_sites(reload_ports={str(port)})
+        replicas = (registry.get_site(port) or {}).get('replicas') or 1
+        for replica in range(1, replicas + 1):
+            run_command(['systemctl', 'enable', self.fpm_service_name(project_name, replica)], check=False)
+        print(f"✅ PHP-FPM for {project_name}: {replicas} replica(s) on {', '.join(self.site_sockets(project_name, replicas))}")
+        return self.site_socket(project_name)
+    
+    def measure_site(self, project_name, port):
+        """Record the mean PSS of the site's FPM workers (call after warm-up)"""
+        worker_kb = pool_worker_pss_kb(project_name)
+        if worker_kb:
+            registry = get_registry()
+            tuning = (registry.get_site(port) or {}).get('tuning') or {}
+            tuning['worker_kb'] = worker_kb
+            registry.update_site(port, tuning=tuning)
+            print(f"📏 {project_name}: FPM workers use {worker_kb // 1024} MB each")
+        return worker_kb
+    
+    def retune_sites(self, reload_ports=()):
+        """Resize every site's slice, FPM pools and OPcache for the current host and site count"""
+        with get_lock_manager().lock('runtime-tuning'):
+            registry = get_registry()
+            sites = [site for site in registry.list_sites() if site['status'] in ('active', 'deploying')]
+            total_mb, cpus = host_resources()
+            units_changed = False
+            actions = []
+            rolls = []
+            
+            for site in sites:
+                tuning = site['tuning']
+                replicas = min(max(1, site.get('replicas') or 1), MAX_REPLICAS)
+                settings = plan_site(tuning, tuning.get('worker_kb'), len(sites), total_mb, cpus, replicas)
+                name = site['project_name']
+                quota = f"CPUQuota={settings['cpu_quota_percent']}%\n" if 'cpu_quota_percent' in settings else ''
+                units_changed |= self._write_if_changed(os.path.join(UNIT_DIR, self.slice_name(name)),
+                                                        SLICE_TEMPLATE.format(project_name=name, cpu_quota=quota, **settings))
+                
+                if site.get('runtime', 'fpm') == 'fpm':
+                    restart = set()
+                    reload = set()
+                    for replica in range(1, replicas + 1):
+                        instance = self._instance(name, replica)
+                        pool_path = self._pool_path(name, replica)
+                        pool_changed = self._write_if_changed(
+                            pool_path, FPM_POOL_TEMPLATE.format(project_name=name, instance=instance,
+                                                                stop_timeout=FPM_STOP_TIMEOUT,
+                                                                status_path=FPM_STATUS_PATH, **settings))
+                        unit_changed = self._write_if_changed(
+                            os.path.join(UNIT_DIR, self.fpm_service_name(name, replica)),
+                            FPM_UNIT_TEMPLATE.format(project_name=name, instance=instance, replica=replica,
+                                                     fpm_binary=self._fpm_binary(), pool_path=pool_path,
+                                                     stop_timeout=FPM_STOP_TIMEOUT, **settings))
+                        units_changed |= unit_changed
+                        if unit_changed:
+                            restart.add(replica)
+                        elif pool_changed:
+                            reload.add(replica)
+                    
+                    if str(site['port']) in reload_ports:
+                        rolls.append((site, replicas, restart))
+                    else:
+                        actions += [('restart', self.fpm_service_name(name, r)) for r in sorted(restart)]
+                        actions += [('reload-or-restart', self.fpm_service_name(name, r)) for r in sorted(reload)]
+                
+                tuning['settings'] = settings
+                registry.update_site(site['port'], tuning=tuning)
+            
+            if units_changed:
+                run_command(['systemctl', 'daemon-reload'], check=True)
+            for action, service in actions:
+                # Reload is graceful: workers finish their requests before the pool is replaced
+                run_command(['systemctl', action, service], check=False)
+            for site, replicas, restart in rolls:
+                self._roll_replicas(site, replicas, restart)
+            if actions or rolls:
+                print(f"⚖️ Retuned {len(sites)} site(s); {len(actions)} FPM instance(s) reloaded")
+    
+    def _roll_replicas(self, site, replicas, restart):
+        """Bring a site's replicas onto the current release one at a time
+        
+        New replicas start first. Each running replica is then drained
+        (marked down in the nginx upstream), restarted and put back, so
+        the others keep serving. A site with a single backend is reloaded
+        in place (FPM's reload is graceful).
+        """
+        from nginx_manager import NginxManager
+        nginx_manager = NginxManager()
+        name = site['project_name']
+        drainable = replicas + len(site.get('backends') or []) > 1
+        
+        running = []
+        for replica in range(1, replicas + 1):
+            service = self.fpm_service_name(name, replica)
+            if self._is_active(service):
+                running.append(replica)
+            else:
+                run_command(['systemctl', 'enable', '--now', service], check=False)
+                self._wait_for_socket(self.site_socket(name, replica))
+        
+        for replica in running:
+            service = self.fpm_service_name(name, replica)
+            backend = f'unix:{self.site_socket(name, replica)}'
+            if drainable and nginx_manager.drain_backend(name, backend, True):
+                print(f"🔄 Rolling FPM replica {replica}/{replicas} of {name}")
+                time.sleep(DRAIN_SECONDS)
+                run_command(['systemctl', 'restart', service], check=False)
+                self._wait_for_socket(self.site_socket(name, replica))
+                nginx_manager.drain_backend(name, backend, False)
+            else:
+                run_command(['systemctl', 'restart' if replica in restart else 'reload-or-restart', service],
+                            check=False)
+                self._wait_for_socket(self.site_socket(name, replica))
+        
+        surplus = [replica for replica in self._installed_replicas(name) if replica > replicas]
+        if surplus:
+            # nginx stops routing to them before they go away
+            nginx_manager.reload()
+            for replica in surplus:
+                self._remove_replica(name, replica)
+            run_command(['systemctl', 'daemon-reload'], check=False)
+            print(f"✓ Removed {len(surplus)} surplus FPM replica(s) of {name}")
+    
+    def _remove_replica(self, project_name, replica):
+        run_command(['systemctl', 'disable', '--now', self.fpm_service_name(project_name, replica)], check=False)
+        for path in (os.path.join(UNIT_DIR, self.fpm_service_name(project_name, replica)),
+                     self._pool_path(project_name, replica)):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def remove_site_fpm(self, project_name, keep_slice=False):
+        """Stop and remove a site's FPM replicas (and, unless keep_slice, its slice)"""
+        slice_path = os.path.join(UNIT_DIR, self.slice_name(project_name))
+        with get_lock_manager().lock('runtime-tuning'):
+            replicas = self._installed_replicas(project_name)
+            if not replicas and (keep_slice or not os.path.exists(slice_path)):
+                return
+            for replica in replicas:
+                self._remove_replica(project_name, replica)
+            if not keep_slice and os.path.exists(slice_path):
+                os.remove(slice_path)
+            run_command(['systemctl', 'daemon-reload'], check=False)
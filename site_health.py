@@ -0,0 +1,306 @@
+import http.client
+import json
+import os
+import random
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from site_registry import STATE_DIR, get_registry
+
+SNAPSHOT_PATH = os.path.join(STATE_DIR, 'site_health.json')
+# A site that keeps passing is checked less and less often, one that changes state or fails
+# is checked again soon
+MIN_INTERVAL = int(os.environ.get('AUTO_HOSTING_HEALTH_MIN_INTERVAL', 15))
+MAX_INTERVAL = int(os.environ.get('AUTO_HOSTING_HEALTH_MAX_INTERVAL', 120))
+PROBE_PATH = os.environ.get('AUTO_HOSTING_HEALTH_PATH', '/')
+PROBE_TIMEOUT = 5
+PROBE_CONCURRENCY = int(os.environ.get('AUTO_HOSTING_HEALTH_CONCURRENCY', 16))
+# Responses slower than this make a site degraded
+SLOW_MS = int(os.environ.get('AUTO_HOSTING_HEALTH_SLOW_MS', 2000))
+HISTORY = 30
+TICK_SECONDS = 2
+SAVE_INTERVAL = 5
+
+# Answered by FPM itself; nginx never sends this script name (it only passes index.php)
+FPM_STATUS_PATH = '/auto-hosting-fpm-status'
+FPM_STATUS_FIELDS = {'active processes': 'active', 'idle processes': 'idle', 'total processes': 'total',
+                     'listen queue': 'listen_queue', 'max children reached': 'max_children_reached',
+                     'accepted conn': 'accepted', 'slow requests': 'slow_requests'}
+
+
+def _fcgi_record(record_type, content):
+    # version 1, request id 1, no padding
+    return struct.pack('!BBHHBx', 1, record_type, 1, len(content), 0) + content
+
+
+def _fcgi_params(params):
+    data = b''
+    for name, value in params.items():
+        name, value = name.encode('latin-1'), value.encode('latin-1')
+        for length in (len(name), len(value)):
+            data += struct.pack('!B', length) if length < 128 else struct.pack('!I', length | 0x80000000)
+        data += name + value
+    return data
+
+
+def fpm_status(socket_path, timeout=2):
+    """Pool status of one FPM instance, asked over FastCGI on its socket (None if it does not answer)"""
+    request = (_fcgi_record(1, struct.pack('!HB5x', 1, 0))
+               + _fcgi_record(4, _fcgi_params({'SCRIPT_NAME': FPM_STATUS_PATH, 'SCRIPT_FILENAME': FPM_STATUS_PATH,
+                                               'REQUEST_URI': FPM_STATUS_PATH, 'QUERY_STRING': 'json',
+                                               'REQUEST_METHOD': 'GET', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                                               'GATEWAY_INTERFACE': 'CGI/1.1'}))
+               + _fcgi_record(4, b'') + _fcgi_record(5, b''))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+        sock.sendall(request)
+        data = b''
+        while True:
+            block = sock.recv(65536)
+            if not block:
+                break
+            data += block
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+    stdout, offset = b'', 0
+    while offset + 8 <= len(data):
+        _, record_type, _, length, padding = struct.unpack('!BBHHB', data[offset:offset + 7])
+        if record_type == 6:
+            stdout += data[offset + 8:offset + 8 + length]
+        elif record_type == 3:
+            break
+        offset += 8 + length + padding
+
+    headers, _, body = stdout.partition(b'\r\n\r\n')
+    if b'Status:' in headers and b'Status: 200' not in headers:
+        # Pools written before the status path was added answer 404 until FPM restarts
+        return None
+    try:
+        status = json.loads(body)
+    except ValueError:
+        return None
+    return {key: status.get(field, 0) for field, key in FPM_STATUS_FIELDS.items()}
+
+
+class SiteHealthPoller:
+    """Background health checks of every registered site
+
+    A background thread probes each site on its local port (an HTTP GET
+    with the site's Host header) and, for the fpm runtime, asks every FPM
+    replica for its pool status. Intervals adapt per site between
+    MIN_INTERVAL and MAX_INTERVAL. Results and a short history are kept in
+    memory and persisted to a snapshot file that a restart resumes from;
+    listing sites reads this cached state and never waits on a probe.
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        self.path = path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._lock = threading.Lock()
+        self._running = False
+        self._checks = {}
+        self._dirty = False
+        self._saved_at = 0
+        self._service_manager = None
+        self._snapshot = None
+        self._snapshot_mtime = None
+
+    # Persistence
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        checks = data.get('sites', {})
+        for check in checks.values():
+            check['history'] = deque((tuple(entry) for entry in check.get('history', [])), maxlen=HISTORY)
+        return checks
+
+    def _save(self):
+        state = {'updated_at': time.time(),
+                 'sites': {port: {**check, 'history': list(check['history'])} for port, check in self._checks.items()}}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            self._saved_at = time.time()
+        except OSError as e:
+            print(f"⚠️ Could not persist site health: {e}")
+
+    # Probing
+
+    def _fpm_pools(self, site):
+        if self._service_manager is None:
+            from service_manager import ServiceManager
+            self._service_manager = ServiceManager()
+        sockets = self._service_manager.site_sockets(site['project_name'], site.get('replicas') or 1)
+        pools = [fpm_status(path) for path in sockets]
+        answered = [pool for pool in pools if pool]
+        if not answered:
+            return None
+        totals = {key: sum(pool[key] for pool in answered) for key in FPM_STATUS_FIELDS.values()}
+        return {'replicas': len(pools), 'replicas_up': len(answered), **totals}
+
+    def probe(self, site):
+        """Check one site now; returns the result without recording it"""
+        result = {'checked_at': time.time(), 'http_status': None, 'ms': None, 'error': None, 'fpm': None}
+        connection = http.client.HTTPConnection('127.0.0.1', int(site['port']), timeout=PROBE_TIMEOUT)
+        try:
+            started = time.perf_counter()
+            connection.request('GET', PROBE_PATH, headers={'Host': site.get('domain') or 'localhost',
+                                                           'User-Agent': 'auto-hosting-health'})
+            response = connection.getresponse()
+            response.read()
+            result['ms'] = round((time.perf_counter() - started) * 1000, 1)
+            result['http_status'] = response.status
+        except (OSError, http.client.HTTPException) as e:
+            result['error'] = f'{type(e).__name__}: {e}'
+        finally:
+            connection.close()
+
+        if site.get('runtime', 'fpm') == 'fpm':
+            result['fpm'] = self._fpm_pools(site)
+
+        fpm = result['fpm']
+        if result['http_status'] is None or result['http_status'] >= 500:
+            result['state'] = 'down'
+        elif result['ms'] > SLOW_MS or (fpm and (fpm['listen_queue'] or fpm['replicas_up'] < fpm['replicas'])):
+            result['state'] = 'degraded'
+        else:
+            result['state'] = 'up'
+        return result
+
+    def _record(self, site, result):
+        check = self._checks[site['port']]
+        previous = check['state']
+        check.update(result)
+        if result['state'] != previous:
+            check['changed_at'] = result['checked_at']
+            if previous != 'unknown':
+                print(f"🩺 {site['project_name']} (port {site['port']}) is {result['state']} (was {previous})")
+        if result['state'] == 'up' and previous == 'up':
+            check['interval'] = min(check['interval'] * 2, self.max_interval)
+        else:
+            check['interval'] = self.min_interval
+        check['next_check_at'] = result['checked_at'] + check['interval']
+        check['history'].append((round(result['checked_at'], 1), result['state'], result['http_status'], result['ms']))
+        self._dirty = True
+
+    def poll(self, pool):
+        """Probe the sites that are due and record the results"""
+        sites = get_registry().list_sites()
+        now = time.time()
+        with self._lock:
+            due = []
+            for site in sites:
+                check = self._checks.get(site['port'])
+                if check is None or check['project_name'] != site['project_name']:
+                    # First checks are spread over one interval, not fired all at once
+                    check = self._checks[site['port']] = {
+                        'project_name': site['project_name'], 'state': 'unknown', 'changed_at': None,
+                        'interval': self.min_interval, 'next_check_at': now + random.uniform(0, self.min_interval),
+                        'history': deque(maxlen=HISTORY)}
+                    self._dirty = True
+                # A deploy swaps the site's runtime under the probe; check it again once it is done
+                if site['status'] != 'deploying' and now >= check['next_check_at']:
+                    due.append(site)
+
+            registered = {site['port'] for site in sites}
+            for port in [port for port in self._checks if port not in registered]:
+                del self._checks[port]
+                self._dirty = True
+
+        results = list(pool.map(self.probe, due))
+        with self._lock:
+            for site, result in zip(due, results):
+                if site['port'] in self._checks:
+                    self._record(site, result)
+            if self._dirty and time.time() - self._saved_at >= SAVE_INTERVAL:
+                self._save()
+
+    def start(self):
+        """Check the sites periodically in the background"""
+        with self._lock:
+            self._checks = self._load()
+            self._running = True
+
+        def loop():
+            with ThreadPoolExecutor(max_workers=PROBE_CONCURRENCY, thread_name_prefix='site-health') as pool:
+                while True:
+                    try:
+                        self.poll(pool)
+                    except Exception as e:
+                        print(f"⚠️ Site health pass failed: {e}")
+                    time.sleep(TICK_SECONDS)
+
+        threading.Thread(target=loop, daemon=True, name='site-health').start()
+
+    # Reporting
+
+    def _summary(self, check, history=False):
+        states = [entry[1] for entry in check['history']]
+        summary = {key: check.get(key) for key in ('state', 'checked_at', 'changed_at', 'http_status', 'ms', 'error',
+                                                   'fpm', 'next_check_at')}
+        summary['uptime'] = round(sum(1 for s in states if s != 'down') / len(states), 3) if states else None
+        if history:
+            summary['history'] = [{'at': at, 'state': state, 'http_status': status, 'ms': ms}
+                                  for at, state, status, ms in check['history']]
+        return summary
+
+    def _snapshot_checks(self):
+        """Persisted state, reloaded when the polling process has written a newer snapshot"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return {}, {}
+        with self._lock:
+            if mtime != self._snapshot_mtime:
+                checks = self._load()
+                # Summaries are built once per snapshot, so listing many sites stays cheap
+                self._snapshot = checks, {port: self._summary(check) for port, check in checks.items()}
+                self._snapshot_mtime = mtime
+            return self._snapshot
+
+    def statuses(self):
+        """Latest health of every checked site, {port: summary}"""
+        if self._running:
+            with self._lock:
+                return {port: self._summary(check) for port, check in self._checks.items()}
+        return self._snapshot_checks()[1]
+
+    def site(self, port):
+        """Latest health of one site with its recent history, or None if it was not checked yet"""
+        if self._running:
+            with self._lock:
+                check = self._checks.get(str(port))
+                return self._summary(check, history=True) if check else None
+        check = self._snapshot_checks()[0].get(str(port))
+        return self._summary(check, history=True) if check else None
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_site_health():
+    """Return the process-wide site health poller"""
+    global _poller
+    if _poller is None:
+        with _poller_lock:
+            if _poller is None:
+                _poller = SiteHealthPoller()
+    return _poller
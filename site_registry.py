@@ -0,0 +1,405 @@
+import sqlite3
+import threading
+import hashlib
+import json
+import os
+import time
+
+STATE_DIR = os.environ.get('AUTO_HOSTING_STATE_DIR', '/var/lib/auto-hosting')
+REGISTRY_PATH = os.path.join(STATE_DIR, 'registry.db')
+CACHE_DIR = os.environ.get('AUTO_HOSTING_CACHE_DIR', '/var/cache/auto-hosting')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sites (
+    port TEXT PRIMARY KEY,
+    project_name TEXT NOT NULL UNIQUE,
+    project_path TEXT NOT NULL,
+    git_repo TEXT,
+    domain TEXT,
+    db_name TEXT,
+    vhost_hash TEXT,
+    status TEXT NOT NULL,
+    current_release_id INTEGER,
+    inputs TEXT NOT NULL DEFAULT '{}',
+    redis_db INTEGER,
+    redis_cache_db INTEGER,
+    queue_min INTEGER,
+    queue_max INTEGER,
+    queue_workers INTEGER,
+    queue_depth INTEGER,
+    runtime TEXT NOT NULL DEFAULT 'fpm',
+    octane_port INTEGER,
+    tuning TEXT NOT NULL DEFAULT '{}',
+    replicas INTEGER NOT NULL DEFAULT 1,
+    backends TEXT NOT NULL DEFAULT '[]',
+    db_user TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sites_domain ON sites(domain);
+CREATE INDEX IF NOT EXISTS idx_sites_status ON sites(status);
+
+CREATE TABLE IF NOT EXISTS releases (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    port TEXT NOT NULL,
+    git_repo TEXT,
+    git_commit TEXT,
+    composer_lock_hash TEXT,
+    db_name TEXT,
+    vhost_hash TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    timings TEXT NOT NULL DEFAULT '{}',
+    warmup TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_releases_port ON releases(port, id);
+CREATE INDEX IF NOT EXISTS idx_releases_status ON releases(status);
+
+CREATE TABLE IF NOT EXISTS checkpoints (
+    port TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    inputs_hash TEXT NOT NULL,
+    outputs TEXT NOT NULL DEFAULT '{}',
+    release_id INTEGER,
+    completed_at REAL NOT NULL,
+    PRIMARY KEY (port, stage)
+);
+
+CREATE TABLE IF NOT EXISTS load_tests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    port TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_load_tests_port ON load_tests(port, id);
+
+CREATE TABLE IF NOT EXISTS standby_slots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_standby_kind ON standby_slots(kind, id);
+
+CREATE TABLE IF NOT EXISTS startups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pid INTEGER NOT NULL,
+    mode TEXT NOT NULL,
+    ready_seconds REAL NOT NULL,
+    rss_kb INTEGER,
+    started_at REAL NOT NULL
+);
+"""
+
+# Columns added to a registry schema that has shipped: (table, column, definition).
+# Columns of an unreleased schema go straight into SCHEMA.
+MIGRATIONS = []
+
+
+def hash_file(path):
+    """Return sha256 hex digest of a file, or None if it does not exist"""
+    if not path or not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_text(text):
+    """Return sha256 hex digest of a string"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class SiteRegistry:
+    """SQLite registry of deployed sites and their releases"""
+
+    def __init__(self, path=REGISTRY_PATH):
+        self.path = path
+        self._local = threading.local()
+        # Only root reads the state: it names every site's database and user
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        os.chmod(os.path.dirname(self.path), 0o700)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+        # SQLite gives the -wal and -shm files the database file's mode
+        os.chmod(self.path, 0o600)
+
+    def _connect(self):
+        """Get the connection for the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _migrate(self, conn):
+        """Add columns missing from registries created by older versions"""
+        for table, column, definition in MIGRATIONS:
+            columns = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+            if column not in columns:
+                try:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+                except sqlite3.OperationalError as e:
+                    # Another process starting at the same time added it first
+                    if 'duplicate column name' not in str(e):
+                        raise
+
+    def _site_from_row(self, row):
+        if not row:
+            return None
+        site = dict(row)
+        site['inputs'] = json.loads(site.get('inputs') or '{}')
+        site['tuning'] = json.loads(site.get('tuning') or '{}')
+        site['backends'] = json.loads(site.get('backends') or '[]')
+        return site
+
+    def _release_from_row(self, row):
+        if not row:
+            return None
+        release = dict(row)
+        release['timings'] = json.loads(release['timings'] or '{}')
+        release['warmup'] = json.loads(release['warmup']) if release.get('warmup') else None
+        return release
+
+    # Sites
+
+    def upsert_site(self, port, project_name, project_path, **fields):
+        """Create or update the site registered on a port"""
+        now = time.time()
+        allowed = ('git_repo', 'domain', 'db_name', 'db_user', 'vhost_hash', 'status', 'current_release_id',
+                   'inputs')
+        values = {key: value for key, value in fields.items() if key in allowed}
+        if 'inputs' in values:
+            values['inputs'] = json.dumps(values['inputs'])
+        values.setdefault('status', 'deploying')
+
+        with self._connect() as conn:
+            existing = conn.execute('SELECT port FROM sites WHERE port = ?', (str(port),)).fetchone()
+            if existing:
+                assignments = ', '.join(f'{key} = ?' for key in values)
+                conn.execute(f'UPDATE sites SET {assignments}, project_name = ?, project_path = ?, updated_at = ? WHERE port = ?',
+                             (*values.values(), project_name, project_path, now, str(port)))
+            else:
+                columns = ', '.join(values)
+                placeholders = ', '.join('?' for _ in values)
+                conn.execute(f'INSERT INTO sites (port, project_name, project_path, {columns}, created_at, updated_at) '
+                             f'VALUES (?, ?, ?, {placeholders}, ?, ?)',
+                             (str(port), project_name, project_path, *values.values(), now, now))
+
+    def update_site(self, port, **fields):
+        """Update selected columns of a registered site"""
+        if not fields:
+            return
+        for key in ('inputs', 'tuning', 'backends'):
+            if key in fields:
+                fields[key] = json.dumps(fields[key])
+        assignments = ', '.join(f'{key} = ?' for key in fields)
+        with self._connect() as conn:
+            conn.execute(f'UPDATE sites SET {assignments}, updated_at = ? WHERE port = ?',
+                         (*fields.values(), time.time(), str(port)))
+
+    def get_site(self, port):
+        """Look up the site registered on a port"""
+        row = self._connect().execute('SELECT * FROM sites WHERE port = ?', (str(port),)).fetchone()
+        return self._site_from_row(row)
+
+    def get_site_by_name(self, project_name):
+        """Look up a site by its project name"""
+        row = self._connect().execute('SELECT * FROM sites WHERE project_name = ?', (project_name,)).fetchone()
+        return self._site_from_row(row)
+
+    def list_sites(self, status=None):
+        """List registered sites, optionally filtered by status"""
+        if status:
+            rows = self._connect().execute('SELECT * FROM sites WHERE status = ? ORDER BY port', (status,)).fetchall()
+        else:
+            rows = self._connect().execute('SELECT * FROM sites ORDER BY port').fetchall()
+        return [self._site_from_row(row) for row in rows]
+
+    def project_names(self):
+        """Return the set of project names known to the registry"""
+        rows = self._connect().execute('SELECT project_name FROM sites').fetchall()
+        return {row['project_name'] for row in rows}
+
+    def remove_site(self, port):
+        """Forget a site (its release history is kept)"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM sites WHERE port = ?', (str(port),))
+
+    # Releases
+
+    def start_release(self, port, git_repo, db_name=None):
+        """Record a new release attempt and return its id"""
+        with self._connect() as conn:
+            cursor = conn.execute('INSERT INTO releases (port, git_repo, db_name, status, started_at) VALUES (?, ?, ?, ?, ?)',
+                                  (str(port), git_repo, db_name, 'running', time.time()))
+            return cursor.lastrowid
+
+    def update_release(self, release_id, **fields):
+        """Update selected columns of a release"""
+        if not fields:
+            return
+        for key in ('timings', 'warmup'):
+            if key in fields:
+                fields[key] = json.dumps(fields[key])
+        assignments = ', '.join(f'{key} = ?' for key in fields)
+        with self._connect() as conn:
+            conn.execute(f'UPDATE releases SET {assignments} WHERE id = ?', (*fields.values(), release_id))
+
+    def record_stage(self, release_id, stage, seconds):
+        """Store the duration of one pipeline stage of a release"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT timings FROM releases WHERE id = ?', (release_id,)).fetchone()
+            timings = json.loads(row['timings'] or '{}') if row else {}
+            timings[stage] = round(seconds, 3)
+            conn.execute('UPDATE releases SET timings = ? WHERE id = ?', (json.dumps(timings), release_id))
+
+    def finish_release(self, release_id, status, error=None):
+        """Mark a release as finished"""
+        self.update_release(release_id, status=status, error=error, finished_at=time.time())
+
+    def get_release(self, release_id):
+        """Look up a release by id"""
+        row = self._connect().execute('SELECT * FROM releases WHERE id = ?', (release_id,)).fetchone()
+        return self._release_from_row(row)
+
+    def latest_release(self, port, status=None):
+        """Return the most recent release for a port"""
+        if status:
+            row = self._connect().execute('SELECT * FROM releases WHERE port = ? AND status = ? ORDER BY id DESC LIMIT 1',
+                                          (str(port), status)).fetchone()
+        else:
+            row = self._connect().execute('SELECT * FROM releases WHERE port = ? ORDER BY id DESC LIMIT 1',
+                                          (str(port),)).fetchone()
+        return self._release_from_row(row)
+
+    def list_releases(self, port, limit=20):
+        """List the most recent releases for a port"""
+        rows = self._connect().execute('SELECT * FROM releases WHERE port = ? ORDER BY id DESC LIMIT ?',
+                                       (str(port), limit)).fetchall()
+        return [self._release_from_row(row) for row in rows]
+
+    def successful_releases(self, port, limit=20):
+        """(id, finished_at) of the most recent successful releases of a port, oldest first"""
+        rows = self._connect().execute("SELECT id, finished_at FROM releases WHERE port = ? AND status = 'success' "
+                                       'ORDER BY id DESC LIMIT ?', (str(port), limit)).fetchall()
+        return sorted((row['id'], row['finished_at']) for row in rows)
+
+    # Checkpoints
+
+    def save_checkpoint(self, port, stage, inputs_hash, outputs, release_id):
+        """Record that a pipeline stage completed for the given inputs"""
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO checkpoints (port, stage, inputs_hash, outputs, release_id, completed_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?)',
+                         (str(port), stage, inputs_hash, json.dumps(outputs or {}), release_id, time.time()))
+
+    def get_checkpoints(self, port):
+        """Return completed stages for a port keyed by stage name"""
+        rows = self._connect().execute('SELECT * FROM checkpoints WHERE port = ?', (str(port),)).fetchall()
+        checkpoints = {}
+        for row in rows:
+            checkpoint = dict(row)
+            checkpoint['outputs'] = json.loads(checkpoint['outputs'] or '{}')
+            checkpoints[checkpoint['stage']] = checkpoint
+        return checkpoints
+
+    def clear_checkpoints(self, port):
+        """Forget all completed stages for a port"""
+        with self._connect() as conn:
+            conn.execute('DELETE FROM checkpoints WHERE port = ?', (str(port),))
+
+    # Load tests
+
+    def _load_test_from_row(self, row):
+        if not row:
+            return None
+        test = dict(row)
+        test['params'] = json.loads(test['params'])
+        test['result'] = json.loads(test['result']) if test['result'] else None
+        return test
+
+    def start_load_test(self, port, params):
+        """Record a load test that is starting and return its id"""
+        with self._connect() as conn:
+            cursor = conn.execute('INSERT INTO load_tests (port, params, status, started_at) VALUES (?, ?, ?, ?)',
+                                  (str(port), json.dumps(params), 'running', time.time()))
+            return cursor.lastrowid
+
+    def finish_load_test(self, test_id, status, result):
+        """Store the outcome of a load test"""
+        with self._connect() as conn:
+            conn.execute('UPDATE load_tests SET status = ?, result = ?, finished_at = ? WHERE id = ?',
+                         (status, json.dumps(result), time.time(), test_id))
+
+    def get_load_test(self, test_id):
+        row = self._connect().execute('SELECT * FROM load_tests WHERE id = ?', (test_id,)).fetchone()
+        return self._load_test_from_row(row)
+
+    def list_load_tests(self, port, limit=20):
+        """Load test history of a port, newest first"""
+        rows = self._connect().execute('SELECT * FROM load_tests WHERE port = ? ORDER BY id DESC LIMIT ?',
+                                       (str(port), limit)).fetchall()
+        return [self._load_test_from_row(row) for row in rows]
+
+    # Standby slots (pre-provisioned resources waiting to be claimed by a deploy)
+
+    def add_standby(self, kind, name, data):
+        with self._connect() as conn:
+            conn.execute('INSERT INTO standby_slots (kind, name, data, created_at) VALUES (?, ?, ?, ?)',
+                         (kind, name, json.dumps(data), time.time()))
+
+    def claim_standby(self, kind):
+        """Take the oldest slot of a kind out of the pool; each slot goes to exactly one caller"""
+        while True:
+            row = self._connect().execute('SELECT * FROM standby_slots WHERE kind = ? ORDER BY id LIMIT 1',
+                                          (kind,)).fetchone()
+            if not row:
+                return None
+            with self._connect() as conn:
+                claimed = conn.execute('DELETE FROM standby_slots WHERE id = ?', (row['id'],)).rowcount
+            if claimed:
+                return {**dict(row), 'data': json.loads(row['data'])}
+
+    def count_standby(self, kind):
+        return self._connect().execute('SELECT COUNT(*) FROM standby_slots WHERE kind = ?', (kind,)).fetchone()[0]
+
+    # Control plane startups
+
+    def record_startup(self, pid, mode, ready_seconds, rss_kb):
+        """Store the startup time and idle memory of a control-plane process"""
+        with self._connect() as conn:
+            conn.execute('INSERT INTO startups (pid, mode, ready_seconds, rss_kb, started_at) VALUES (?, ?, ?, ?, ?)',
+                         (pid, mode, ready_seconds, rss_kb, time.time()))
+            # Keep a bounded history
+            conn.execute('DELETE FROM startups WHERE id <= (SELECT MAX(id) FROM startups) - 500')
+
+    def list_startups(self, limit=20):
+        rows = self._connect().execute('SELECT * FROM startups ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide site registry"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = SiteRegistry()
+    return _registry
@@ -0,0 +1,65 @@
+import os
+import threading
+from contextlib import contextmanager
+
+
+def _limit_from_env(name, default):
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+class StageLimiter:
+    """Caps how many deployments may run each class of pipeline stage at once
+
+    deploy    - whole deployments in flight (global cap)
+    cpu       - CPU-heavy stages (composer install)
+    io        - I/O-heavy stages (database import)
+    exclusive - stages that must not overlap (nginx config + reload)
+    """
+
+    def __init__(self, deploy=None, cpu=None, io=None):
+        cpus = os.cpu_count() or 2
+        self.limits = {
+            'deploy': deploy or _limit_from_env('AUTO_HOSTING_MAX_DEPLOYS', 4),
+            'cpu': cpu or _limit_from_env('AUTO_HOSTING_MAX_CPU_STAGES', max(1, cpus // 2)),
+            'io': io or _limit_from_env('AUTO_HOSTING_MAX_IO_STAGES', 2),
+            'exclusive': 1,
+        }
+        self._semaphores = {kind: threading.BoundedSemaphore(limit) for kind, limit in self.limits.items()}
+        self._active = {kind: 0 for kind in self.limits}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, kind):
+        """Hold one slot of the given stage class for the duration of the block"""
+        semaphore = self._semaphores[kind]
+        semaphore.acquire()
+        with self._lock:
+            self._active[kind] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active[kind] -= 1
+            semaphore.release()
+
+    def status(self):
+        """Return current usage per stage class"""
+        with self._lock:
+            return {kind: {'active': self._active[kind], 'limit': limit} for kind, limit in self.limits.items()}
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_stage_limiter():
+    """Return the process-wide stage limiter"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = StageLimiter()
+    return _limiter
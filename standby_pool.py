@@ -0,0 +1,108 @@
+import os
+import secrets
+import threading
+import time
+from site_registry import get_registry
+from lock_manager import get_lock_manager
+
+# Empty databases (each with its own user) kept ready for new sites
+POOL_DATABASES = int(os.environ.get('AUTO_HOSTING_STANDBY_DATABASES', 2))
+REFILL_INTERVAL = int(os.environ.get('AUTO_HOSTING_STANDBY_REFILL_INTERVAL', 60))
+
+
+class StandbyPool:
+    """Pre-provisioned resources a deploy can claim instead of creating them on its critical path
+
+    A database slot is an empty utf8mb4 database plus a MySQL user with
+    privileges on that database only. Slots live in the registry, so any
+    worker process claims one with a single row delete, and the pool is
+    refilled in the background after each claim and periodically.
+    """
+
+    def __init__(self, databases=POOL_DATABASES, interval=REFILL_INTERVAL):
+        self.databases = databases
+        self.interval = interval
+
+    def claim_database(self):
+        """{'db_name', 'db_user', 'db_password'} of a ready database, or None if the pool is empty
+
+        The password is set on claim and only returned: it ends up in the
+        site's .env, never in the registry.
+        """
+        from database_manager import DatabaseManager
+        slot = get_registry().claim_standby('database')
+        self.refill_async()
+        if not slot:
+            return None
+        claimed = {'db_name': slot['data']['db_name'], 'db_user': slot['data']['db_user'],
+                   'db_password': secrets.token_hex(16)}
+        try:
+            DatabaseManager().set_user_password(claimed['db_user'], claimed['db_password'])
+        except Exception:
+            self.release_database(claimed)
+            raise
+        print(f"⚡ Claimed standby database {slot['name']}")
+        return claimed
+
+    def release_database(self, slot):
+        """Put a claimed database that no site took back into the pool"""
+        get_registry().add_standby('database', slot['db_name'], {'db_name': slot['db_name'], 'db_user': slot['db_user']})
+
+    def _create_database_slot(self):
+        from database_manager import DatabaseManager
+        token = secrets.token_hex(6)
+        # MySQL user names are limited to 32 characters
+        slot = {'db_name': f'laravel_sb_{token}', 'db_user': f'site_{token}'}
+        DatabaseManager().create_dedicated_database(slot['db_name'], slot['db_user'])
+        get_registry().add_standby('database', slot['db_name'], slot)
+
+    def refill(self):
+        """Create slots until the pool is full (one refill at a time across processes)"""
+        if self.databases <= 0:
+            return
+        with get_lock_manager().lock('standby-pool'):
+            registry = get_registry()
+            created = 0
+            while registry.count_standby('database') < self.databases:
+                self._create_database_slot()
+                created += 1
+        if created:
+            print(f"✓ Standby pool refilled: {created} database(s)")
+
+    def refill_async(self):
+        def run():
+            try:
+                self.refill()
+            except Exception as e:
+                print(f"⚠️ Standby pool refill failed: {e}")
+
+        threading.Thread(target=run, daemon=True, name='standby-refill').start()
+
+    def status(self):
+        return {'databases': get_registry().count_standby('database'), 'target_databases': self.databases}
+
+    def start(self):
+        """Keep the pool full in the background"""
+        def loop():
+            while True:
+                try:
+                    self.refill()
+                except Exception as e:
+                    print(f"⚠️ Standby pool refill failed: {e}")
+                time.sleep(self.interval)
+
+        threading.Thread(target=loop, daemon=True, name='standby-pool').start()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_standby_pool():
+    """Return the process-wide standby pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = StandbyPool()
+    return _pool
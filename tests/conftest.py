@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# State and cache paths are read when the modules are imported, so they point at a
+# scratch directory before any test imports them
+_scratch = tempfile.mkdtemp(prefix='auto-hosting-tests-')
+os.environ['AUTO_HOSTING_STATE_DIR'] = os.path.join(_scratch, 'state')
+os.environ['AUTO_HOSTING_CACHE_DIR'] = os.path.join(_scratch, 'cache')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,49 @@
+import pytest
+
+from composer_preflight import satisfies
+
+
+@pytest.mark.parametrize('version, constraint, expected', [
+    # Caret: next significant release
+    ('8.1.2', '^8.1', True),
+    ('9.0.0', '^8.1', False),
+    ('8.0.30', '^8.1', False),
+    ('0.3.5', '^0.3', True),
+    ('0.4.0', '^0.3', False),
+    ('0.0.3', '^0.0.3', True),
+    ('0.0.4', '^0.0.3', False),
+    # Tilde: last given component may increase
+    ('1.9.0', '~1.2', True),
+    ('2.0.0', '~1.2', False),
+    ('1.2.9', '~1.2.3', True),
+    ('1.3.0', '~1.2.3', False),
+    # Comparisons, AND by space or comma
+    ('8.2.0', '>=8.1 <8.3', True),
+    ('8.3.0', '>=8.1 <8.3', False),
+    ('8.2.0', '>=8.1,<8.3', True),
+    ('8.2.0', '>= 8.1', True),
+    ('8.1.0', '!=8.1.0', False),
+    ('8.1.0', '>8.1', False),
+    # OR, with one or two pipes
+    ('7.4.33', '^7.3|^8.0', True),
+    ('8.2.1', '^7.3 || ^8.0', True),
+    ('7.2.0', '^7.3 || ^8.0', False),
+    # Wildcards and bare versions
+    ('8.1.27', '8.1.*', True),
+    ('8.2.0', '8.1.*', False),
+    ('8.1.27', '8.1', True),
+    ('8.1.27', '*', True),
+    # Hyphen ranges: a partial upper bound covers its whole minor
+    ('2.1.9', '1.0 - 2.1', True),
+    ('2.2.0', '1.0 - 2.1', False),
+    ('2.1.3', '1.0.0 - 2.1.3', True),
+    ('2.1.4', '1.0.0 - 2.1.3', False),
+    # Stability flags, v prefixes and suffixed PHP versions
+    ('8.1.2', '^8.0@dev', True),
+    ('8.1.2', 'v8.1.2', True),
+    ('8.3.0-dev', '^8.3', True),
+    ('8.1.2-1ubuntu2', '>=8.1.2', True),
+    ('1.0.0', 'dev-master', True),
+])
+def test_satisfies(version, constraint, expected):
+    assert satisfies(version, constraint) is expected
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+import deploy_log
+from deploy_log import open_log, read_log
+
+
+@pytest.fixture
+def log_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(deploy_log, 'LOG_DIR', str(tmp_path))
+    # 'HH:MM:SS line-NN' is 17 bytes with the newline: a segment holds 3 lines
+    monkeypatch.setattr(deploy_log, 'SEGMENT_BYTES', 50)
+    monkeypatch.setattr(deploy_log, 'MAX_SEGMENTS', 3)
+    return tmp_path
+
+
+def _write(log, count):
+    for n in range(count):
+        log.write(f'line-{n:02d}')
+
+
+def _texts(result):
+    return [(line['n'], line['text'].split(' ', 1)[1]) for line in result['lines']]
+
+
+def test_segments_rotate_compress_and_drop_the_oldest(log_dir):
+    log = open_log(8001, 1)
+    _write(log, 20)
+    try:
+        names = sorted(os.listdir(log_dir / '8001' / '1'))
+        # Rotated segments are gzipped and only the last MAX_SEGMENTS are kept next to the live one
+        assert names == ['0000000009.log.gz', '0000000012.log.gz', '0000000015.log.gz', '0000000018.log']
+    finally:
+        log.close()
+    assert sorted(os.listdir(log_dir / '8001' / '1'))[-1] == '0000000018.log.gz'
+
+
+def test_read_log_pages_across_segments(log_dir):
+    log = open_log(8001, 1)
+    _write(log, 20)
+    log.close()
+
+    # Closing compressed the last segment too, so only 12.. is left; reading starts at `first`
+    page = read_log(8001, 1, start=0, limit=4)
+    assert page['first'] == 12
+    assert _texts(page) == [(n, f'line-{n:02d}') for n in range(12, 16)]
+    assert page['next'] == 16
+
+    page = read_log(8001, 1, start=page['next'], limit=100)
+    assert _texts(page) == [(n, f'line-{n:02d}') for n in range(16, 20)]
+    assert page['next'] == 20
+
+    page = read_log(8001, 1, start=page['next'])
+    assert page['lines'] == [] and page['next'] == 20
+
+
+def test_tail_from_memory_while_running_and_from_disk_after(log_dir):
+    log = open_log(8001, 1)
+    _write(log, 20)
+    expected = [(n, f'line-{n:02d}') for n in range(15, 20)]
+    try:
+        running = read_log(8001, 1, tail=5)
+        assert _texts(running) == expected
+        assert running['next'] == 20
+    finally:
+        log.close()
+
+    finished = read_log(8001, 1, tail=5)
+    assert _texts(finished) == expected
+    assert finished['next'] == 20
+
+
+def test_read_log_of_unknown_release(log_dir):
+    assert read_log(8001, 404) is None
+
+
+def test_older_release_logs_are_pruned(log_dir, monkeypatch):
+    monkeypatch.setattr(deploy_log, 'KEEP_RELEASES', 2)
+    for release_id in (1, 2, 3):
+        log = open_log(8001, release_id)
+        log.write('done')
+        log.close()
+    assert sorted(os.listdir(log_dir / '8001')) == ['2', '3']
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from load_tester import LoadTester
+
+
+def _read(*responses):
+    """Parse the responses from one connection; returns the (status, keep_alive) of each"""
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b''.join(responses))
+        reader.feed_eof()
+        tester = LoadTester()
+        results = [await tester._read_response(reader) for _ in responses]
+        return results, await reader.read()
+    return asyncio.run(read())
+
+
+def test_content_length_body_keeps_connection():
+    results, rest = _read(b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello',
+                          b'HTTP/1.1 404 Not Found\r\ncontent-length: 0\r\n\r\n')
+    assert results == [(200, True), (404, True)]
+    assert rest == b''
+
+
+def test_chunked_body_with_extensions_and_trailers():
+    results, rest = _read(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                          b'5;name=value\r\nhello\r\n6\r\n world\r\n0\r\nX-Checksum: abc\r\n\r\n',
+                          b'HTTP/1.1 200 OK\r\nTransfer-Encoding: Chunked\r\n\r\n0\r\n\r\n')
+    assert results == [(200, True), (200, True)]
+    assert rest == b''
+
+
+@pytest.mark.parametrize('status', [204, 304])
+def test_bodiless_statuses_do_not_wait_for_a_body(status):
+    # Without a length a body would be read until EOF and the connection given up
+    results, _ = _read(f'HTTP/1.1 {status} X\r\n\r\n'.encode())
+    assert results == [(status, True)]
+
+
+def test_bodiless_status_is_followed_by_the_next_response():
+    results, rest = _read(b'HTTP/1.1 304 Not Modified\r\nETag: "x"\r\n\r\n',
+                          b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+    assert results == [(304, True), (200, True)]
+    assert rest == b''
+
+
+def test_interim_responses_are_skipped():
+    results, _ = _read(b'HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 103 Early Hints\r\nLink: </a.css>\r\n\r\n'
+                       b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+    assert results == [(200, True)]
+
+
+def test_connection_close_and_body_until_eof():
+    assert _read(b'HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Length: 2\r\n\r\nok')[0] == [(200, False)]
+    assert _read(b'HTTP/1.0 200 OK\r\n\r\nbody until the server closes')[0] == [(200, False)]
+
+
+def test_switching_protocols_is_not_reused():
+    assert _read(b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\n\r\n')[0] == [(101, False)]
+
+
+def test_closed_connection_raises():
+    with pytest.raises(asyncio.IncompleteReadError):
+        _read(b'')
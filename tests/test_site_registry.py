@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+import site_registry
+from site_registry import SiteRegistry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return SiteRegistry(path=str(tmp_path / 'registry.db'))
+
+
+def test_site_round_trip_with_json_columns(registry):
+    registry.upsert_site(8001, 'port_8001', '/var/www/port_8001', status='active', inputs={'git_repo': 'x'},
+                         db_user='port_8001_u')
+    registry.update_site(8001, tuning={'pm': 'static'}, backends=['127.0.0.1:9001'], replicas=2)
+
+    site = registry.get_site(8001)
+    assert site['port'] == '8001'
+    assert site['inputs'] == {'git_repo': 'x'}
+    assert site['tuning'] == {'pm': 'static'}
+    assert site['backends'] == ['127.0.0.1:9001']
+    assert (site['replicas'], site['runtime'], site['db_user']) == (2, 'fpm', 'port_8001_u')
+
+
+def test_releases_and_warmup_results(registry):
+    first = registry.start_release(8001, 'https://example.com/app.git')
+    registry.finish_release(first, 'success')
+    second = registry.start_release(8001, 'https://example.com/app.git')
+    registry.update_release(second, warmup={'routes': {'/': {'p95': 12.5}}})
+    registry.finish_release(second, 'failed', error='boom')
+
+    assert registry.get_release(second)['warmup'] == {'routes': {'/': {'p95': 12.5}}}
+    assert [release_id for release_id, _ in registry.successful_releases(8001)] == [first]
+    assert registry.latest_release(8001)['id'] == second
+
+
+def test_migrations_add_missing_columns_once(tmp_path, monkeypatch):
+    path = str(tmp_path / 'registry.db')
+    SiteRegistry(path=path)
+    monkeypatch.setattr(site_registry, 'MIGRATIONS', [('sites', 'notes', 'TEXT')])
+
+    SiteRegistry(path=path)
+    # Opening it again finds the column already there
+    SiteRegistry(path=path)
+
+    with sqlite3.connect(path) as conn:
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(sites)')]
+    assert columns.count('notes') == 1
@@ -0,0 +1,105 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+# upload_store hands completed files to the deploy pipeline through bulk_deployer
+pytest.importorskip('werkzeug')
+
+from upload_store import UploadError, UploadStore  # noqa: E402
+
+CHUNK_SIZE = 4
+DATA = b'0123456789'
+
+
+def _hashes(data, chunk_size=CHUNK_SIZE):
+    return [hashlib.sha256(data[i:i + chunk_size]).hexdigest() for i in range(0, len(data), chunk_size)]
+
+
+def _chunk(index, data=DATA):
+    return io.BytesIO(data[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE])
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(root=str(tmp_path))
+
+
+def _open(store, data=DATA):
+    return store.create('dump.sql', len(data), CHUNK_SIZE, _hashes(data))
+
+
+def test_create_is_content_addressed_and_resumes(store):
+    opened = _open(store)
+    assert opened['complete'] is False
+    assert opened['missing'] == [0, 1, 2]
+
+    store.put_chunk(opened['upload_id'], 2, _chunk(2))
+    store.put_chunk(opened['upload_id'], 0, _chunk(0))
+
+    # Opening the same file again gives the same id and only what is still missing
+    resumed = _open(store)
+    assert resumed['upload_id'] == opened['upload_id']
+    assert resumed['missing'] == [1]
+    assert store.status(opened['upload_id'])['received'] == 2
+
+
+def test_chunks_are_verified_against_size_and_hash(store):
+    upload_id = _open(store)['upload_id']
+    with pytest.raises(UploadError):
+        store.put_chunk(upload_id, 0, io.BytesIO(b'abcd'))
+    with pytest.raises(UploadError):
+        store.put_chunk(upload_id, 0, io.BytesIO(b'0123extra'))
+    with pytest.raises(UploadError):
+        # The last chunk is shorter than chunk_size
+        store.put_chunk(upload_id, 2, io.BytesIO(b'89xx'))
+    with pytest.raises(UploadError):
+        store.put_chunk(upload_id, 3, io.BytesIO(b''))
+    assert store.status(upload_id)['missing'] == [0, 1, 2]
+    # Nothing half-written is left behind
+    assert os.listdir(os.path.join(store._partial_dir(upload_id), 'chunks')) == []
+
+
+def test_create_rejects_mismatched_hash_list(store):
+    with pytest.raises(UploadError):
+        store.create('dump.sql', len(DATA), CHUNK_SIZE, _hashes(DATA)[:2])
+    with pytest.raises(UploadError):
+        store.create('dump.sql', len(DATA), CHUNK_SIZE, ['not-a-hash'] * 3)
+    with pytest.raises(UploadError):
+        store.put_chunk('../../etc', 0, io.BytesIO(b''))
+
+
+def test_complete_assembles_once_in_order(store):
+    upload_id = _open(store)['upload_id']
+    for index in (1, 0):
+        store.put_chunk(upload_id, index, _chunk(index))
+    with pytest.raises(UploadError):
+        store.complete(upload_id)
+
+    store.put_chunk(upload_id, 2, _chunk(2))
+    # A retried chunk just replaces the same bytes
+    store.put_chunk(upload_id, 2, _chunk(2))
+    state = store.complete(upload_id)
+    assert state['complete'] is True and state['size'] == len(DATA)
+
+    stored = store.get_file(upload_id)
+    with open(stored.path, 'rb') as f:
+        assert f.read() == DATA
+    assert stored.filename == 'dump.sql'
+    assert not os.path.exists(store._partial_dir(upload_id))
+
+    # Later calls and re-opening the same file find it already there
+    assert store.complete(upload_id)['complete'] is True
+    assert _open(store) == {'upload_id': upload_id, 'complete': True, 'missing': []}
+    assert store.put_chunk(upload_id, 0, _chunk(0))['stored'] is False
+
+
+def test_unknown_uploads(store):
+    upload_id = 'a' * 64
+    assert store.status(upload_id) is None
+    assert store.get_file(upload_id) is None
+    with pytest.raises(UploadError):
+        store.put_chunk(upload_id, 0, io.BytesIO(b'0123'))
+    with pytest.raises(UploadError):
+        store.complete(upload_id)
@@ -0,0 +1,45 @@
+import warmup
+from warmup import WarmupRunner, percentile, summarize
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 100) == 100
+    assert percentile(values, 0) == 1
+
+
+def test_percentile_small_and_unsorted_samples():
+    assert percentile([30, 10, 20], 50) == 20
+    assert percentile([30, 10, 20], 99) == 30
+    assert percentile([7], 95) == 7
+    assert percentile([], 95) is None
+
+
+def test_summarize_empty():
+    assert summarize([]) == {'count': 0, 'p50': None, 'p95': None, 'p99': None}
+
+
+def _report(**p95s):
+    return {'routes': {route.replace('_', '/'): {'p95': p95} for route, p95 in p95s.items()}}
+
+
+def test_compare_flags_regression_beyond_threshold_and_floor(monkeypatch):
+    monkeypatch.setattr(warmup, 'REGRESSION_THRESHOLD', 0.5)
+    monkeypatch.setattr(warmup, 'REGRESSION_MIN_MS', 20)
+    previous = _report(_home=100, _about=100, _fast=2)
+    current = _report(_home=200, _about=140, _fast=8)
+
+    regressions = WarmupRunner()._compare(current, previous)
+
+    # /about is within 50%, /fast tripled but stays under the 20 ms noise floor
+    assert regressions == [{'route': '/home', 'p95': 200, 'previous_p95': 100}]
+
+
+def test_compare_ignores_new_routes_and_missing_history():
+    runner = WarmupRunner()
+    assert runner._compare(_report(_home=500), None) == []
+    assert runner._compare(_report(_new=500), _report(_home=1)) == []
+    assert runner._compare(_report(_home=None), _report(_home=1)) == []
+    assert runner._compare(_report(_home=500), _report(_home=None)) == []
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from site_registry import STATE_DIR
+from lock_manager import get_lock_manager
+from bulk_deployer import StoredFile
+
+UPLOAD_DIR = os.path.join(STATE_DIR, 'uploads')
+# Chunks must fit in one request (app MAX_CONTENT_LENGTH is 16 MB)
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+MAX_UPLOAD_SIZE = int(os.environ.get('AUTO_HOSTING_MAX_UPLOAD_BYTES', 64 * 1024 ** 3))
+# Unfinished uploads and unused assembled files are removed after these many seconds
+PARTIAL_TTL = int(os.environ.get('AUTO_HOSTING_UPLOAD_PARTIAL_TTL', 24 * 3600))
+COMPLETE_TTL = int(os.environ.get('AUTO_HOSTING_UPLOAD_COMPLETE_TTL', 7 * 24 * 3600))
+
+SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadError(Exception):
+    """A client error in an upload request"""
+
+
+def content_id(chunk_size, chunk_hashes):
+    """Identify a file by its chunking: sha256 over the chunk size and the chunk hashes"""
+    return hashlib.sha256(f"{chunk_size}:{','.join(chunk_hashes)}".encode('utf-8')).hexdigest()
+
+
+class UploadStore:
+    """Content-addressed, resumable chunked uploads
+
+    A client hashes its file in fixed-size chunks and opens an upload with
+    the list of chunk hashes; the upload id is derived from them, so the
+    same file always gets the same id. Chunks can then be sent in any
+    order, in parallel and from any worker process, each one verified
+    against its hash. Opening an upload again tells the client which
+    chunks are still missing (resume), or that the file is already here
+    (nothing to send). Completed uploads are assembled once into
+    uploads/files/<id> and can be deployed by id.
+    """
+
+    def __init__(self, root=UPLOAD_DIR):
+        self.root = root
+
+    def _partial_dir(self, upload_id):
+        return os.path.join(self.root, 'partial', upload_id)
+
+    def _file_path(self, upload_id):
+        return os.path.join(self.root, 'files', upload_id)
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.root, 'files', f'{upload_id}.json')
+
+    def _check_id(self, upload_id):
+        if not SHA256.match(upload_id or ''):
+            raise UploadError('Invalid upload id')
+
+    def _read_meta(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_json(self, path, data):
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _received(self, upload_id):
+        chunks_dir = os.path.join(self._partial_dir(upload_id), 'chunks')
+        try:
+            return sorted(int(name) for name in os.listdir(chunks_dir) if name.isdigit())
+        except OSError:
+            return []
+
+    def create(self, filename, size, chunk_size, chunk_hashes):
+        """Open (or resume) an upload; returns its id, state and the chunks still missing"""
+        size, chunk_size = int(size), int(chunk_size)
+        chunk_hashes = [str(h).lower() for h in chunk_hashes or []]
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise UploadError(f'chunk_size must be between 1 and {MAX_CHUNK_SIZE} bytes')
+        if not 0 < size <= MAX_UPLOAD_SIZE:
+            raise UploadError(f'size must be between 1 and {MAX_UPLOAD_SIZE} bytes')
+        if len(chunk_hashes) != -(-size // chunk_size) or not all(SHA256.match(h) for h in chunk_hashes):
+            raise UploadError('chunk_hashes must hold one sha256 hex digest per chunk')
+
+        self.prune()
+        upload_id = content_id(chunk_size, chunk_hashes)
+        if os.path.exists(self._file_path(upload_id)):
+            self._touch(upload_id)
+            return {'upload_id': upload_id, 'complete': True, 'missing': []}
+
+        os.makedirs(os.path.join(self._partial_dir(upload_id), 'chunks'), exist_ok=True)
+        meta_path = os.path.join(self._partial_dir(upload_id), 'meta.json')
+        if not os.path.exists(meta_path):
+            self._write_json(meta_path, {'filename': os.path.basename(filename or 'upload'), 'size': size,
+                                         'chunk_size': chunk_size, 'chunk_hashes': chunk_hashes,
+                                         'created_at': time.time()})
+        received = set(self._received(upload_id))
+        missing = [index for index in range(len(chunk_hashes)) if index not in received]
+        return {'upload_id': upload_id, 'complete': False, 'missing': missing}
+
+    def put_chunk(self, upload_id, index, stream):
+        """Store one chunk after checking its size and hash"""
+        self._check_id(upload_id)
+        if os.path.exists(self._file_path(upload_id)):
+            return {'upload_id': upload_id, 'index': index, 'stored': False, 'complete': True}
+        meta = self._read_meta(os.path.join(self._partial_dir(upload_id), 'meta.json'))
+        if meta is None:
+            raise UploadError('Unknown upload; open it first')
+        count = len(meta['chunk_hashes'])
+        if not 0 <= index < count:
+            raise UploadError(f'Chunk index out of range (0..{count - 1})')
+        expected_size = meta['chunk_size'] if index < count - 1 else meta['size'] - meta['chunk_size'] * (count - 1)
+
+        chunk_path = os.path.join(self._partial_dir(upload_id), 'chunks', f'{index:06d}')
+        tmp_path = f'{chunk_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        digest = hashlib.sha256()
+        size = 0
+        with open(tmp_path, 'wb') as f:
+            for block in iter(lambda: stream.read(1024 * 1024), b''):
+                size += len(block)
+                if size > expected_size:
+                    break
+                digest.update(block)
+                f.write(block)
+        if size != expected_size or digest.hexdigest() != meta['chunk_hashes'][index]:
+            os.remove(tmp_path)
+            raise UploadError(f'Chunk {index} does not match its size or hash; send it again')
+        # Duplicate sends (retries, parallel resumes) simply replace the same bytes
+        os.replace(tmp_path, chunk_path)
+        return {'upload_id': upload_id, 'index': index, 'stored': True, 'complete': False}
+
+    def status(self, upload_id):
+        """Progress of an upload, or None if it is unknown"""
+        self._check_id(upload_id)
+        meta = self._read_meta(self._meta_path(upload_id))
+        if meta and os.path.exists(self._file_path(upload_id)):
+            return {'upload_id': upload_id, 'complete': True, 'filename': meta['filename'], 'size': meta['size'],
+                    'missing': []}
+        meta = self._read_meta(os.path.join(self._partial_dir(upload_id), 'meta.json'))
+        if meta is None:
+            return None
+        received = set(self._received(upload_id))
+        return {'upload_id': upload_id, 'complete': False, 'filename': meta['filename'], 'size': meta['size'],
+                'received': len(received),
+                'missing': [index for index in range(len(meta['chunk_hashes'])) if index not in received]}
+
+    def complete(self, upload_id):
+        """Assemble a fully received upload into its file (once, whichever worker asks first)"""
+        self._check_id(upload_id)
+        with get_lock_manager().lock(f'upload:{upload_id}'):
+            if os.path.exists(self._file_path(upload_id)):
+                return self.status(upload_id)
+            state = self.status(upload_id)
+            if state is None:
+                raise UploadError('Unknown upload')
+            if state['missing']:
+                raise UploadError(f"{len(state['missing'])} chunk(s) still missing")
+
+            partial_dir = self._partial_dir(upload_id)
+            meta = self._read_meta(os.path.join(partial_dir, 'meta.json'))
+            os.makedirs(os.path.dirname(self._file_path(upload_id)), exist_ok=True)
+            tmp_path = f'{self._file_path(upload_id)}.tmp'
+            with open(tmp_path, 'wb') as out:
+                for index in range(len(meta['chunk_hashes'])):
+                    with open(os.path.join(partial_dir, 'chunks', f'{index:06d}'), 'rb') as chunk:
+                        shutil.copyfileobj(chunk, out, 1024 * 1024)
+            self._write_json(self._meta_path(upload_id), {'filename': meta['filename'], 'size': meta['size'],
+                                                          'completed_at': time.time(), 'used_at': time.time()})
+            os.replace(tmp_path, self._file_path(upload_id))
+            shutil.rmtree(partial_dir, ignore_errors=True)
+        print(f"✅ Upload {upload_id[:12]} assembled ({meta['size']} bytes)")
+        return self.status(upload_id)
+
+    def get_file(self, upload_id):
+        """The completed upload as a StoredFile for the deploy pipeline, or None"""
+        self._check_id(upload_id)
+        meta = self._read_meta(self._meta_path(upload_id))
+        if not meta or not os.path.exists(self._file_path(upload_id)):
+            return None
+        self._touch(upload_id)
+        return StoredFile(self._file_path(upload_id), meta['filename'])
+
+    def _touch(self, upload_id):
+        meta = self._read_meta(self._meta_path(upload_id))
+        if meta:
+            meta['used_at'] = time.time()
+            self._write_json(self._meta_path(upload_id), meta)
+
+    def prune(self):
+        """Drop abandoned partial uploads and completed files nobody used for a while"""
+        now = time.time()
+        partial_root = os.path.join(self.root, 'partial')
+        for upload_id in os.listdir(partial_root) if os.path.isdir(partial_root) else []:
+            meta = self._read_meta(os.path.join(partial_root, upload_id, 'meta.json'))
+            try:
+                created_at = meta['created_at'] if meta else os.path.getmtime(os.path.join(partial_root, upload_id))
+            except OSError:
+                continue
+            if now - created_at > PARTIAL_TTL:
+                shutil.rmtree(os.path.join(partial_root, upload_id), ignore_errors=True)
+
+        files_root = os.path.join(self.root, 'files')
+        for name in os.listdir(files_root) if os.path.isdir(files_root) else []:
+            if not name.endswith('.json'):
+                continue
+            meta = self._read_meta(os.path.join(files_root, name))
+            if meta and now - meta.get('used_at', 0) > COMPLETE_TTL:
+                upload_id = name[:-5]
+                for path in (self._file_path(upload_id), self._meta_path(upload_id)):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_upload_store():
+    """Return the process-wide upload store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = UploadStore()
+    return _store
@@ -0,0 +1,164 @@
+import http.client
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from command_runner import run_command
+
+MANIFEST_NAME = 'auto-hosting.json'
+# Routes that should never be hit blindly by the warm-up
+EXCLUDED_PREFIXES = ('_ignition', '_debugbar', 'telescope', 'horizon', 'sanctum', 'livewire', 'logout')
+MAX_DISCOVERED_ROUTES = 20
+
+WARMUP_REQUESTS = int(os.environ.get('AUTO_HOSTING_WARMUP_REQUESTS', 5))
+WARMUP_CONCURRENCY = int(os.environ.get('AUTO_HOSTING_WARMUP_CONCURRENCY', 4))
+# Allowed p95 slowdown relative to the previous release (0.5 = 50%), ignored below the noise floor
+REGRESSION_THRESHOLD = float(os.environ.get('AUTO_HOSTING_WARMUP_THRESHOLD', 0.5))
+REGRESSION_MIN_MS = float(os.environ.get('AUTO_HOSTING_WARMUP_MIN_MS', 20))
+# flag: report regressions in the result, fail: fail the deployment
+REGRESSION_MODE = os.environ.get('AUTO_HOSTING_WARMUP_REGRESSION', 'flag')
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100.0 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+def summarize(latencies_ms):
+    """p50/p95/p99 summary of latencies in milliseconds"""
+    return {
+        'count': len(latencies_ms),
+        'p50': round(percentile(latencies_ms, 50), 2) if latencies_ms else None,
+        'p95': round(percentile(latencies_ms, 95), 2) if latencies_ms else None,
+        'p99': round(percentile(latencies_ms, 99), 2) if latencies_ms else None,
+    }
+
+
+class WarmupRunner:
+    """Warms a freshly deployed site and measures time to first byte per route
+
+    Routes come from the `warmup.routes` list in auto-hosting.json at the
+    project root, or are discovered from `php artisan route:list` (GET routes
+    without parameters). The first request to each route pays the cold
+    OPcache/framework cost and is reported separately.
+    """
+
+    def __init__(self, requests_per_route=WARMUP_REQUESTS, concurrency=WARMUP_CONCURRENCY):
+        self.requests_per_route = requests_per_route
+        self.concurrency = concurrency
+
+    def run(self, project_path, port, domain=None, previous=None):
+        """Warm the site on the local port and compare against the previous release's results"""
+        manifest = self._load_manifest(project_path)
+        routes = manifest.get('routes') or self._discover_routes(project_path)
+        requests_per_route = int(manifest.get('requests', self.requests_per_route))
+        concurrency = int(manifest.get('concurrency', self.concurrency))
+
+        print(f"🔥 Warming up {len(routes)} routes on port {port}...")
+        samples = {route: [] for route in routes}
+        statuses = {route: {} for route in routes}
+        cold = {}
+        lock = threading.Lock()
+
+        def hit(route, first):
+            ttfb, status = self._request(port, domain, route)
+            with lock:
+                key = str(status)
+                statuses[route][key] = statuses[route].get(key, 0) + 1
+                if first:
+                    cold[route] = ttfb
+                elif ttfb is not None:
+                    samples[route].append(ttfb)
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            # Cold request to every route first, then the warm samples
+            list(pool.map(lambda route: hit(route, True), routes))
+            warm = [route for route in routes for _ in range(max(0, requests_per_route - 1))]
+            list(pool.map(lambda route: hit(route, False), warm))
+
+        report = {'routes': {}, 'regressions': []}
+        for route in routes:
+            errors = sum(count for status, count in statuses[route].items() if not status.startswith(('2', '3')))
+            report['routes'][route] = {
+                **summarize(samples[route]),
+                'cold_ms': round(cold[route], 2) if cold.get(route) is not None else None,
+                'statuses': statuses[route],
+                'errors': errors,
+            }
+        report['overall'] = summarize([value for route in routes for value in samples[route]])
+        report['regressions'] = self._compare(report, previous)
+        report['regressed'] = bool(report['regressions'])
+
+        print(f"✅ Warm-up done: p50={report['overall']['p50']}ms p95={report['overall']['p95']}ms "
+              f"p99={report['overall']['p99']}ms")
+        for regression in report['regressions']:
+            print(f"⚠️ Latency regression on {regression['route']}: p95 {regression['previous_p95']}ms → "
+                  f"{regression['p95']}ms")
+        return report
+
+    def _load_manifest(self, project_path):
+        path = os.path.join(project_path, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path) as f:
+                return json.load(f).get('warmup', {})
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read {MANIFEST_NAME}: {e}")
+            return {}
+
+    def _discover_routes(self, project_path):
+        """GET routes without parameters from `php artisan route:list`"""
+        try:
+            result = run_command(['php', 'artisan', 'route:list', '--json', '--method=GET'], cwd=project_path,
+                                 echo=False, timeout=60)
+            entries = [] if result.timed_out else json.loads(result.stdout or '[]')
+        except (OSError, ValueError):
+            entries = []
+
+        routes = []
+        for entry in entries:
+            uri = entry.get('uri', '').strip('/')
+            if '{' in uri or uri.startswith(EXCLUDED_PREFIXES):
+                continue
+            route = '/' + uri
+            if route not in routes:
+                routes.append(route)
+            if len(routes) >= MAX_DISCOVERED_ROUTES:
+                break
+        return routes or ['/']
+
+    def _request(self, port, domain, route):
+        """Return (time to first byte in ms, status) for one GET request"""
+        connection = http.client.HTTPConnection('127.0.0.1', int(port), timeout=30)
+        try:
+            started = time.perf_counter()
+            connection.request('GET', route, headers={'Host': domain or 'localhost', 'User-Agent': 'auto-hosting-warmup'})
+            response = connection.getresponse()
+            ttfb = (time.perf_counter() - started) * 1000
+            response.read()
+            return ttfb, response.status
+        except (OSError, http.client.HTTPException) as e:
+            return None, type(e).__name__
+        finally:
+            connection.close()
+
+    def _compare(self, report, previous):
+        """Routes whose p95 regressed beyond the threshold relative to the previous release"""
+        if not previous:
+            return []
+        regressions = []
+        for route, stats in report['routes'].items():
+            before = previous.get('routes', {}).get(route)
+            if not before or before.get('p95') is None or stats['p95'] is None:
+                continue
+            if (stats['p95'] > before['p95'] * (1 + REGRESSION_THRESHOLD)
+                    and stats['p95'] - before['p95'] > REGRESSION_MIN_MS):
+                regressions.append({'route': route, 'p95': stats['p95'], 'previous_p95': before['p95']})
+        return regressions